@@ -0,0 +1,159 @@
+"""
+fingerprinted, precompressed copies of the static files
+
+`build_assets` copies every asset of ``static-files`` to ``settings.assets_dir``
+under a name with a hash of its content, e.g. ``site.3f2a9c0d1b7e.css``, next
+to ``.gz`` and, when the optional ``brotli`` package is installed, ``.br``
+siblings. A changed file gets a new name, so the copies can be cached by
+browsers forever. Templates link to them through the ``asset_url`` helper.
+
+    python -m assets
+"""
+from __future__ import annotations
+
+import gzip
+import hashlib
+import json
+import os
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Mapping
+
+from settings import settings
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional, litestar[brotli]
+    brotli = None
+
+ASSET_SUFFIXES = {'.css', '.js', '.ico', '.svg', '.png', '.jpg', '.webp', '.woff', '.woff2', '.map'}
+COMPRESSIBLE_SUFFIXES = {'.css', '.js', '.ico', '.svg', '.map'}
+# a compressed sibling must save at least this share of the bytes to be kept
+MIN_SAVING = 0.1
+MANIFEST_NAME = 'manifest.json'
+# Accept-Encoding tokens in order of preference at equal quality
+ENCODINGS = {'br': '.br', 'gzip': '.gz'}
+
+
+@dataclass
+class AssetManifest:
+    """Hashed name of every asset, and the encodings written for each hashed name."""
+
+    urls: dict[str, str] = field(default_factory=dict)
+    """Path relative to the source directory -> hashed path relative to the build directory."""
+    encodings: dict[str, list[str]] = field(default_factory=dict)
+    """Hashed path -> ``Content-Encoding`` values of its compressed siblings, best first."""
+
+    @classmethod
+    def load(cls, build_dir: Path) -> AssetManifest:
+        """Read the manifest `build_assets` wrote, an empty one when there is none."""
+        try:
+            data = json.loads((build_dir / MANIFEST_NAME).read_text())
+        except FileNotFoundError:
+            return cls()
+        return cls(urls=data['urls'], encodings=data['encodings'])
+
+
+_manifest: AssetManifest | None = None
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    """Write ``data`` under a temporary name first, so workers building at once never see half a file."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary = path.with_name(f'.{path.name}.{os.getpid()}.tmp')
+    temporary.write_bytes(data)
+    os.replace(temporary, path)
+
+
+def build_assets(source_dir: Path | str = 'static-files', build_dir: Path | str = settings.assets_dir) -> AssetManifest:
+    """Write the hashed and compressed copies of the assets of ``source_dir`` that are missing.
+
+    Copies that already exist are kept, so running it again, e.g. on every
+    startup, only hashes the sources.
+    """
+    source_dir, build_dir = Path(source_dir), Path(build_dir)
+    manifest = AssetManifest()
+    for source in sorted(source_dir.rglob('*')):
+        if not source.is_file() or source.suffix not in ASSET_SUFFIXES:
+            continue
+        content = source.read_bytes()
+        digest = hashlib.blake2b(content, digest_size=6).hexdigest()
+        relative = source.relative_to(source_dir)
+        hashed = relative.with_name(f'{relative.stem}.{digest}{relative.suffix}')
+        target = build_dir / hashed
+        if not target.exists():
+            _write_atomic(target, content)
+        encodings = []
+        if source.suffix in COMPRESSIBLE_SUFFIXES:
+            for encoding, suffix in ENCODINGS.items():
+                if encoding == 'br' and brotli is None:
+                    continue
+                compressed_path = target.with_name(target.name + suffix)
+                if not compressed_path.exists():
+                    compressed = brotli.compress(content) if encoding == 'br' else gzip.compress(content, 9, mtime=0)
+                    if len(compressed) > len(content) * (1 - MIN_SAVING):
+                        continue
+                    _write_atomic(compressed_path, compressed)
+                encodings.append(encoding)
+        manifest.urls[relative.as_posix()] = hashed.as_posix()
+        manifest.encodings[hashed.as_posix()] = encodings
+    _write_atomic(build_dir / MANIFEST_NAME,
+                  json.dumps({'urls': manifest.urls, 'encodings': manifest.encodings}, indent=1).encode())
+    global _manifest
+    _manifest = manifest
+    return manifest
+
+
+def current_manifest() -> AssetManifest:
+    """The manifest of the last `build_assets` in this process, else the one on disk."""
+    global _manifest
+    if _manifest is None:
+        _manifest = AssetManifest.load(Path(settings.assets_dir))
+    return _manifest
+
+
+def asset_url(_: Mapping[str, Any], name: str) -> str:
+    """Template helper: URL of the hashed copy of the static file ``name``, e.g. ``${asset_url('site.css')}``.
+
+    Files that were not built are linked unhashed from ``/static-files``.
+    """
+    hashed = current_manifest().urls.get(name)
+    return f'/assets/{hashed}' if hashed is not None else f'/static-files/{name}'
+
+
+def register_template_helpers(engine: Any) -> None:
+    """``TemplateConfig.engine_callback`` that makes `asset_url` available to every template."""
+    engine.register_template_callable('asset_url', asset_url)
+
+
+def pick_encoding(accept_encoding: str, available: list[str]) -> str | None:
+    """The ``Content-Encoding`` of ``available`` the client accepts with the highest quality, ``None`` for identity.
+
+    ``br`` is preferred over ``gzip`` when the client rates both the same.
+    """
+    qualities: dict[str, float] = {}
+    for item in accept_encoding.split(','):
+        token, _, params = item.strip().partition(';')
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if token:
+            qualities[token.strip().lower()] = quality
+    best, best_quality = None, 0.0
+    for encoding in available:
+        quality = qualities.get(encoding, qualities.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+if __name__ == '__main__':
+    started = time.perf_counter()
+    built = build_assets()
+    print(f'{len(built.urls)} assets in {settings.assets_dir} after {time.perf_counter() - started:.2f}s')
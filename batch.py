@@ -0,0 +1,93 @@
+"""
+helpers shared by the batch create/update handlers
+"""
+from __future__ import annotations
+
+from collections import Counter
+from typing import Any, Iterable, TypeVar
+
+from litestar.exceptions import ValidationException
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import select
+
+M = TypeVar('M', bound=BaseModel)
+
+# stays below the bound parameter limit of every supported driver
+ID_CHUNK_SIZE = 500
+
+
+def in_chunks(values: list[Any], size: int = ID_CHUNK_SIZE) -> Iterable[list[Any]]:
+    """Split ``values`` into lists small enough for one IN (...) clause."""
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def parse_ids(value: str) -> list[int]:
+    """The ids of a comma separated path parameter, raises `ValidationException` before anything is written."""
+    try:
+        return [int(item_id) for item_id in value.split(',')]
+    except ValueError:
+        raise ValidationException(detail=f'Ids must be comma separated integers: {value!r}')
+
+
+def validate_items(model: type[M], data: list[Any]) -> tuple[dict[int, M], list[dict[str, Any]]]:
+    """Validate every item of a batch body.
+
+    Returns the valid models by their index in ``data`` and one error per failed field.
+    """
+    items: dict[int, M] = {}
+    errors: list[dict[str, Any]] = []
+    for index, raw in enumerate(data):
+        try:
+            items[index] = model.model_validate(raw)
+        except ValidationError as ex:
+            errors.extend({'index': index, 'key': '.'.join(str(part) for part in error['loc']) or None,
+                           'message': error['msg']} for error in ex.errors())
+    return items, errors
+
+
+def duplicate_id_errors(ids: dict[int, int]) -> list[dict[str, Any]]:
+    """One error for every repeated id in an update batch, ``ids`` is keyed by item index."""
+    repeated = {item_id for item_id, count in Counter(ids.values()).items() if count > 1}
+    return [{'index': index, 'key': 'id', 'message': f'Duplicate id {item_id}'}
+            for index, item_id in ids.items() if item_id in repeated]
+
+
+async def missing_reference_errors(session: Any, column: Any, values: dict[int, int | None],
+                                   key: str) -> list[dict[str, Any]]:
+    """Check that the values referenced by each item exist in ``column``.
+
+    Parameters
+    ----------
+    session : AsyncSession
+        session used for the lookup.
+    column : InstrumentedAttribute
+        primary key column the values must exist in.
+    values : dict[int, int | None]
+        referenced value by item index, ``None`` values are not checked.
+    key : str
+        field name reported in the errors.
+    """
+    wanted = sorted({value for value in values.values() if value is not None})
+    found: set[int] = set()
+    for chunk in in_chunks(wanted):
+        found.update((await session.execute(select(column).where(column.in_(chunk)))).scalars())
+    return [{'index': index, 'key': key, 'message': f'{key} {value} does not exist'}
+            for index, value in values.items() if value is not None and value not in found]
+
+
+def raise_for_errors(errors: list[dict[str, Any]]) -> None:
+    """Reject the whole batch when any item failed validation."""
+    if errors:
+        errors.sort(key=lambda error: error['index'])
+        raise ValidationException(detail=f'Batch rejected, {len({e["index"] for e in errors})} invalid item(s)',
+                                  extra=errors)
+
+
+async def list_by_ids(repo: Any, ids: list[int]) -> list[Any]:
+    """Load rows by primary key in chunks, returned in the order of ``ids``."""
+    model = repo.model_type
+    rows: dict[int, Any] = {}
+    for chunk in in_chunks(ids):
+        rows.update((row.id, row) for row in await repo.list(model.id.in_(chunk)))
+    return [rows[item_id] for item_id in ids]
@@ -0,0 +1,52 @@
+"""
+compare rows per second of the single row and batch create/update endpoints
+
+    python -m benchmarks.batch_writes --rows 2000 --batch-size 500
+"""
+import argparse
+import asyncio
+import tempfile
+import time
+from pathlib import Path
+
+from litestar.testing import AsyncTestClient
+
+from benchmarks.common import build_app
+
+
+async def timed_rows(label: str, rows: int, requests) -> None:
+    started = time.perf_counter()
+    for method, url, body in requests:
+        response = await method(url, json=body)
+        assert response.status_code < 300, response.text
+    elapsed = time.perf_counter() - started
+    print(f'{label:<32} {rows:>8} rows {elapsed:>8.2f}s {rows / elapsed:>10.0f} rows/s')
+
+
+async def main(rows: int, batch_size: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        app = build_app(f'sqlite+aiosqlite:///{Path(tmp) / "bench.sqlite"}')
+        async with AsyncTestClient(app) as client:
+            await client.post('/exercise', json={'name': 'parent'})
+            steps = [{'exercise_id': 1, 'name': f'step {i}', 'sort_order': i} for i in range(rows)]
+            batches = [steps[start:start + batch_size] for start in range(0, rows, batch_size)]
+
+            await timed_rows('POST /exercise-step', rows,
+                             [(client.post, '/exercise-step', step) for step in steps])
+            await timed_rows(f'POST /exercise-step/batch x{batch_size}', rows,
+                             [(client.post, '/exercise-step/batch', batch) for batch in batches])
+            await timed_rows('PATCH /exercise-step/{id}', rows,
+                             [(client.patch, f'/exercise-step/{i + 1}', {**step, 'name': f'renamed {i}'})
+                              for i, step in enumerate(steps)])
+            await timed_rows(f'PATCH /exercise-step/batch x{batch_size}', rows,
+                             [(client.patch, '/exercise-step/batch',
+                               [{'id': start + i + 1, 'name': f'batch {start + i}'} for i in range(len(batch))])
+                              for start, batch in zip(range(0, rows, batch_size), batches)])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=2000)
+    parser.add_argument('--batch-size', type=int, default=500)
+    args = parser.parse_args()
+    asyncio.run(main(args.rows, args.batch_size))
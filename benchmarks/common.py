@@ -0,0 +1,137 @@
+"""
+shared setup for the benchmark scripts
+"""
+import asyncio
+import itertools
+import logging
+import os
+import socket
+import subprocess
+import sys
+import time
+from contextlib import asynccontextmanager
+from dataclasses import replace
+from typing import Any, AsyncIterator
+
+import httpx
+from litestar import Litestar
+from litestar.contrib.sqlalchemy.plugins import SQLAlchemyInitPlugin
+from litestar.di import Provide
+from sqlalchemy import func, insert, select
+
+from controllers.exercise_controller import ExerciseController
+from controllers.exercise_step_controller import ExerciseStepController
+from controllers.my_controller import MyAPIController
+from controllers.page_controller import PageController
+from database import create_read_engine, create_sqlalchemy_config, read_engine_provider, read_session_provider
+from logger import logging_config
+from main import provide_keyset_pagination, provide_limit_offset_pagination, provide_total_mode
+from metrics import instrument_engine, prometheus_config
+from models.exercise import Exercise
+from models.exercise_step import ExerciseStep
+from rendering import template_config
+from schema import init_schema
+from settings import settings
+
+# the test client logs every request, which would dominate the timings
+logging.getLogger('httpx').setLevel(logging.WARNING)
+
+SEED_CHUNK = 10_000
+
+
+def build_app(connection_string: str, metrics: bool = True, **overrides: Any) -> Litestar:
+    """The API handlers and middleware from `main`, bound to a separate database.
+
+    ``overrides`` replace fields of `settings.Settings` for the engine profile.
+    """
+    app_settings = replace(settings, database_url=connection_string, **overrides)
+    config = create_sqlalchemy_config(app_settings)
+    read_engine = create_read_engine(app_settings, config.engine_instance)
+    if metrics:
+        for engine in {config.engine_instance, read_engine}:
+            instrument_engine(engine)
+
+    async def init_db() -> None:
+        await init_schema(config.get_engine())
+
+    return Litestar(
+        route_handlers=[MyAPIController, ExerciseController, ExerciseStepController, PageController],
+        on_startup=[init_db],
+        plugins=[SQLAlchemyInitPlugin(config=config)],
+        middleware=[prometheus_config.middleware] if metrics else [],
+        logging_config=logging_config,
+        template_config=template_config,
+        dependencies={
+            'db_read_engine': Provide(read_engine_provider(read_engine), sync_to_thread=False),
+            'db_read_session': Provide(read_session_provider(read_engine)),
+            'limit_offset': Provide(provide_limit_offset_pagination, sync_to_thread=False),
+            'keyset': Provide(provide_keyset_pagination, sync_to_thread=False),
+            'with_total': Provide(provide_total_mode, sync_to_thread=False),
+        },
+    )
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    """Nearest-rank percentile of ``samples``."""
+    ordered = sorted(samples)
+    rank = max(1, min(len(ordered), round(pct / 100 * len(ordered) + 0.5)))
+    return ordered[rank - 1]
+
+
+async def seed_catalog(database_url: str, exercises: int, steps_per_exercise: int) -> int:
+    """Create the schema and bulk insert the rows, returns the number of steps."""
+    engine = create_sqlalchemy_config(replace(settings, database_url=database_url)).engine_instance
+    await init_schema(engine)
+    async with engine.begin() as conn:
+        if not (await conn.execute(select(func.count()).select_from(Exercise))).scalar():
+            for start in range(0, exercises, SEED_CHUNK):
+                await conn.execute(insert(Exercise), [
+                    {'name': f'exercise {i:07d}', 'tool_tip': f'tip {i}', 'description': f'description of {i}'}
+                    for i in range(start, min(start + SEED_CHUNK, exercises))
+                ])
+            steps = ({'exercise_id': exercise_id, 'name': f'step {n}', 'sort_order': n}
+                     for exercise_id in range(1, exercises + 1) for n in range(steps_per_exercise))
+            while chunk := list(itertools.islice(steps, SEED_CHUNK)):
+                await conn.execute(insert(ExerciseStep), chunk)
+        total_steps = (await conn.execute(select(func.count()).select_from(ExerciseStep))).scalar()
+    await engine.dispose()
+    return total_steps
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@asynccontextmanager
+async def uvicorn_server(database_url: str, timeout: float = 30,
+                         **env: str) -> AsyncIterator[tuple[str, subprocess.Popen]]:
+    """Run ``main:app`` under uvicorn on ``database_url``, yields its base url and process once it answers.
+
+    ``env`` adds environment variables, e.g. ``GYMMAN_*`` settings, for the server.
+    """
+    port = free_port()
+    env = {**os.environ, **env, 'GYMMAN_DATABASE_URL': database_url}
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'main:app', '--port', str(port), '--log-level', 'warning'],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    url = f'http://127.0.0.1:{port}'
+    try:
+        deadline = time.monotonic() + timeout
+        async with httpx.AsyncClient() as client:
+            while True:
+                if process.poll() is not None:
+                    raise RuntimeError('uvicorn exited during startup')
+                try:
+                    await client.get(f'{url}/api/v1/cache-stats')
+                    break
+                except httpx.TransportError:
+                    if time.monotonic() > deadline:
+                        raise RuntimeError(f'uvicorn did not answer on {url}')
+                    await asyncio.sleep(0.2)
+        yield url, process
+    finally:
+        process.terminate()
+        process.wait()
@@ -0,0 +1,100 @@
+"""
+compare the streaming export with walking the list pages, and watch the server's memory while it runs
+
+    python -m benchmarks.export --exercises 1000000 --steps-per-exercise 0 --skip-pages
+
+Walking the pages costs O(rows^2) with OFFSET, leave it out on large tables.
+"""
+import argparse
+import asyncio
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+from benchmarks.common import seed_catalog, uvicorn_server
+
+
+def rss_mib(pid: int) -> float:
+    """Resident memory of ``pid`` in MiB, read from /proc."""
+    for line in Path(f'/proc/{pid}/status').read_text().splitlines():
+        if line.startswith('VmRSS:'):
+            return int(line.split()[1]) / 1024
+    return 0.0
+
+
+async def walk_pages(client: httpx.AsyncClient, path: str, page_size: int, params: dict) -> tuple[int, int]:
+    """Rows and bytes of every page of a list handler, the way the nightly job pulls the catalog."""
+    rows = size = 0
+    page = 1
+    while True:
+        response = await client.get(path, params={**params, 'pageSize': page_size, 'currentPage': page})
+        response.raise_for_status()
+        size += len(response.content)
+        items = response.json()['items']
+        rows += len(items)
+        if len(items) < page_size:
+            return rows, size
+        page += 1
+
+
+async def stream_export(client: httpx.AsyncClient, path: str, params: dict) -> tuple[int, int]:
+    """Rows (lines) and bytes of an export, consumed as it arrives."""
+    lines = size = 0
+    async with client.stream('GET', path, params=params) as response:
+        response.raise_for_status()
+        async for chunk in response.aiter_bytes():
+            size += len(chunk)
+            lines += chunk.count(b'\n')
+    return lines, size
+
+
+async def measure(pid: int, run) -> tuple[int, int, float, float]:
+    """Run ``run`` while sampling the server's memory, returns rows, bytes, seconds and peak RSS growth."""
+    baseline = peak = rss_mib(pid)
+    task = asyncio.ensure_future(run)
+    started = time.perf_counter()
+    while not task.done():
+        peak = max(peak, rss_mib(pid))
+        await asyncio.sleep(0.05)
+    rows, size = await task
+    return rows, size, time.perf_counter() - started, peak - baseline
+
+
+async def main(exercises: int, steps_per_exercise: int, page_size: int, skip_pages: bool) -> None:
+    scratch = tempfile.mkdtemp(prefix='gymman-bench-')
+    try:
+        database_url = f'sqlite+aiosqlite:///{Path(scratch) / "bench.sqlite"}'
+        steps = await seed_catalog(database_url, exercises, steps_per_exercise)
+        print(f'seeded {exercises} exercises and {steps} steps')
+        runs = [
+            ('export exercise ndjson', lambda c: stream_export(c, '/exercise/export', {})),
+            ('export exercise csv', lambda c: stream_export(c, '/exercise/export', {'format': 'csv'})),
+            ('export exercise+steps ndjson',
+             lambda c: stream_export(c, '/exercise/export', {'include': 'steps'})),
+            ('export exercise-step ndjson', lambda c: stream_export(c, '/exercise-step/export', {})),
+        ]
+        if not skip_pages:
+            runs.append((f'list pages of {page_size}', lambda c: walk_pages(c, '/exercise', page_size, {})))
+        # memory mapped database pages count towards RSS, turn them off so only the server's own memory shows
+        async with uvicorn_server(database_url, GYMMAN_SQLITE_MMAP_SIZE='0') as (url, process):
+            async with httpx.AsyncClient(base_url=url, timeout=None) as client:
+                print(f'{"run":<32} {"rows":>9} {"MiB":>8} {"s":>7} {"rows/s":>9} {"server RSS +MiB":>16}')
+                for name, run in runs:
+                    rows, size, seconds, rss_growth = await measure(process.pid, run(client))
+                    print(f'{name:<32} {rows:>9} {size / 2**20:>8.1f} {seconds:>7.2f} {rows / seconds:>9.0f} '
+                          f'{rss_growth:>16.1f}')
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--exercises', type=int, default=100_000)
+    parser.add_argument('--steps-per-exercise', type=int, default=3)
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--skip-pages', action='store_true', help='only run the exports')
+    args = parser.parse_args()
+    asyncio.run(main(args.exercises, args.steps_per_exercise, args.page_size, args.skip_pages))
@@ -0,0 +1,77 @@
+"""
+compare OFFSET and keyset page latency at increasing page depths
+
+    python -m benchmarks.keyset_pagination --rows 200000 --page-size 10
+"""
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from litestar.repository.filters import LimitOffset, OrderBy
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from controllers.exercise_controller import ExerciseRepository
+from models.base_model import Base
+from models.exercise import Exercise
+from models.exercise_step import ExerciseStep  # noqa: F401  registers the mapper used by Exercise.steps
+from pagination import encode_cursor, list_keyset
+
+
+async def seed(session, rows: int) -> None:
+    """Insert ``rows`` exercises with a few duplicate names so the id tie-breaker matters."""
+    chunk = 10_000
+    for start in range(0, rows, chunk):
+        await session.execute(insert(Exercise), [
+            {'name': f'exercise {i // 3:08d}'} for i in range(start, min(start + chunk, rows))
+        ])
+    await session.commit()
+
+
+async def timed(coro_factory, repeat: int) -> float:
+    """Median wall time of ``repeat`` runs in milliseconds."""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await coro_factory()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+async def main(rows: int, page_size: int, repeat: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_async_engine(f'sqlite+aiosqlite:///{Path(tmp) / "bench.sqlite"}')
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        session_maker = async_sessionmaker(engine, expire_on_commit=False)
+        async with session_maker() as session:
+            await seed(session, rows)
+            repo = ExerciseRepository(session=session)
+            print(f'{"page":>10} {"offset ms":>10} {"keyset ms":>10}')
+            page = 1
+            while (page - 1) * page_size < rows:
+                offset = (page - 1) * page_size
+                cursor = None
+                if offset:
+                    prev_row = (await session.execute(
+                        select(Exercise.name, Exercise.id).order_by(Exercise.name, Exercise.id).offset(offset - 1).limit(1)
+                    )).one()
+                    cursor = encode_cursor(prev_row.name, prev_row.id, 'next')
+                offset_ms = await timed(lambda: repo.list_and_count(LimitOffset(page_size, offset),
+                                                                    OrderBy(field_name=Exercise.name)), repeat)
+                keyset_ms = await timed(lambda: list_keyset(repo, cursor, page_size), repeat)
+                print(f'{page:>10} {offset_ms:>10.2f} {keyset_ms:>10.2f}')
+                page *= 10
+        await engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--page-size', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(main(args.rows, args.page_size, args.repeat))
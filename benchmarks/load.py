@@ -0,0 +1,288 @@
+"""
+load test every API handler and write the results to a comparable JSON file
+
+Seeds a scratch database, then drives each scenario with concurrent clients,
+either in-process through the ASGI interface or against a local uvicorn
+server started on that database.
+
+    python -m benchmarks.load --exercises 100000 --steps-per-exercise 5 --output bench.json
+    python -m benchmarks.load --target uvicorn --output after.json --compare bench.json
+"""
+import os
+import tempfile
+
+# uploads go to a scratch directory, settings are read once on import
+_UPLOAD_DIR = tempfile.mkdtemp(prefix='gymman-bench-uploads-')
+os.environ.setdefault('GYMMAN_UPLOAD_DIR', _UPLOAD_DIR)
+
+import argparse  # noqa: E402
+import asyncio  # noqa: E402
+import itertools  # noqa: E402
+import json  # noqa: E402
+import platform  # noqa: E402
+import random  # noqa: E402
+import shutil  # noqa: E402
+import subprocess  # noqa: E402
+import sys  # noqa: E402
+import time  # noqa: E402
+from dataclasses import dataclass  # noqa: E402
+from datetime import datetime, timezone  # noqa: E402
+from pathlib import Path  # noqa: E402
+from typing import Any, Callable  # noqa: E402
+
+import httpx  # noqa: E402
+from litestar.testing import AsyncTestClient  # noqa: E402
+
+from benchmarks.common import build_app, percentile, seed_catalog, uvicorn_server  # noqa: E402
+
+
+@dataclass
+class Scenario:
+    """One handler under load, ``request`` builds (method, url, keyword arguments) for call ``n``."""
+
+    name: str
+    request: Callable[[int], tuple[str, str, dict[str, Any]]]
+    read: bool = True
+
+
+def build_scenarios(exercises: int, steps: int, page_size: int, upload_size: int) -> list[Scenario]:
+    """Scenarios for every handler, ids are drawn from the seeded ranges."""
+    last_page = max(1, exercises // page_size)
+    # rows at the top of the id range are left to the update and delete scenarios
+    deletable_exercises = itertools.count(exercises, -1)
+    deletable_steps = itertools.count(steps, -1)
+    payload = os.urandom(upload_size)
+
+    def exercise_id() -> int:
+        return random.randint(1, exercises // 2)
+
+    def step_id() -> int:
+        return random.randint(1, steps // 2)
+
+    def reorder_request(n: int) -> tuple[str, str, dict[str, Any]]:
+        # seed_catalog gives exercise e the steps (e - 1) * per_exercise + 1 .. e * per_exercise
+        per_exercise = max(1, steps // exercises)
+        exercise = exercise_id()
+        step = (exercise - 1) * per_exercise + random.randint(1, per_exercise)
+        return 'POST', f'/exercise/{exercise}/steps/reorder', {'json': [{'id': step, 'position': 'first'}]}
+
+    def step_body(n: int) -> dict[str, Any]:
+        return {'exercise_id': exercise_id(), 'name': f'bench step {n}', 'sort_order': n % 50}
+
+    return [
+        Scenario('ExerciseController.list_exercise first page',
+                 lambda n: ('GET', '/exercise', {'params': {'pageSize': page_size}})),
+        Scenario('ExerciseController.list_exercise deep page',
+                 lambda n: ('GET', '/exercise', {'params': {'pageSize': page_size,
+                                                            'currentPage': random.randint(last_page // 2, last_page)}})),
+        Scenario('ExerciseController.list_exercise revalidate',
+                 lambda n: ('GET', '/exercise', {'params': {'pageSize': page_size},
+                                                 'headers': {'If-None-Match': '*'}})),
+        Scenario('ExerciseController.list_exercise withTotal=estimated',
+                 lambda n: ('GET', '/exercise', {'params': {'pageSize': page_size, 'withTotal': 'estimated'}})),
+        Scenario('ExerciseController.list_exercise withTotal=false',
+                 lambda n: ('GET', '/exercise', {'params': {'pageSize': page_size, 'withTotal': 'false'}})),
+        Scenario('ExerciseController.list_exercise cursor',
+                 lambda n: ('GET', '/exercise', {'params': {'pageSize': page_size, 'paging': 'cursor'}})),
+        Scenario('ExerciseController.list_exercise_changes',
+                 lambda n: ('GET', '/exercise/changes', {'params': {'pageSize': page_size}})),
+        Scenario('ExerciseController.list_exercise include=steps',
+                 lambda n: ('GET', '/exercise', {'params': {'pageSize': page_size, 'include': 'steps'}})),
+        Scenario('ExerciseController.search_exercise',
+                 lambda n: ('GET', '/exercise/search', {'params': {'q': f'exercise {random.randint(0, 99):02d}',
+                                                                   'pageSize': page_size}})),
+        Scenario('ExerciseController.get_exercise_details',
+                 lambda n: ('GET', f'/exercise/details/{exercise_id()}', {})),
+        # If-None-Match: * matches any current tag, i.e. the 304 a polling client gets while nothing changed
+        Scenario('ExerciseController.get_exercise_details revalidate',
+                 lambda n: ('GET', f'/exercise/details/{exercise_id()}', {'headers': {'If-None-Match': '*'}})),
+        Scenario('ExerciseController.create_exercise',
+                 lambda n: ('POST', '/exercise', {'json': {'name': f'bench {n}'}}), read=False),
+        Scenario('ExerciseController.create_exercise_batch',
+                 lambda n: ('POST', '/exercise/batch', {'json': [{'name': f'bench {n}.{i}'} for i in range(100)]}),
+                 read=False),
+        Scenario('ExerciseController.update_exercise_put',
+                 lambda n: ('PUT', f'/exercise/{exercise_id()}', {'json': {'name': f'put {n}'}}), read=False),
+        Scenario('ExerciseController.update_exercise_patch',
+                 lambda n: ('PATCH', f'/exercise/{exercise_id()}', {'json': {'name': f'patch {n}'}}), read=False),
+        Scenario('ExerciseController.update_exercise_batch',
+                 lambda n: ('PATCH', '/exercise/batch',
+                            {'json': [{'id': i, 'tool_tip': f'batch {n}'}
+                                      for i in random.sample(range(1, exercises // 2 + 1), min(100, exercises // 2))]}),
+                 read=False),
+        Scenario('ExerciseController.reorder_exercise_steps', reorder_request, read=False),
+        Scenario('ExerciseController.delete_exercise',
+                 lambda n: ('DELETE', f'/exercise/delete/{next(deletable_exercises)}', {}), read=False),
+        Scenario('ExerciseStepController.list_exercise_step first page',
+                 lambda n: ('GET', '/exercise-step', {'params': {'pageSize': page_size}})),
+        Scenario('ExerciseStepController.list_exercise_step withTotal=estimated',
+                 lambda n: ('GET', '/exercise-step', {'params': {'pageSize': page_size, 'withTotal': 'estimated'}})),
+        Scenario('ExerciseStepController.list_exercise_step cursor',
+                 lambda n: ('GET', '/exercise-step', {'params': {'pageSize': page_size, 'paging': 'cursor'}})),
+        Scenario('ExerciseStepController.list_exercise_step_changes',
+                 lambda n: ('GET', '/exercise-step/changes', {'params': {'pageSize': page_size}})),
+        Scenario('ExerciseStepController.search_exercise_step',
+                 lambda n: ('GET', '/exercise-step/search', {'params': {'q': f'step {random.randint(0, 9)}',
+                                                                        'pageSize': page_size}})),
+        Scenario('ExerciseStepController.get_exercise_step_details',
+                 lambda n: ('GET', f'/exercise-step/details/{step_id()}', {})),
+        Scenario('ExerciseStepController.create_exercise_step',
+                 lambda n: ('POST', '/exercise-step', {'json': step_body(n)}), read=False),
+        Scenario('ExerciseStepController.create_exercise_step_batch',
+                 lambda n: ('POST', '/exercise-step/batch', {'json': [step_body(n * 100 + i) for i in range(100)]}),
+                 read=False),
+        Scenario('ExerciseStepController.update_exercise_step_put',
+                 lambda n: ('PUT', f'/exercise-step/{step_id()}', {'json': step_body(n)}), read=False),
+        Scenario('ExerciseStepController.update_exercise_step_patch',
+                 lambda n: ('PATCH', f'/exercise-step/{step_id()}', {'json': step_body(n)}), read=False),
+        Scenario('ExerciseStepController.update_exercise_step_batch',
+                 lambda n: ('PATCH', '/exercise-step/batch',
+                            {'json': [{'id': i, 'sort_order': n % 50}
+                                      for i in random.sample(range(1, steps // 2 + 1), min(100, steps // 2))]}),
+                 read=False),
+        Scenario('ExerciseStepController.delete_exercise',
+                 lambda n: ('DELETE', f'/exercise-step/delete/{next(deletable_steps)}', {}), read=False),
+        Scenario('MyAPIController.handle_file_upload',
+                 lambda n: ('POST', '/api/v1/upload-file', {'files': [('file', (f'bench-{n % 8}.bin', payload))]}),
+                 read=False),
+        Scenario('MyAPIController.handle_file_upload_stream',
+                 lambda n: ('POST', '/api/v1/upload-file-stream',
+                            {'files': [('file', (f'bench-stream-{n % 8}.bin', payload))]}),
+                 read=False),
+    ]
+
+
+async def run_scenario(client: httpx.AsyncClient, scenario: Scenario, requests: int,
+                       concurrency: int) -> dict[str, Any]:
+    latencies: list[float] = []
+    errors = 0
+    calls = iter(range(requests))
+
+    async def worker() -> None:
+        nonlocal errors
+        for n in calls:
+            method, url, kwargs = scenario.request(n)
+            started = time.perf_counter()
+            response = await client.request(method, url, **kwargs)
+            latencies.append((time.perf_counter() - started) * 1000)
+            errors += response.status_code >= 400
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        'requests': requests,
+        'errors': errors,
+        'throughput_rps': round(requests / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+    }
+
+
+async def run_all(args: argparse.Namespace, database_url: str, steps: int) -> dict[str, Any]:
+    scenarios = [scenario for scenario in build_scenarios(args.exercises, steps, args.page_size, args.upload_size)
+                 if not args.only or any(part in scenario.name for part in args.only)]
+    results: dict[str, Any] = {}
+
+    async def drive(client: httpx.AsyncClient) -> None:
+        # reads first so the write scenarios do not change what the reads see
+        for scenario in sorted(scenarios, key=lambda s: not s.read):
+            await run_scenario(client, scenario, min(args.warmup, args.requests), args.concurrency)
+            row = results[scenario.name] = await run_scenario(client, scenario, args.requests, args.concurrency)
+            row['read'] = scenario.read
+            print(f'{scenario.name:<56} {row["throughput_rps"]:>9.1f} req/s  p50 {row["p50_ms"]:>8.2f}ms  '
+                  f'p95 {row["p95_ms"]:>8.2f}ms  p99 {row["p99_ms"]:>8.2f}ms  errors {row["errors"]}')
+
+    if args.target == 'inprocess':
+        async with AsyncTestClient(build_app(database_url), timeout=60) as client:
+            await drive(client)
+    else:
+        async with uvicorn_server(database_url) as (url, _):
+            limits = httpx.Limits(max_connections=args.concurrency)
+            async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+                await drive(client)
+    return results
+
+
+def _git_revision() -> str | None:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline: dict[str, Any], current: dict[str, Any], tolerance: float) -> int:
+    """Print p95 and throughput changes, returns how many list/detail scenarios regressed beyond ``tolerance``.
+
+    Write scenarios are reported too, but their timings depend on how much the
+    earlier scenarios grew the tables, so only the reads decide the exit code.
+    """
+    regressions = 0
+    print(f'\ncompared with {baseline["meta"].get("git_revision")} ({baseline["meta"]["started_at"]})')
+    for key in ('target', 'database', 'exercises', 'steps', 'concurrency', 'page_size'):
+        if baseline['meta'].get(key) != current['meta'].get(key):
+            print(f'warning: {key} differs, {baseline["meta"].get(key)} before and {current["meta"].get(key)} now')
+    for name, row in current['results'].items():
+        before = baseline['results'].get(name)
+        if before is None:
+            continue
+        p95_change = row['p95_ms'] / before['p95_ms'] - 1 if before['p95_ms'] else 0.0
+        rps_change = row['throughput_rps'] / before['throughput_rps'] - 1 if before['throughput_rps'] else 0.0
+        regressed = p95_change > tolerance or rps_change < -tolerance
+        regressions += regressed and row['read']
+        print(f'{("REGRESSED" if row["read"] else "slower") if regressed else "ok":<10} {name:<56} p95 {p95_change:+7.1%}  req/s {rps_change:+7.1%}')
+    return regressions
+
+
+async def main(args: argparse.Namespace) -> int:
+    scratch = tempfile.mkdtemp(prefix='gymman-bench-')
+    try:
+        database_url = args.database_url or f'sqlite+aiosqlite:///{Path(scratch) / "bench.sqlite"}'
+        started = time.perf_counter()
+        steps = await seed_catalog(database_url, args.exercises, args.steps_per_exercise)
+        print(f'seeded {args.exercises} exercises and {steps} steps in {time.perf_counter() - started:.1f}s')
+        report = {
+            'meta': {
+                'started_at': datetime.now(timezone.utc).isoformat(),
+                'git_revision': _git_revision(),
+                'python': platform.python_version(),
+                'target': args.target,
+                'database': database_url.split(':', 1)[0],
+                'exercises': args.exercises,
+                'steps': steps,
+                'requests': args.requests,
+                'concurrency': args.concurrency,
+                'page_size': args.page_size,
+            },
+            'results': await run_all(args, database_url, steps),
+        }
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+        shutil.rmtree(_UPLOAD_DIR, ignore_errors=True)
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2) + '\n')
+        print(f'results written to {args.output}')
+    if args.compare:
+        return compare(json.loads(Path(args.compare).read_text()), report, args.tolerance)
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--exercises', type=int, default=10_000, help='exercise rows to seed, e.g. 1000 to 1000000')
+    parser.add_argument('--steps-per-exercise', type=int, default=3)
+    parser.add_argument('--requests', type=int, default=500, help='requests per scenario')
+    parser.add_argument('--warmup', type=int, default=50, help='untimed requests before each scenario')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--page-size', type=int, default=20)
+    parser.add_argument('--upload-size', type=int, default=256 * 1024, help='bytes per uploaded file')
+    parser.add_argument('--target', choices=('inprocess', 'uvicorn'), default='inprocess')
+    parser.add_argument('--database-url', help='seed and use this database instead of a scratch SQLite file')
+    parser.add_argument('--only', nargs='*', help='run the scenarios whose name contains any of these')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--compare', help='JSON file of an earlier run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.15,
+                        help='relative p95/throughput change reported as a regression')
+    sys.exit(1 if asyncio.run(main(parser.parse_args())) else 0)
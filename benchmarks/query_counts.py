@@ -0,0 +1,78 @@
+"""
+assert how many SQL statements the exercise read paths issue
+
+The counts must not depend on the page size or on how many steps each
+exercise has, otherwise a relationship is being loaded per row (N+1).
+
+    python -m benchmarks.query_counts
+"""
+import asyncio
+import sys
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+
+from litestar.testing import AsyncTestClient
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from benchmarks.common import build_app
+from controllers.exercise_controller import ExerciseRepository
+
+# (label, url, params, expected statements), list_and_count counts with a window function on SQLite
+CASES = [
+    ('list', '/exercise', {'pageSize': 20}, 1),
+    ('list include=steps', '/exercise', {'pageSize': 20, 'include': 'steps'}, 2),
+    ('list include=steps, 5 rows', '/exercise', {'pageSize': 5, 'include': 'steps'}, 2),
+    ('list cursor', '/exercise', {'pageSize': 20, 'paging': 'cursor'}, 1),
+    ('list cursor include=steps', '/exercise', {'pageSize': 20, 'paging': 'cursor', 'include': 'steps'}, 2),
+    ('details', '/exercise/details/1', {}, 1),
+    ('details include=steps', '/exercise/details/1', {'include': 'steps'}, 2),
+]
+
+
+@contextmanager
+def count_statements():
+    """Collect the SQL of every statement executed on any engine inside the block."""
+    statements: list[str] = []
+
+    def _before_cursor_execute(conn, cursor, statement, *_):
+        statements.append(statement)
+
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(Engine, 'before_cursor_execute', _before_cursor_execute)
+
+
+async def main() -> int:
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        app = build_app(f'sqlite+aiosqlite:///{Path(tmp) / "bench.sqlite"}')
+        async with AsyncTestClient(app) as client:
+            exercises = (await client.post('/exercise/batch', json=[{'name': f'ex {i:02d}'} for i in range(30)])).json()
+            await client.post('/exercise-step/batch', json=[
+                {'exercise_id': exercise['id'], 'name': f'step {n}', 'sort_order': -n}
+                for exercise in exercises for n in range(exercise['id'] % 7)
+            ])
+            for label, url, params, expected in CASES:
+                # the detail cache would hide the database work being measured
+                ExerciseRepository.detail_cache.clear()
+                with count_statements() as statements:
+                    response = await client.get(url, params=params)
+                selects = [sql for sql in statements if sql.lstrip().upper().startswith('SELECT')]
+                status = 'ok' if response.status_code == 200 and len(selects) == expected else 'FAIL'
+                failures += status == 'FAIL'
+                print(f'{status:<5} {label:<28} {len(selects)} statement(s), expected {expected}')
+                if status == 'FAIL':
+                    print('\n'.join(f'      {sql.splitlines()[0]}' for sql in selects))
+            steps = (await client.get('/exercise/details/6', params={'include': 'steps'})).json()['steps']
+            if [step['sort_order'] for step in steps] != sorted(step['sort_order'] for step in steps):
+                failures += 1
+                print('FAIL  steps are not ordered by sort_order')
+    return failures
+
+
+if __name__ == '__main__':
+    sys.exit(1 if asyncio.run(main()) else 0)
@@ -0,0 +1,122 @@
+"""
+read latency while a bulk import runs, with the reads on the primary's pool and on their own pool
+
+    python -m benchmarks.read_write_split --import-rows 50000 --writers 40 --readers 8 --exporters 1
+
+Readers request exercise details and list pages, and ``--exporters`` clients
+stream the exercise export, first on their own and then while an import writes
+``--import-rows`` exercises and ``--writers`` clients keep creating single
+exercises. The writers queue behind the import's write
+lock, each holding a connection of the primary's pool while it waits. With
+``db_read_pool_enabled`` off the reads need a connection from that same pool.
+The app runs under uvicorn, the test client would send the requests one at a
+time.
+"""
+import argparse
+import asyncio
+import json
+import random
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+from benchmarks.common import percentile, seed_catalog, uvicorn_server
+
+
+async def read_until(client: httpx.AsyncClient, stop: asyncio.Event, readers: int, exercises: int) -> list[float]:
+    latencies: list[float] = []
+
+    async def reader() -> None:
+        while not stop.is_set():
+            started = time.perf_counter()
+            if random.random() < 0.5:
+                response = await client.get(f'/exercise/details/{random.randint(1, exercises)}')
+            else:
+                response = await client.get('/exercise', params={'currentPage': random.randint(1, 50),
+                                                                'withTotal': 'estimated'})
+            latencies.append((time.perf_counter() - started) * 1000)
+            assert response.status_code == 200, response.text
+
+    await asyncio.gather(*(reader() for _ in range(readers)))
+    return latencies
+
+
+async def export_until(client: httpx.AsyncClient, stop: asyncio.Event, exporters: int) -> list[float]:
+    latencies: list[float] = []
+
+    async def exporter() -> None:
+        while not stop.is_set():
+            started = time.perf_counter()
+            response = await client.get('/exercise/export', params={'format': 'ndjson'})
+            latencies.append((time.perf_counter() - started) * 1000)
+            assert response.status_code == 200, response.text
+
+    await asyncio.gather(*(exporter() for _ in range(exporters)))
+    return latencies
+
+
+async def run(label: str, client: httpx.AsyncClient, args: argparse.Namespace) -> None:
+    stop = asyncio.Event()
+    asyncio.get_running_loop().call_later(args.seconds, stop.set)
+    idle, idle_exports = await asyncio.gather(read_until(client, stop, args.readers, args.exercises),
+                                              export_until(client, stop, args.exporters))
+
+    done = asyncio.Event()
+    writer_errors = 0
+    body = b''.join(json.dumps({'name': f'{label} import {i}'}).encode() + b'\n' for i in range(args.import_rows))
+
+    async def bulk() -> tuple[float, dict]:
+        started = time.perf_counter()
+        try:
+            response = await client.post('/exercise/import', content=body,
+                                         params={'format': 'ndjson', 'batchSize': args.batch_size},
+                                         headers={'Content-Type': 'application/x-ndjson'}, timeout=None)
+            assert response.status_code == 200, response.text
+        finally:
+            done.set()
+        return time.perf_counter() - started, response.json()
+
+    async def writer(n: int) -> None:
+        nonlocal writer_errors
+        i = 0
+        while not done.is_set():
+            response = await client.post('/exercise', json={'name': f'{label} writer {n}.{i}'})
+            writer_errors += response.status_code >= 300
+            i += 1
+
+    (import_seconds, report), busy, busy_exports, *_ = await asyncio.gather(
+        bulk(), read_until(client, done, args.readers, args.exercises), export_until(client, done, args.exporters),
+        *(writer(n) for n in range(args.writers)))
+    for phase, kind, latencies in (('idle', 'reads', idle), ('idle', 'exports', idle_exports),
+                                   ('during import', 'reads', busy), ('during import', 'exports', busy_exports)):
+        if latencies:
+            print(f'{label:<18} {phase:<14} {kind:<7} {len(latencies):6d}  p50 {percentile(latencies, 50):8.2f}ms  '
+                  f'p99 {percentile(latencies, 99):8.2f}ms  max {max(latencies):8.2f}ms')
+    # batches that lose the write lock to the writers for longer than the busy timeout are reported as failed
+    print(f'{label:<18} import {args.import_rows} rows in {import_seconds:.2f}s, inserted {report["inserted"]} '
+          f'failed {report["failed"]}, writer errors {writer_errors}')
+
+
+async def main(args: argparse.Namespace) -> None:
+    for label, enabled in (('shared pool', False), ('read pool', True)):
+        with tempfile.TemporaryDirectory() as tmp:
+            url = f'sqlite+aiosqlite:///{Path(tmp) / "split.sqlite"}'
+            await seed_catalog(url, args.exercises, args.steps_per_exercise)
+            async with uvicorn_server(url, GYMMAN_DB_READ_POOL_ENABLED=str(enabled).lower()) as (base_url, _):
+                async with httpx.AsyncClient(base_url=base_url, timeout=120) as client:
+                    await run(label, client, args)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--exercises', type=int, default=5000)
+    parser.add_argument('--steps-per-exercise', type=int, default=3)
+    parser.add_argument('--import-rows', type=int, default=50_000)
+    parser.add_argument('--batch-size', type=int, default=10_000)
+    parser.add_argument('--writers', type=int, default=40)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--exporters', type=int, default=1)
+    parser.add_argument('--seconds', type=float, default=5)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,88 @@
+"""
+compare full-text search latency with a LIKE '%term%' scan over the same columns
+
+    python -m benchmarks.search --rows 200000 --page-size 10
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from litestar.repository.filters import LimitOffset
+from sqlalchemy import func, insert, or_, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from controllers.exercise_controller import ExerciseRepository
+from models.base_model import Base
+from models.exercise import Exercise
+from models.exercise_step import ExerciseStep  # noqa: F401  registers the mapper used by Exercise.steps
+from search import SEARCH_COLUMNS, create_search_indexes, search_ranked, search_terms
+
+COMMON_WORDS = ['press', 'squat', 'curl', 'row', 'lunge', 'plank', 'bridge', 'raise', 'dip', 'pull', 'push',
+                'deadlift', 'shrug', 'fly', 'crunch', 'twist', 'kick', 'hold', 'jump', 'step']
+RARE_WORDS = [f'w{i:05d}' for i in range(20_000)]
+# common words match a large share of the rows, rare ones a handful
+QUERIES = ['deadlift', 'plank hold', 'sq', 'w00042', 'w00042 press', 'nothingmatches']
+
+
+async def seed(session, rows: int) -> None:
+    """Insert ``rows`` exercises with a mix of common and rare words, the triggers index them as they go."""
+    rng = random.Random(1)
+    chunk = 10_000
+    for start in range(0, rows, chunk):
+        await session.execute(insert(Exercise), [
+            {'name': f'{rng.choice(COMMON_WORDS)} {i}', 'tool_tip': ' '.join(rng.sample(COMMON_WORDS, 2)),
+             'description': ' '.join(rng.sample(COMMON_WORDS, 2) + rng.sample(RARE_WORDS, 8))}
+            for i in range(start, min(start + chunk, rows))
+        ])
+    await session.commit()
+
+
+async def like_baseline(session, terms: list[str], page_size: int) -> tuple[list, int]:
+    """Page and count of the rows containing every term anywhere in the searchable columns."""
+    filters = [or_(*(getattr(Exercise, name).like(f'%{term}%') for name in SEARCH_COLUMNS)) for term in terms]
+    rows = (await session.execute(select(Exercise).where(*filters).order_by(Exercise.name).limit(page_size))).all()
+    total = await session.scalar(select(func.count()).select_from(Exercise).where(*filters))
+    return rows, total
+
+
+async def timed(coro_factory, repeat: int) -> float:
+    """Median wall time of ``repeat`` runs in milliseconds."""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await coro_factory()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+async def main(rows: int, page_size: int, repeat: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_async_engine(f'sqlite+aiosqlite:///{Path(tmp) / "bench.sqlite"}')
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            await conn.run_sync(create_search_indexes)
+        session_maker = async_sessionmaker(engine, expire_on_commit=False)
+        async with session_maker() as session:
+            await seed(session, rows)
+            repo = ExerciseRepository(session=session)
+            print(f'{"query":>16} {"matches":>9} {"fts ms":>9} {"like ms":>9}')
+            for query in QUERIES:
+                terms = search_terms(query)
+                _, total = await search_ranked(repo, terms, LimitOffset(page_size, 0))
+                fts_ms = await timed(lambda: search_ranked(repo, terms, LimitOffset(page_size, 0)), repeat)
+                like_ms = await timed(lambda: like_baseline(session, terms, page_size), repeat)
+                print(f'{query:>16} {total:>9} {fts_ms:>9.2f} {like_ms:>9.2f}')
+        await engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--page-size', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(main(args.rows, args.page_size, args.repeat))
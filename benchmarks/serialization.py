@@ -0,0 +1,138 @@
+"""
+time turning one list page into JSON bytes, per row, the old way against the column path
+
+    python -m benchmarks.serialization --page-size 100 --repeat 300
+
+``before`` loads ORM instances with list_and_count (and selectinload for the
+steps), validates them through a TypeAdapter built for the request and
+encodes the pydantic models with Litestar's serializer, as the list handlers
+used to. ``after`` is what they do now: `pagination.list_offset` over
+`serialization.dto_columns` and one msgspec encode. ``fetch`` is the query
+up to usable Python objects, ``serialize`` the rest.
+"""
+import argparse
+import asyncio
+import json
+import shutil
+import statistics
+import tempfile
+import time
+from dataclasses import replace
+from pathlib import Path
+from typing import Any, Awaitable, Callable
+
+from litestar import Litestar
+from litestar.pagination import OffsetPagination
+from litestar.repository.filters import LimitOffset, OrderBy
+from litestar.serialization import encode_json, get_serializer
+from pydantic import TypeAdapter
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from benchmarks.common import seed_catalog
+from controllers.exercise_controller import ExerciseRepository, embed_steps
+from controllers.exercise_step_controller import ExerciseStepRepository
+from database import create_sqlalchemy_config
+from models.exercise import Exercise, ExerciseDTO
+from models.exercise_step import ExerciseStepDTO, ExerciseWithStepsDTO
+from pagination import list_offset
+from serialization import dto_columns, json_response
+from settings import settings
+
+# the encoders Litestar registers for pydantic models, i.e. what the handlers' return values went through
+LITESTAR_SERIALIZER = get_serializer(Litestar([]).type_encoders)
+
+
+def before(repo_type: type, dto: type, steps: bool) -> tuple[Callable[..., Awaitable[Any]], Callable[..., bytes]]:
+    async def fetch(session: AsyncSession, limit_offset: LimitOffset) -> Any:
+        repo = repo_type(session=session)
+        statement = select(Exercise).options(selectinload(Exercise.steps)) if steps else None
+        return await repo.list_and_count(limit_offset, OrderBy(field_name=repo.model_type.name), statement=statement)
+
+    def serialize(fetched: Any, limit_offset: LimitOffset) -> bytes:
+        results, total = fetched
+        page = OffsetPagination[dto](items=TypeAdapter(list[dto]).validate_python(results), total=total,
+                                     limit=limit_offset.limit, offset=limit_offset.offset)
+        return encode_json(page, LITESTAR_SERIALIZER)
+
+    return fetch, serialize
+
+
+def after(repo_type: type, dto: type, steps: bool) -> tuple[Callable[..., Awaitable[Any]], Callable[..., bytes]]:
+    columns = dto_columns(repo_type.model_type, dto)
+
+    async def fetch(session: AsyncSession, limit_offset: LimitOffset) -> Any:
+        page = await list_offset(repo_type(session=session), columns, limit_offset)
+        if steps:
+            await embed_steps(session, page.items)
+        return page
+
+    def serialize(fetched: Any, limit_offset: LimitOffset) -> bytes:
+        return json_response(fetched).content
+
+    return fetch, serialize
+
+
+CASES = [
+    ('exercise', ExerciseRepository, ExerciseDTO, False),
+    ('exercise include=steps', ExerciseRepository, ExerciseWithStepsDTO, True),
+    ('exercise-step', ExerciseStepRepository, ExerciseStepDTO, False),
+]
+
+
+async def timed(fetch: Callable[..., Awaitable[Any]], serialize: Callable[..., bytes], engine: Any,
+                page_size: int, pages: int, repeat: int) -> tuple[float, float, bytes]:
+    """Median fetch and serialize seconds of one page over ``repeat`` runs, and the last body."""
+    fetch_times: list[float] = []
+    serialize_times: list[float] = []
+    body = b''
+    for run in range(repeat):
+        limit_offset = LimitOffset(page_size, (run % pages) * page_size)
+        # a fresh session per page, like a request, so the identity map does not carry over
+        async with AsyncSession(engine) as session:
+            started = time.perf_counter()
+            fetched = await fetch(session, limit_offset)
+            fetched_at = time.perf_counter()
+            body = serialize(fetched, limit_offset)
+            serialize_times.append(time.perf_counter() - fetched_at)
+            fetch_times.append(fetched_at - started)
+    return statistics.median(fetch_times), statistics.median(serialize_times), body
+
+
+async def main(exercises: int, steps_per_exercise: int, page_size: int, repeat: int) -> None:
+    scratch = tempfile.mkdtemp(prefix='gymman-bench-')
+    try:
+        database_url = f'sqlite+aiosqlite:///{Path(scratch) / "bench.sqlite"}'
+        steps = await seed_catalog(database_url, exercises, steps_per_exercise)
+        print(f'seeded {exercises} exercises and {steps} steps, {page_size} rows per page, '
+              f'median of {repeat} pages, microseconds per row')
+        engine = create_sqlalchemy_config(replace(settings, database_url=database_url)).engine_instance
+        print(f'{"page":<24} {"path":<7} {"fetch":>8} {"serialize":>10} {"total":>8} {"bytes":>8}')
+        for label, repo_type, dto, with_steps in CASES:
+            pages = max(1, min(exercises, steps if repo_type is ExerciseStepRepository else exercises) // page_size)
+            bodies = []
+            for path, build in (('before', before), ('after', after)):
+                fetch_s, serialize_s, body = await timed(*build(repo_type, dto, with_steps), engine,
+                                                          page_size, pages, repeat)
+                bodies.append(body)
+                per_row = 1e6 / page_size
+                print(f'{label:<24} {path:<7} {fetch_s * per_row:>8.1f} {serialize_s * per_row:>10.1f} '
+                      f'{(fetch_s + serialize_s) * per_row:>8.1f} {len(body):>8}')
+            # the last run of both paths is the same page, so the bodies must match apart from total_mode
+            unchanged, changed = (json.loads(body) for body in bodies)
+            if changed.pop('total_mode') != 'exact' or unchanged != changed:
+                print(f'{label}: the response bodies differ')
+        await engine.dispose()
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--exercises', type=int, default=10_000)
+    parser.add_argument('--steps-per-exercise', type=int, default=5)
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=300)
+    args = parser.parse_args()
+    asyncio.run(main(args.exercises, args.steps_per_exercise, args.page_size, args.repeat))
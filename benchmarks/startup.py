@@ -0,0 +1,81 @@
+"""
+cold start of the server with 1, 2 and 4 workers on a new SQLite database
+
+``serve`` creates the schema once and starts workers that skip it, ``uvicorn``
+starts the workers directly and each of them runs the locked schema
+initialization itself. Both report every worker's ``gymman_startup_seconds``
+through the multi-process metrics, from which the time until the first and the
+last worker was ready is read.
+
+    python -m benchmarks.startup --workers 1 2 4
+"""
+import argparse
+import asyncio
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+from benchmarks.common import free_port
+
+_GAUGE = re.compile(r'^gymman_(startup|schema_init)_seconds\{pid="(\d+)"\} (\S+)$', re.MULTILINE)
+
+
+async def run_mode(mode: str, workers: int, timeout: float) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        port = free_port()
+        metrics_dir = Path(tmp) / 'metrics'
+        metrics_dir.mkdir()
+        env = {**os.environ, 'GYMMAN_DATABASE_URL': f'sqlite+aiosqlite:///{Path(tmp) / "startup.sqlite"}',
+               'GYMMAN_WORKERS': str(workers), 'GYMMAN_LAUNCHED_AT': repr(time.time()),
+               'PROMETHEUS_MULTIPROC_DIR': str(metrics_dir)}
+        if mode == 'serve':
+            command = [sys.executable, '-m', 'serve', '--workers', str(workers), '--port', str(port)]
+        else:
+            command = [sys.executable, '-m', 'uvicorn', 'main:app', '--workers', str(workers), '--port', str(port)]
+        started = time.perf_counter()
+        process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        first_answer = None
+        try:
+            async with httpx.AsyncClient(base_url=f'http://127.0.0.1:{port}') as client:
+                while time.perf_counter() - started < timeout:
+                    try:
+                        text = (await client.get('/metrics')).text
+                    except httpx.TransportError:
+                        await asyncio.sleep(0.05)
+                        continue
+                    first_answer = first_answer or time.perf_counter() - started
+                    gauges: dict[str, dict[str, float]] = {'startup': {}, 'schema_init': {}}
+                    for name, pid, value in _GAUGE.findall(text):
+                        # a worker still starting up reports 0
+                        if float(value) > 0 or name == 'schema_init':
+                            gauges[name][pid] = float(value)
+                    if len(gauges['startup']) >= workers:
+                        ready = sorted(gauges['startup'].values())
+                        print(f'{mode:<8} workers {workers}  first answer {first_answer:5.2f}s  '
+                              f'first ready {ready[0]:5.2f}s  last ready {ready[-1]:5.2f}s  '
+                              f'schema in workers {sum(gauges["schema_init"].values()):5.2f}s')
+                        return
+                    await asyncio.sleep(0.05)
+            print(f'{mode:<8} workers {workers}  not ready after {timeout:.0f}s')
+        finally:
+            process.terminate()
+            process.wait()
+
+
+async def main(args: argparse.Namespace) -> None:
+    for workers in args.workers:
+        for mode in ('serve', 'uvicorn'):
+            await run_mode(mode, workers, args.timeout)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--timeout', type=float, default=60)
+    asyncio.run(main(parser.parse_args()))
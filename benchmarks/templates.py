@@ -0,0 +1,87 @@
+"""
+time compiling the page templates and rendering the exercise pages, full and as HTMX fragments
+
+    python -m benchmarks.templates --exercises 5000 --steps-per-exercise 5 --requests 300
+
+``compile`` loads every page template into a new Mako lookup, compiling them
+in memory as before, into an empty ``module_directory`` and from the modules
+an earlier process left there. ``render`` requests each page through the app
+with the render cache off and on, and reports the latency and the bytes of
+the response body.
+"""
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from litestar.testing import AsyncTestClient
+
+from benchmarks.common import build_app, percentile, seed_catalog
+from models.exercise_step import ExerciseStepDTO, ExerciseWithStepsDTO
+from pagination import CountedOffsetPagination
+from rendering import create_template_engine, render_cache
+
+PAGE_TEMPLATES = ('exercise_list.mako.html', 'exercise_list.fragment.mako.html', 'exercise_detail.mako.html',
+                  'exercise_detail.fragment.mako.html')
+
+
+def load_templates(module_directory: str) -> float:
+    """Seconds to load and render every page template once with a new engine."""
+    page = CountedOffsetPagination(items=[{'id': i, 'name': f'exercise {i}', 'tool_tip': 'tip'} for i in range(10)],
+                                   total=100, total_mode='exact', limit=10, offset=0)
+    exercise = ExerciseWithStepsDTO(id=1, name='exercise', steps=[
+        ExerciseStepDTO(id=i, exercise_id=1, name=f'step {i}') for i in range(5)])
+    started = time.perf_counter()
+    engine = create_template_engine(module_directory=module_directory)
+    for name in PAGE_TEMPLATES:
+        engine.get_template(name).render(page=page, current_page=1, exercise=exercise)
+    return time.perf_counter() - started
+
+
+async def run_pages(url: str, requests: int, exercises: int) -> None:
+    app = build_app(url)
+    scenarios = {
+        'list full': ('/pages/exercises', {}),
+        'list fragment': ('/pages/exercises', {'HX-Request': 'true'}),
+        'detail full': ('/pages/exercises/{id}', {}),
+        'detail fragment': ('/pages/exercises/{id}', {'HX-Request': 'true'}),
+    }
+    async with AsyncTestClient(app) as client:
+        for cached in (False, True):
+            render_cache.enabled = cached
+            render_cache.clear()
+            for label, (path, headers) in scenarios.items():
+                latencies: list[float] = []
+                sizes: list[int] = []
+                for i in range(requests):
+                    # the list pages cycle over 20 pages and the details over 50 exercises
+                    target = path.format(id=i % 50 + 1) if '{id}' in path else f'{path}?currentPage={i % 20 + 1}'
+                    started = time.perf_counter()
+                    response = await client.get(target, headers=headers)
+                    latencies.append((time.perf_counter() - started) * 1000)
+                    assert response.status_code == 200, response.text
+                    sizes.append(len(response.content))
+                print(f'{label:<16} cache {"on " if cached else "off"}  mean {statistics.mean(latencies):6.2f}ms  '
+                      f'p50 {percentile(latencies, 50):6.2f}ms  p95 {percentile(latencies, 95):6.2f}ms  '
+                      f'{statistics.mean(sizes):8.0f} bytes')
+
+
+async def main(args: argparse.Namespace) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f'compile  in memory          {load_templates("") * 1000:7.1f}ms')
+        modules = str(Path(tmp) / 'modules')
+        print(f'compile  module cache cold  {load_templates(modules) * 1000:7.1f}ms')
+        print(f'compile  module cache warm  {load_templates(modules) * 1000:7.1f}ms')
+        url = f'sqlite+aiosqlite:///{Path(tmp) / "templates.sqlite"}'
+        await seed_catalog(url, args.exercises, args.steps_per_exercise)
+        await run_pages(url, args.requests, args.exercises)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--exercises', type=int, default=5000)
+    parser.add_argument('--steps-per-exercise', type=int, default=5)
+    parser.add_argument('--requests', type=int, default=300)
+    asyncio.run(main(parser.parse_args()))
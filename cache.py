@@ -0,0 +1,170 @@
+"""
+in-process caches: rows by primary key, row counts and table versions
+"""
+from __future__ import annotations
+
+import hashlib
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Hashable
+
+
+class ReadThroughCache:
+    """Size bounded LRU cache whose entries also expire after ``ttl`` seconds.
+
+    `get_or_load` fills the cache from a loader on a miss. `invalidate` bumps a
+    generation counter, so a load that was already in flight when a write
+    invalidated the key can not put the stale value back afterwards.
+    """
+
+    def __init__(self, name: str, max_size: int = 1024, ttl: float = 60.0, enabled: bool = True) -> None:
+        self.name = name
+        self.max_size = max_size
+        self.ttl = ttl
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._generation = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Any | None:
+        """Return the cached value or ``None``, counting the hit or miss."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires, value = entry
+            if expires > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._entries[key]
+            self.evictions += 1
+        self.misses += 1
+        return None
+
+    def set(self, key: Hashable, value: Any, generation: int | None = None) -> None:
+        """Store ``value``, unless the cache was invalidated since ``generation`` was read."""
+        if not self.enabled or (generation is not None and generation != self._generation):
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the cached value for ``key`` or await ``loader`` and cache its result."""
+        if not self.enabled:
+            return await loader()
+        value = self.get(key)
+        if value is None:
+            generation = self._generation
+            value = await loader()
+            self.set(key, value, generation)
+        return value
+
+    def invalidate(self, *keys: Hashable) -> None:
+        """Drop ``keys`` from the cache, must be called after the write is committed."""
+        self._generation += 1
+        for key in keys:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        """Drop every entry and reset the counters."""
+        self._generation += 1
+        self._entries.clear()
+        self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> dict[str, int]:
+        """Hit/miss/eviction counters and the current size."""
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'size': len(self)}
+
+
+class RowCounter:
+    """Row count of one table that is kept current by the writes instead of counting.
+
+    The handlers that insert or delete rows report it with `add` once their
+    transaction is committed. The count is read from the database again when it
+    is older than ``ttl`` seconds, which bounds the drift from writes that do not
+    go through the handlers, such as other processes or cascading deletes.
+    """
+
+    def __init__(self, name: str, ttl: float = 30.0) -> None:
+        self.name = name
+        self.ttl = ttl
+        self.counts = 0
+        self._value: int | None = None
+        self._expires = 0.0
+        self._generation = 0
+
+    async def get_or_count(self, counter: Callable[[], Awaitable[int]]) -> int:
+        """Return the kept count, or await ``counter`` for an exact one when there is none or it expired."""
+        if self._value is not None and self._expires > time.monotonic():
+            return self._value
+        generation = self._generation
+        value = await counter()
+        self.counts += 1
+        # a write committed while counting may or may not be included, leave it to the next request
+        if generation == self._generation:
+            self._value = value
+            self._expires = time.monotonic() + self.ttl
+        return value
+
+    def add(self, delta: int) -> None:
+        """Account for ``delta`` rows inserted (positive) or deleted (negative), after the commit."""
+        self._generation += 1
+        if self._value is not None:
+            self._value = max(0, self._value + delta)
+
+    def stats(self) -> dict[str, int]:
+        """The kept count (-1 when there is none) and how often it was read from the database."""
+        return {'rows': -1 if self._value is None else self._value, 'counts': self.counts}
+
+
+class TableVersion:
+    """Version of one table's contents, bumped by every handler that writes to it.
+
+    List responses are validated against it instead of being built again. The
+    version is kept per process, so ``epoch`` is part of `tag` and a restart
+    never makes an old tag match.
+
+    With ``shared`` the workers of a multi-process server can not see each
+    other's bumps, so `refresh` reads a watermark of the table from the database
+    instead and `tag` and ``modified`` follow it. Its datetime parts are the
+    change times, the others only go into the tag.
+    """
+
+    def __init__(self, name: str, shared: bool = False) -> None:
+        self.name = name
+        self.shared = shared
+        self.epoch = uuid.uuid4().hex[:8]
+        self.value = 0
+        self.modified = datetime.now(timezone.utc)
+        self._watermark: tuple[Any, ...] | None = None
+
+    def bump(self) -> None:
+        """Record a write, after its transaction is committed."""
+        self.value += 1
+        self.modified = datetime.now(timezone.utc)
+
+    async def refresh(self, watermark: Callable[[], Awaitable[tuple[Any, ...]]]) -> None:
+        """Await ``watermark`` for the revision and change time of the table when the version is ``shared``."""
+        if not self.shared:
+            return
+        marks = await watermark()
+        if marks != self._watermark:
+            self._watermark = marks
+            self.epoch = hashlib.blake2b(repr(marks).encode(), digest_size=8).hexdigest()
+            self.modified = max((mark for mark in marks if isinstance(mark, datetime)),
+                                default=datetime.fromtimestamp(0, timezone.utc))
+
+    @property
+    def tag(self) -> str:
+        if self.shared:
+            return f'{self.name}.{self.epoch}'
+        return f'{self.name}.{self.epoch}.{self.value}'
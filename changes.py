@@ -0,0 +1,210 @@
+"""
+change feeds: the rows of a table inserted, updated or deleted since a token
+
+Live rows are read in (updated_at, id) order from the ``updated_at`` index of
+their table, deleted rows from the tombstones the delete handlers record, and
+the two are merged into one feed. Only rows older than a short settle window
+are served, so a transaction that stamped its rows before another one but
+committed after it still shows up after a client's token.
+
+The version of a table that list responses are validated against is the
+`TableRevision` counter instead, which `track_revisions` increments inside
+each transaction that writes to the table, so it follows the commit order.
+"""
+from __future__ import annotations
+
+import base64
+import heapq
+import json
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Generic, List, Optional, TypeVar
+
+from litestar.exceptions import ValidationException
+from sqlalchemy import case, event, func, insert, literal, select, tuple_, update
+from sqlalchemy.orm import Session
+
+from models.table_revision import TableRevision
+from models.tombstone import Tombstone
+
+T = TypeVar('T')
+
+
+@dataclass
+class Change(Generic[T]):
+    """One row of a change feed."""
+
+    __slots__ = ('id', 'updated_at', 'deleted', 'item')
+
+    id: int
+    """Primary key of the row."""
+    updated_at: datetime
+    """Time of the last insert or update, or of the deletion."""
+    deleted: bool
+    """``True`` for a tombstone, the row no longer exists."""
+    item: Optional[T]
+    """The row as it is now, ``None`` when it was deleted."""
+
+
+@dataclass
+class ChangesPage(Generic[T]):
+    """Container for one page of a change feed."""
+
+    __slots__ = ('items', 'next', 'more')
+
+    items: List[Change[T]]
+    """Changes in (updated_at, id) order."""
+    next: Optional[str]
+    """Token to send as ``since`` for the following changes, it stays valid when ``items`` is empty."""
+    more: bool
+    """``True`` when more changes are already waiting after ``next``."""
+
+
+def encode_since(updated_at: datetime, row_id: int, deleted: bool) -> str:
+    """Encode a feed position into an opaque url safe token."""
+    raw = json.dumps([updated_at.isoformat(), row_id, int(deleted)], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_since(token: str) -> tuple[datetime, int, bool]:
+    """Decode a token produced by `encode_since`."""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        updated_at, row_id, deleted = json.loads(base64.urlsafe_b64decode(padded))
+        if not isinstance(row_id, int) or deleted not in (0, 1):
+            raise ValueError(token)
+        return datetime.fromisoformat(updated_at).astimezone(timezone.utc), row_id, bool(deleted)
+    except (ValueError, TypeError) as ex:
+        raise ValidationException(detail=f'Invalid since token: {token}') from ex
+
+
+async def record_deletions(session: Any, table_name: str, ids: list[int]) -> None:
+    """Write a tombstone for each deleted row, in the transaction of the delete."""
+    if ids:
+        await session.execute(insert(Tombstone), [{'table_name': table_name, 'row_id': row_id} for row_id in ids])
+
+
+# Session.info key of the tables the open transaction wrote to
+_WRITTEN_TABLES = 'gymman_written_tables'
+
+
+def _written_tables(session: Session) -> set[str]:
+    return session.info.setdefault(_WRITTEN_TABLES, set())
+
+
+def _record_flush(session: Session, _: Any) -> None:
+    tables = _written_tables(session)
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        table = getattr(obj, '__table__', None)
+        if table is not None and (obj not in session.dirty or session.is_modified(obj)):
+            tables.add(table.name)
+
+
+def _record_execute(state: Any) -> None:
+    if state.is_insert or state.is_update or state.is_delete:
+        _written_tables(state.session).add(state.statement.table.name)
+
+
+def _increment_revisions(session: Session) -> None:
+    # flush first, commit would flush whatever is left after this hook
+    session.flush()
+    tables = session.info.pop(_WRITTEN_TABLES, set())
+    tables.discard(TableRevision.__tablename__)
+    if tables:
+        session.execute(_increment(sorted(tables)))
+        # the update above recorded itself as a write
+        session.info.pop(_WRITTEN_TABLES, None)
+
+
+def _increment(table_names: list[str]) -> Any:
+    now = literal(datetime.now(timezone.utc), TableRevision.updated_at.type)
+    return update(TableRevision).where(TableRevision.table_name.in_(table_names)).values(
+        revision=TableRevision.revision + 1,
+        # the clocks of other processes may run behind, never move it back
+        updated_at=case((TableRevision.updated_at > now, TableRevision.updated_at), else_=now),
+    )
+
+
+def _forget_writes(session: Session, *_: Any) -> None:
+    session.info.pop(_WRITTEN_TABLES, None)
+
+
+def track_revisions(session_class: type[Session] = Session) -> None:
+    """Increment the `TableRevision` of every table a transaction of ``session_class`` writes to, before its commit.
+
+    Writes are collected from the flushes and from the insert, update and
+    delete statements executed through the session. Writes on a bare
+    connection, like the schema upgrades, must call `increment_revisions`.
+    """
+    if not event.contains(session_class, 'before_commit', _increment_revisions):
+        event.listen(session_class, 'after_flush', _record_flush)
+        event.listen(session_class, 'do_orm_execute', _record_execute)
+        event.listen(session_class, 'before_commit', _increment_revisions)
+        event.listen(session_class, 'after_rollback', _forget_writes)
+
+
+def increment_revisions(conn: Any, table_names: list[str]) -> None:
+    """Increment the `TableRevision` of ``table_names`` on a sync connection, in its transaction."""
+    conn.execute(_increment(table_names))
+
+
+async def table_watermark(session: Any, model: Any) -> tuple[int | None, datetime | None]:
+    """`TableRevision` of ``model``'s table and the time it was last incremented.
+
+    Any committed insert, update or delete of the table moves the revision, in
+    commit order, so it serves as a version of the table that every process can
+    read.
+    """
+    statement = select(TableRevision.revision, TableRevision.updated_at) \
+        .where(TableRevision.table_name == model.__tablename__)
+    row = (await session.execute(statement)).one_or_none()
+    return (row[0], row[1]) if row is not None else (None, None)
+
+
+async def list_changes(session: Any, model: Any, columns: list[Any], since: tuple[datetime, int, bool] | None,
+                       limit: int, settle_seconds: float) -> ChangesPage[dict[str, Any]]:
+    """Fetch the changes of ``model``'s table after the ``since`` position.
+
+    Parameters
+    ----------
+    session : AsyncSession
+        session used for the lookups.
+    model : type[Base]
+        model with ``id`` and ``updated_at`` attributes.
+    columns : list[ColumnElement]
+        labelled columns of the items, see `serialization.dto_columns`.
+    since : tuple[datetime, int, bool] | None
+        decoded ``since`` token, ``None`` to start from the oldest row.
+    limit : int
+        page size.
+    settle_seconds : float
+        rows changed more recently than this are left for a later call.
+    """
+    horizon = datetime.now(timezone.utc) - timedelta(seconds=settle_seconds)
+    live = select(model.updated_at, *columns).where(model.updated_at <= horizon)
+    tombstones = select(Tombstone.updated_at, Tombstone.row_id) \
+        .where(Tombstone.table_name == model.__tablename__, Tombstone.updated_at <= horizon)
+    if since is not None:
+        updated_at, row_id, deleted = since
+        live = live.where(tuple_(model.updated_at, model.id) > (updated_at, row_id))
+        # a tombstone sorts after a live row with the same (updated_at, id)
+        key = tuple_(Tombstone.updated_at, Tombstone.row_id)
+        tombstones = tombstones.where(key > (updated_at, row_id) if deleted else key >= (updated_at, row_id))
+    # fetch one extra row of each to find out whether there is more
+    live_rows = await session.execute(live.order_by(model.updated_at, model.id).limit(limit + 1))
+    keys = list(live_rows.keys())[1:]
+    changes = [Change(id=values['id'], updated_at=updated_at, deleted=False, item=values)
+               for updated_at, values in ((row[0], dict(zip(keys, row[1:]))) for row in live_rows)]
+    deletions = await session.execute(tombstones.order_by(Tombstone.updated_at, Tombstone.row_id).limit(limit + 1))
+    changes = list(heapq.merge(
+        changes,
+        [Change(id=row_id, updated_at=updated_at, deleted=True, item=None) for updated_at, row_id in deletions],
+        key=lambda change: (change.updated_at, change.id, change.deleted)))
+    more = len(changes) > limit
+    changes = changes[:limit]
+    if changes:
+        last = changes[-1]
+        token: str | None = encode_since(last.updated_at, last.id, last.deleted)
+    else:
+        token = encode_since(*since) if since is not None else None
+    return ChangesPage(items=changes, next=token, more=more)
@@ -0,0 +1,70 @@
+"""
+conditional GET: ETag/Last-Modified validators and 304 responses
+
+Handlers work out the validators of a response before building it, from the
+``updated_at`` of the rows for details and from `cache.TableVersion` for
+lists, and return `not_modified` when the request's ``If-None-Match`` or
+``If-Modified-Since`` still matches, so the body is never loaded or encoded.
+"""
+from __future__ import annotations
+
+import hashlib
+from datetime import datetime, timedelta
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any
+
+from litestar import Request, Response
+from litestar.datastructures import CacheControlHeader
+from litestar.status_codes import HTTP_304_NOT_MODIFIED
+
+
+def cache_control(value: str) -> CacheControlHeader:
+    """``Cache-Control`` of a route from its setting, e.g. ``no-cache`` or ``private, max-age=60``."""
+    return CacheControlHeader.from_header(value)
+
+
+def row_validators(*rows: Any) -> tuple[str, datetime]:
+    """Strong ETag and Last-Modified of a response built from ``rows``, each with ``id`` and ``updated_at``."""
+    digest = hashlib.blake2b(digest_size=12)
+    for row in rows:
+        digest.update(f'{type(row).__name__}:{row.id}:{row.updated_at.isoformat()};'.encode())
+    return f'"{digest.hexdigest()}"', max(row.updated_at for row in rows)
+
+
+def version_validators(*versions: Any) -> tuple[str, datetime]:
+    """Weak ETag and Last-Modified of a list response built from the tables of ``versions``."""
+    tag = hashlib.blake2b('-'.join(version.tag for version in versions).encode(), digest_size=12).hexdigest()
+    return f'W/"{tag}"', max(version.modified for version in versions)
+
+
+def validator_headers(etag: str, last_modified: datetime) -> dict[str, str]:
+    return {'ETag': etag, 'Last-Modified': format_datetime(last_modified, usegmt=True)}
+
+
+def is_not_modified(request: Request[Any, Any, Any], etag: str, last_modified: datetime) -> bool:
+    """Whether the client's copy is current.
+
+    ``If-None-Match`` is compared weakly and, when present, decides alone, as
+    RFC 9110 asks. ``If-Modified-Since`` has one second resolution, so
+    ``last_modified`` is rounded up to the next second: a write in the same
+    second as the client's copy must not answer 304, the ETag still can.
+    """
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match is not None:
+        tags = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+        return '*' in tags or etag.removeprefix('W/') in tags
+    if_modified_since = request.headers.get('if-modified-since')
+    if if_modified_since is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if last_modified.microsecond:
+        last_modified = last_modified.replace(microsecond=0) + timedelta(seconds=1)
+    return since.tzinfo is not None and last_modified <= since
+
+
+def not_modified(etag: str, last_modified: datetime) -> Response[Any]:
+    """Empty 304 response carrying the validators."""
+    return Response(content=b'', status_code=HTTP_304_NOT_MODIFIED, headers=validator_headers(etag, last_modified))
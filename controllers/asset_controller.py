@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+import mimetypes
+from datetime import datetime, timezone
+from pathlib import Path
+
+from litestar import Request, Response, get
+from litestar.controller import Controller
+from litestar.datastructures import ETag
+from litestar.exceptions import NotFoundException
+from litestar.response import File
+
+from assets import ENCODINGS, current_manifest, pick_encoding
+from conditional import cache_control, is_not_modified, not_modified
+from settings import settings
+
+
+class AssetController(Controller):
+    """
+    fingerprinted static files written by `assets.build_assets`
+    """
+
+    path = '/assets'
+    include_in_schema = False
+
+    @get('/{name:path}', cache_control=cache_control(settings.cache_control_assets))
+    async def get_asset(self, request: Request, name: str) -> File | Response[bytes]:
+        """## Get A Fingerprinted Static File
+        Sends the ``.br`` or ``.gz`` copy when the client's `Accept-Encoding` allows it.
+        """
+        name = name.lstrip('/')
+        encodings = current_manifest().encodings.get(name)
+        # only names from the manifest, never a path the client made up
+        if encodings is None:
+            raise NotFoundException(detail=f'No asset {name!r}')
+        encoding = pick_encoding(request.headers.get('accept-encoding', ''), encodings)
+        path = Path(settings.assets_dir) / name
+        if encoding is not None:
+            path = path.with_name(path.name + ENCODINGS[encoding])
+        # the hash in the name already identifies the content, the encoding tells the copies apart
+        etag = f'"{Path(name).suffixes[-2].lstrip(".")}{"-" + encoding if encoding else ""}"'
+        last_modified = datetime.fromtimestamp(path.stat().st_mtime, timezone.utc)
+        headers = {'Vary': 'Accept-Encoding'}
+        if is_not_modified(request, etag, last_modified):
+            response = not_modified(etag, last_modified)
+            response.headers.update(headers)
+            return response
+        if encoding is not None:
+            headers['Content-Encoding'] = encoding
+        return File(path=path, filename=Path(name).name, content_disposition_type='inline',
+                    media_type=mimetypes.guess_type(name)[0] or 'application/octet-stream',
+                    etag=ETag(value=etag.strip('"')), headers=headers)
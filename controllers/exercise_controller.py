@@ -1,24 +1,47 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Any, Literal
 
-from litestar.exceptions import HTTPException
+from litestar.enums import RequestEncodingType
+from litestar.exceptions import ClientException, HTTPException
 from litestar.pagination import OffsetPagination
 from litestar.repository.filters import OrderBy
 
-from litestar import get, status_codes
+from litestar import Request, Response, get, status_codes
+from litestar.background_tasks import BackgroundTask
 from litestar.contrib.sqlalchemy.repository import SQLAlchemyAsyncRepository
 from litestar.controller import Controller
 from litestar.di import Provide
 from litestar.handlers.http_handlers.decorators import delete, post, put, patch
-from litestar.params import Parameter
+from litestar.params import Body, Parameter
 from litestar.repository.filters import LimitOffset
-from pydantic import TypeAdapter
+from litestar.response import File, Stream
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
+
+from batch import (duplicate_id_errors, in_chunks, list_by_ids, missing_reference_errors, parse_ids,
+                   raise_for_errors, validate_items)
+from cache import ReadThroughCache, RowCounter, TableVersion
+from changes import ChangesPage, decode_since, list_changes, record_deletions, table_watermark
+from conditional import (cache_control, is_not_modified, not_modified, row_validators, validator_headers,
+                         version_validators)
+from database import session_for
+from export import ExportFormat, export_stream
+from importer import (ImportMode, ImportReport, Importer, error_file_path, guess_format, multipart_file, read_records,
+                      remove_error_file)
+from ordering import apply_moves
+from pagination import CountedOffsetPagination, KeysetPagination, KeysetParams, TotalMode, list_keyset, list_offset
+from search import search_ranked, search_terms
+from serialization import dto_columns, json_response, list_adapter
+from settings import settings
 
 if TYPE_CHECKING:
-    from sqlalchemy.ext.asyncio import AsyncSession
+    from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
 
-from models.exercise import Exercise, ExerciseCreate, ExerciseDTO
+from models.exercise import Exercise, ExerciseCreate, ExerciseDTO, ExerciseUpdate
+from models.exercise_step import ExerciseStep, ExerciseStepDTO, ExerciseStepMove, ExerciseWithStepsDTO
+from controllers.exercise_step_controller import ExerciseStepRepository, provide_exercise_step_repo
 from logger import logger
 
 
@@ -26,12 +49,58 @@ class ExerciseRepository(SQLAlchemyAsyncRepository[Exercise]):
     """Exercise repository"""
 
     model_type = Exercise
+    detail_cache = ReadThroughCache('exercise', max_size=settings.cache_max_size, ttl=settings.cache_ttl,
+                                    enabled=settings.cache_enabled)
+    row_count = RowCounter('exercise', ttl=settings.count_ttl)
+    # workers of a multi-process server, and readers of a replica, read the version from the table with the data
+    version = TableVersion('exercise', shared=settings.shared_versions)
+
+    async def current_version(self) -> TableVersion:
+        """`version`, brought up to date with writes of other workers first when they share it."""
+        await self.version.refresh(lambda: table_watermark(self.session, self.model_type))
+        return self.version
+
+    async def get_one(self, auto_expunge: bool | None = None, statement: Any = None, **kwargs: Any) -> Exercise:
+        """Serve primary key lookups through `detail_cache`, anything else goes to the database.
+
+        Other processes' writes never reach `detail_cache`, and a replica may not have the ones that did, so it is
+        skipped when `version` is shared.
+        """
+        # with a shared version, checking the cache against the table's watermark costs a query like the lookup
+        if statement is not None or set(kwargs) != {'id'} or self.version.shared:
+            return await super().get_one(auto_expunge=auto_expunge, statement=statement, **kwargs)
+        load = super().get_one
+        # cached instances are shared between requests, so they must not stay bound to this session
+        return await self.detail_cache.get_or_load(int(kwargs['id']), lambda: load(auto_expunge=True, **kwargs))
+
+
+def with_steps_statement(include: str | None) -> Any:
+    """Select that loads each exercise's steps in one extra query when ``include=steps``."""
+    return select(Exercise).options(selectinload(Exercise.steps)) if include == 'steps' else None
+
 
+async def embed_steps(session: AsyncSession, items: list[dict[str, Any]]) -> None:
+    """Add the ``steps`` of each exercise row from `list_offset`/`list_keyset`, in display order."""
+    by_id = {item['id']: item for item in items}
+    for item in items:
+        item['steps'] = []
+    columns = dto_columns(ExerciseStep, ExerciseStepDTO)
+    for chunk in in_chunks(list(by_id)):
+        statement = (select(*columns)
+                     .where(ExerciseStep.exercise_id.in_(chunk))
+                     .order_by(ExerciseStep.exercise_id, ExerciseStep.sort_order, ExerciseStep.id))
+        for row in await session.execute(statement):
+            by_id[row.exercise_id]['steps'].append(row._asdict())
 
-async def provide_exercise_repo(db_session: AsyncSession) -> ExerciseRepository:
+
+async def provide_exercise_repo(request: Request, db_session: AsyncSession,
+                                db_read_session: AsyncSession) -> ExerciseRepository:
     """This provides a simple example demonstrating how to override the join options
-    for the repository."""
-    return ExerciseRepository(session=db_session)
+    for the repository.
+
+    GET requests get a repository on the read pool, the others one on the primary.
+    """
+    return ExerciseRepository(session=session_for(request, db_session, db_read_session))
 
 
 class ExerciseController(Controller):
@@ -41,19 +110,57 @@ class ExerciseController(Controller):
     }
     exercise_controller_tag = ['Exercise - CRUD']
 
-    @get(tags=exercise_controller_tag)
+    @get(tags=exercise_controller_tag, cache_control=cache_control(settings.cache_control_list))
     async def list_exercise(
             self,
+            request: Request,
             exercise_repo: ExerciseRepository,
             limit_offset: LimitOffset,
+            keyset: KeysetParams,
+            with_total: TotalMode,
+            include: Literal['steps'] | None = Parameter(query='include', default=None, required=False,
+                                                         description='`steps` embeds the steps of each exercise.'),
+    ) -> Response[CountedOffsetPagination[ExerciseDTO] | CountedOffsetPagination[ExerciseWithStepsDTO]
+                  | KeysetPagination[ExerciseDTO] | KeysetPagination[ExerciseWithStepsDTO]]:
+        """## List Exercise Items
+        Answers `304 Not Modified` while the `ETag` sent in `If-None-Match` is current.
+        """
+        # read before querying, so a write during the query can only make the tag older than the page
+        versions = [await exercise_repo.current_version()]
+        if include == 'steps':
+            versions.append(await ExerciseStepRepository(session=exercise_repo.session).current_version())
+        etag, last_modified = version_validators(*versions)
+        if is_not_modified(request, etag, last_modified):
+            return not_modified(etag, last_modified)
+        try:
+            columns = dto_columns(Exercise, ExerciseDTO)
+            if keyset.mode == 'cursor':
+                page = await list_keyset(exercise_repo, keyset.cursor, limit_offset.limit, columns=columns)
+            else:
+                page = await list_offset(exercise_repo, columns, limit_offset, with_total)
+            if include == 'steps':
+                await embed_steps(exercise_repo.session, page.items)
+            return json_response(page, headers=validator_headers(etag, last_modified))
+        except Exception as ex:
+            raise HTTPException(detail=str(ex), status_code=status_codes.HTTP_404_NOT_FOUND)
+
+    @get('/search', tags=exercise_controller_tag)
+    async def search_exercise(
+            self,
+            exercise_repo: ExerciseRepository,
+            limit_offset: LimitOffset,
+            q: str = Parameter(query='q', min_length=1, max_length=200,
+                               description='Words to look for in the name, tool tip and description, each '
+                                           'matches as a prefix.'),
     ) -> OffsetPagination[ExerciseDTO]:
-        """## List Exercise Items"""
+        """## Search Exercise Items
+        Items containing every word of `q`, best match first.
+        """
+        terms = search_terms(q)
         try:
-            order_by1 = OrderBy(field_name=Exercise.name)
-            results, total = await exercise_repo.list_and_count(limit_offset, order_by1)
-            type_adapter = TypeAdapter(list[ExerciseDTO])
+            results, total = await search_ranked(exercise_repo, terms, limit_offset)
             return OffsetPagination[ExerciseDTO](
-                items=type_adapter.validate_python(results),
+                items=list_adapter(ExerciseDTO).validate_python(results),
                 total=total,
                 limit=limit_offset.limit,
                 offset=limit_offset.offset,
@@ -61,16 +168,129 @@ class ExerciseController(Controller):
         except Exception as ex:
             raise HTTPException(detail=str(ex), status_code=status_codes.HTTP_404_NOT_FOUND)
 
-    @get('/details/{exercise_id: int}', tags=exercise_controller_tag)
+    @get('/changes', tags=exercise_controller_tag)
+    async def list_exercise_changes(
+            self,
+            exercise_repo: ExerciseRepository,
+            since: str | None = Parameter(query='since', default=None, required=False,
+                                          description='`next` of the previous call, leave out to start from the '
+                                                      'oldest row.'),
+            page_size: int = Parameter(query='pageSize', ge=1, le=1000, default=100, required=False),
+    ) -> Response[ChangesPage[ExerciseDTO]]:
+        """## Exercise Changes Since A Token
+        Items inserted, updated or deleted after `since`, oldest change first.
+        Deleted items come back as tombstones with `deleted` set and no `item`.
+        Send `next` as `since` on the following call, straight away while `more`
+        is true.
+        """
+        position = decode_since(since) if since else None
+        try:
+            page = await list_changes(exercise_repo.session, Exercise, dto_columns(Exercise, ExerciseDTO), position,
+                                      page_size, settings.changes_settle_seconds)
+            return json_response(page)
+        except Exception as ex:
+            raise HTTPException(detail=str(ex), status_code=status_codes.HTTP_404_NOT_FOUND)
+
+    @get('/export', tags=exercise_controller_tag)
+    async def export_exercise(
+            self,
+            db_read_engine: AsyncEngine,
+            export_format: ExportFormat = Parameter(query='format', default='ndjson', required=False,
+                                                    description='`ndjson` (one JSON object per line) or `csv`.'),
+            include: Literal['steps'] | None = Parameter(query='include', default=None, required=False,
+                                                         description='`steps` nests the steps of each exercise, '
+                                                                     'as a JSON array column in CSV.'),
+    ) -> Stream:
+        """## Export Every Exercise
+        Streams the whole table ordered by id, without paging.
+        """
+        statement = select(Exercise).order_by(Exercise.id)
+        if include == 'steps':
+            statement = statement.options(selectinload(Exercise.steps))
+        return export_stream(db_read_engine, statement, ExerciseWithStepsDTO if include == 'steps' else ExerciseDTO,
+                             export_format, 'exercise', settings.export_chunk_size)
+
+    @post('/import', tags=exercise_controller_tag, status_code=status_codes.HTTP_200_OK)
+    async def import_exercise(
+            self,
+            request: Request,
+            exercise_repo: ExerciseRepository,
+            import_format: ExportFormat | None = Parameter(
+                query='format', default=None, required=False,
+                description='`csv` or `ndjson`, taken from the content type or file name when left out.'),
+            mode: ImportMode = Parameter(query='mode', default='insert', required=False,
+                                         description='`upsert` updates the exercise with the same name, and the '
+                                                     'step with the same exercise and name, instead of adding one.'),
+            batch_size: int = Parameter(query='batchSize', ge=1, le=10_000, default=settings.import_batch_size,
+                                        required=False, description='Rows written per transaction.'),
+    ) -> ImportReport:
+        """## Import Exercises And Steps From A CSV Or NDJSON File
+        The file is sent as the raw body or as the first file of a multipart form,
+        and is read as it arrives. Exercise rows may carry an `id` that steps later
+        in the file use as their `exercise_id`. Rows that fail are listed in an
+        error file, the rest are written one batch per transaction.
+        """
+        media_type, options = request.content_type
+        if media_type == RequestEncodingType.MULTI_PART:
+            if 'boundary' not in options:
+                raise ClientException(detail='Expected a multipart/form-data body')
+            part: dict[str, str] = {}
+            chunks = multipart_file(request.stream(), options['boundary'], part)
+            # the format of a form upload comes from its file name, known once the first chunk is parsed
+            first = await anext(chunks, b'')
+            export_format = guess_format(import_format, None, part.get('filename'))
+
+            async def body() -> Any:
+                yield first
+                async for chunk in chunks:
+                    yield chunk
+        else:
+            export_format = guess_format(import_format, media_type, None)
+            body = request.stream
+        importer = Importer(exercise_repo, ExerciseStepRepository(session=exercise_repo.session), mode, batch_size)
+        return await importer.run(read_records(body(), export_format))
+
+    @get('/import/errors/{error_file:str}', tags=exercise_controller_tag)
+    async def get_import_errors(self, error_file: str) -> File:
+        """## Download The Error File Of An Import
+        The file is deleted once it was sent, files nobody downloads are kept for
+        `GYMMAN_IMPORT_ERRORS_TTL` seconds.
+        """
+        path = error_file_path(error_file)
+        if not await path.exists():
+            raise HTTPException(detail=f'No import error file {error_file!r}',
+                                status_code=status_codes.HTTP_404_NOT_FOUND)
+        return File(path=str(path), filename=error_file, media_type='application/x-ndjson',
+                    background=BackgroundTask(remove_error_file, error_file))
+
+    @get('/details/{exercise_id: int}', tags=exercise_controller_tag,
+         cache_control=cache_control(settings.cache_control_detail))
     async def get_exercise_details(self,
+                                   request: Request,
                                    exercise_repo: ExerciseRepository,
                                    exercise_id: int = Parameter(title='Exercise ID',
                                                                 description='Primary Key Of The Exercise To Update.', ),
-                                   ) -> ExerciseDTO:
-        """## Get Details Of An Exercise Record"""
+                                   include: Literal['steps'] | None = Parameter(
+                                       query='include', default=None, required=False,
+                                       description='`steps` embeds the steps of the exercise.'),
+                                   ) -> Response[ExerciseDTO | ExerciseWithStepsDTO]:
+        """## Get Details Of An Exercise Record
+        Answers `304 Not Modified` while the `ETag` sent in `If-None-Match` is current.
+        """
         try:
-            obj = await exercise_repo.get_one(id=exercise_id)
-            return ExerciseDTO.model_validate(obj)
+            if include == 'steps':
+                obj = await exercise_repo.get_one(id=exercise_id, statement=with_steps_statement(include))
+                etag, last_modified = row_validators(obj, *obj.steps)
+                # deleting a step changes the tag but not the newest updated_at
+                step_version = await ExerciseStepRepository(session=exercise_repo.session).current_version()
+                last_modified = max(last_modified, step_version.modified)
+            else:
+                obj = await exercise_repo.get_one(id=exercise_id)
+                etag, last_modified = row_validators(obj)
+            if is_not_modified(request, etag, last_modified):
+                return not_modified(etag, last_modified)
+            dto = ExerciseWithStepsDTO if include == 'steps' else ExerciseDTO
+            return Response(dto.model_validate(obj), headers=validator_headers(etag, last_modified))
         except Exception as ex:
             raise HTTPException(detail=str(ex), status_code=status_codes.HTTP_404_NOT_FOUND)
 
@@ -82,10 +302,39 @@ class ExerciseController(Controller):
             _data = data.model_dump(exclude_unset=True, by_alias=False, exclude_none=True)
             obj = await exercise_repo.add(Exercise(**_data))
             await exercise_repo.session.commit()
+            exercise_repo.detail_cache.invalidate(obj.id)
+            exercise_repo.version.bump()
+            exercise_repo.row_count.add(1)
             return ExerciseDTO.model_validate(obj)
         except Exception as ex:
             raise HTTPException(detail=str(ex), status_code=status_codes.HTTP_404_NOT_FOUND)
 
+    @post('/batch', tags=exercise_controller_tag)
+    async def create_exercise_batch(
+            self,
+            exercise_repo: ExerciseRepository,
+            data: list[dict[str, Any]] = Body(title='Exercises',
+                                              description='List of `ExerciseCreate` objects, all are written or none.'),
+    ) -> list[ExerciseDTO]:
+        """## Create Many Exercises In One Transaction
+        Every item is validated first, when any fails nothing is written and the
+        errors are reported with the index of the offending item.
+        """
+        items, errors = validate_items(ExerciseCreate, data)
+        raise_for_errors(errors)
+        try:
+            objs = await exercise_repo.add_many([
+                Exercise(**item.model_dump(exclude_unset=True, by_alias=False, exclude_none=True))
+                for item in items.values()
+            ])
+            await exercise_repo.session.commit()
+            exercise_repo.detail_cache.invalidate(*(obj.id for obj in objs))
+            exercise_repo.version.bump()
+            exercise_repo.row_count.add(len(objs))
+            return list_adapter(ExerciseDTO).validate_python(objs)
+        except Exception as ex:
+            raise HTTPException(detail=str(ex), status_code=status_codes.HTTP_404_NOT_FOUND)
+
     @put('/{exercise_id:int}', tags=exercise_controller_tag)
     async def update_exercise_put(
             self,
@@ -99,6 +348,8 @@ class ExerciseController(Controller):
             _data.update({'id': exercise_id})
             obj = await exercise_repo.update(Exercise(**_data))
             await exercise_repo.session.commit()
+            exercise_repo.detail_cache.invalidate(exercise_id)
+            exercise_repo.version.bump()
             return ExerciseCreate.model_validate(obj)
         except Exception as ex:
             raise HTTPException(detail=str(ex), status_code=status_codes.HTTP_404_NOT_FOUND)
@@ -116,10 +367,89 @@ class ExerciseController(Controller):
             _data.update({'id': exercise_id})
             obj = await exercise_repo.update(Exercise(**_data))
             await exercise_repo.session.commit()
+            exercise_repo.detail_cache.invalidate(exercise_id)
+            exercise_repo.version.bump()
             return ExerciseCreate.model_validate(obj)
         except Exception as ex:
             raise HTTPException(detail=str(ex), status_code=status_codes.HTTP_404_NOT_FOUND)
 
+    @patch('/batch', tags=exercise_controller_tag)
+    async def update_exercise_batch(
+            self,
+            exercise_repo: ExerciseRepository,
+            data: list[dict[str, Any]] = Body(title='Exercises',
+                                              description='List of `ExerciseUpdate` objects, all are written or none.'),
+    ) -> list[ExerciseDTO]:
+        """## Update Many Exercises In One Transaction
+        Only the fields present on an item are changed. Every item is validated
+        first, when any fails nothing is written and the errors are reported with
+        the index of the offending item.
+        """
+        items, errors = validate_items(ExerciseUpdate, data)
+        ids = {index: item.id for index, item in items.items()}
+        errors += duplicate_id_errors(ids)
+        errors += await missing_reference_errors(exercise_repo.session, Exercise.id, ids, 'id')
+        raise_for_errors(errors)
+        try:
+            # bulk UPDATE by primary key skips the ORM flush, so the audit timestamp is set here
+            updated_at = datetime.now(timezone.utc)
+            await exercise_repo.update_many([
+                {**item.model_dump(exclude_unset=True, exclude_none=True), 'updated_at': updated_at}
+                for item in items.values()
+            ])
+            await exercise_repo.session.commit()
+            exercise_repo.detail_cache.invalidate(*ids.values())
+            exercise_repo.version.bump()
+            return list_adapter(ExerciseDTO).validate_python(
+                await list_by_ids(exercise_repo, list(ids.values())))
+        except Exception as ex:
+            raise HTTPException(detail=str(ex), status_code=status_codes.HTTP_404_NOT_FOUND)
+
+    @post('/{exercise_id:int}/steps/reorder', tags=exercise_controller_tag, status_code=status_codes.HTTP_200_OK,
+          dependencies={'exercise_step_repo': Provide(provide_exercise_step_repo)})
+    async def reorder_exercise_steps(
+            self,
+            exercise_repo: ExerciseRepository,
+            exercise_step_repo: ExerciseStepRepository,
+            exercise_id: int = Parameter(title='Exercise ID', description='Primary Key Of The Exercise.', ),
+            data: list[dict[str, Any]] = Body(title='Moves',
+                                              description='List of `ExerciseStepMove` objects, applied in order, all '
+                                                          'or none.'),
+    ) -> list[ExerciseStepDTO]:
+        """## Reorder The Steps Of An Exercise
+        Each move puts one step `after` or `before` another step of the exercise,
+        or at `position` `first` or `last`. Usually only the moved step is
+        rewritten. Returns the steps in their new order.
+        """
+        moves, errors = validate_items(ExerciseStepMove, data)
+        raise_for_errors(errors)
+        try:
+            await exercise_repo.get_one(id=exercise_id)
+        except Exception as ex:
+            raise HTTPException(detail=str(ex), status_code=status_codes.HTTP_404_NOT_FOUND)
+        ordered = select(ExerciseStep.id, ExerciseStep.sort_order) \
+            .where(ExerciseStep.exercise_id == exercise_id) \
+            .order_by(ExerciseStep.sort_order, ExerciseStep.id)
+        steps = [tuple(row) for row in (await exercise_step_repo.session.execute(ordered)).all()]
+        keys, errors = apply_moves(steps, [moves[index] for index in sorted(moves)])
+        raise_for_errors(errors)
+        try:
+            if keys:
+                # bulk UPDATE by primary key skips the ORM flush, so the audit timestamp is set here
+                updated_at = datetime.now(timezone.utc)
+                await exercise_step_repo.update_many([
+                    {'id': step_id, 'sort_order': key, 'updated_at': updated_at} for step_id, key in keys.items()
+                ])
+                await exercise_step_repo.session.commit()
+                exercise_step_repo.detail_cache.invalidate(*keys)
+                exercise_step_repo.version.bump()
+            results = await exercise_step_repo.list(
+                ExerciseStep.exercise_id == exercise_id,
+                OrderBy(field_name=ExerciseStep.sort_order), OrderBy(field_name=ExerciseStep.id))
+            return list_adapter(ExerciseStepDTO).validate_python(results)
+        except Exception as ex:
+            raise HTTPException(detail=str(ex), status_code=status_codes.HTTP_404_NOT_FOUND)
+
     @delete('/delete/{exercise_ids:str}', tags=exercise_controller_tag)
     async def delete_exercise(
             self,
@@ -128,9 +458,14 @@ class ExerciseController(Controller):
                                           description='Comma Separated List Primary Key Of The Exercises to Delete.', ),
     ) -> None:
         """## Delete Exercise From The System"""
+        item_ids = parse_ids(exercise_ids)
         try:
-            _ = await exercise_repo.delete_many(exercise_ids.split(','))
+            deleted = await exercise_repo.delete_many(item_ids)
+            await record_deletions(exercise_repo.session, Exercise.__tablename__, [obj.id for obj in deleted])
             # _ = await exercise_repo.delete(exercise_id)
             await exercise_repo.session.commit()
+            exercise_repo.detail_cache.invalidate(*(obj.id for obj in deleted))
+            exercise_repo.version.bump()
+            exercise_repo.row_count.add(-len(deleted))
         except Exception as ex:
             raise HTTPException(detail=str(ex), status_code=status_codes.HTTP_404_NOT_FOUND)
@@ -1,36 +1,79 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Any
 
 from litestar.exceptions import HTTPException
 from litestar.pagination import OffsetPagination
-from litestar.repository.filters import OrderBy
 
-from litestar import get, status_codes
+from litestar import Request, Response, get, status_codes
 from litestar.contrib.sqlalchemy.repository import SQLAlchemyAsyncRepository
 from litestar.controller import Controller
 from litestar.di import Provide
 from litestar.handlers.http_handlers.decorators import delete, post, put, patch
-from litestar.params import Parameter
+from litestar.params import Body, Parameter
 from litestar.repository.filters import LimitOffset
-from pydantic import TypeAdapter
+from litestar.response import Stream
+from sqlalchemy import select
+
+from batch import (duplicate_id_errors, list_by_ids, missing_reference_errors, parse_ids, raise_for_errors,
+                   validate_items)
+from cache import ReadThroughCache, RowCounter, TableVersion
+from changes import ChangesPage, decode_since, list_changes, record_deletions, table_watermark
+from conditional import (cache_control, is_not_modified, not_modified, row_validators, validator_headers,
+                         version_validators)
+from database import session_for
+from export import ExportFormat, export_stream
+from ordering import assign_sort_keys
+from pagination import CountedOffsetPagination, KeysetPagination, KeysetParams, TotalMode, list_keyset, list_offset
+from search import search_ranked, search_terms
+from serialization import dto_columns, json_response, list_adapter
+from settings import settings
 
 if TYPE_CHECKING:
-    from sqlalchemy.ext.asyncio import AsyncSession
+    from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
 
-from models.exercise_step import ExerciseStep, ExerciseStepCreate, ExerciseStepDTO
+from models.exercise import Exercise
+from models.exercise_step import ExerciseStep, ExerciseStepCreate, ExerciseStepDTO, ExerciseStepUpdate
 from logger import logger
 
 
 class ExerciseStepRepository(SQLAlchemyAsyncRepository[ExerciseStep]):
     """Exercise Step repository"""
     model_type = ExerciseStep
+    detail_cache = ReadThroughCache('exercise_step', max_size=settings.cache_max_size, ttl=settings.cache_ttl,
+                                    enabled=settings.cache_enabled)
+    row_count = RowCounter('exercise_step', ttl=settings.count_ttl)
+    # workers of a multi-process server, and readers of a replica, read the version from the table with the data
+    version = TableVersion('exercise_step', shared=settings.shared_versions)
+
+    async def current_version(self) -> TableVersion:
+        """`version`, brought up to date with writes of other workers first when they share it."""
+        await self.version.refresh(lambda: table_watermark(self.session, self.model_type))
+        return self.version
+
+    async def get_one(self, auto_expunge: bool | None = None, statement: Any = None, **kwargs: Any) -> ExerciseStep:
+        """Serve primary key lookups through `detail_cache`, anything else goes to the database.
 
+        Other processes' writes never reach `detail_cache`, and a replica may not have the ones that did, so it is
+        skipped when `version` is shared.
+        """
+        # with a shared version, checking the cache against the table's watermark costs a query like the lookup
+        if statement is not None or set(kwargs) != {'id'} or self.version.shared:
+            return await super().get_one(auto_expunge=auto_expunge, statement=statement, **kwargs)
+        load = super().get_one
+        # cached instances are shared between requests, so they must not stay bound to this session
+        return await self.detail_cache.get_or_load(int(kwargs['id']), lambda: load(auto_expunge=True, **kwargs))
 
-async def provide_exercise_step_repo(db_session: AsyncSession) -> ExerciseStepRepository:
+
+async def provide_exercise_step_repo(request: Request, db_session: AsyncSession,
+                                     db_read_session: AsyncSession) -> ExerciseStepRepository:
     """This provides a simple example demonstrating how to override the join options
-    for the repository."""
-    return ExerciseStepRepository(session=db_session)
+    for the repository.
+
+    GET requests get a repository on the read pool, the others one on the primary.
+    """
+    return ExerciseStepRepository(session=session_for(request, db_session, db_read_session))
 
 
 class ExerciseStepController(Controller):
@@ -40,19 +83,49 @@ class ExerciseStepController(Controller):
     }
     exercise_step_controller_tag = ['Exercise Step - CRUD']
 
-    @get(tags=exercise_step_controller_tag)
+    @get(tags=exercise_step_controller_tag, cache_control=cache_control(settings.cache_control_list))
     async def list_exercise_step(
+            self,
+            request: Request,
+            exercise_step_repo: ExerciseStepRepository,
+            limit_offset: LimitOffset,
+            keyset: KeysetParams,
+            with_total: TotalMode,
+    ) -> Response[CountedOffsetPagination[ExerciseStepDTO] | KeysetPagination[ExerciseStepDTO]]:
+        """## List Exercise Step Items
+        Answers `304 Not Modified` while the `ETag` sent in `If-None-Match` is current.
+        """
+        # read before querying, so a write during the query can only make the tag older than the page
+        etag, last_modified = version_validators(await exercise_step_repo.current_version())
+        if is_not_modified(request, etag, last_modified):
+            return not_modified(etag, last_modified)
+        try:
+            columns = dto_columns(ExerciseStep, ExerciseStepDTO)
+            if keyset.mode == 'cursor':
+                page = await list_keyset(exercise_step_repo, keyset.cursor, limit_offset.limit, columns=columns)
+            else:
+                page = await list_offset(exercise_step_repo, columns, limit_offset, with_total)
+            return json_response(page, headers=validator_headers(etag, last_modified))
+        except Exception as ex:
+            raise HTTPException(detail=str(ex), status_code=status_codes.HTTP_404_NOT_FOUND)
+
+    @get('/search', tags=exercise_step_controller_tag)
+    async def search_exercise_step(
             self,
             exercise_step_repo: ExerciseStepRepository,
             limit_offset: LimitOffset,
+            q: str = Parameter(query='q', min_length=1, max_length=200,
+                               description='Words to look for in the name, tool tip and description, each '
+                                           'matches as a prefix.'),
     ) -> OffsetPagination[ExerciseStepDTO]:
-        """## List Exercise Step Items"""
+        """## Search Exercise Step Items
+        Items containing every word of `q`, best match first.
+        """
+        terms = search_terms(q)
         try:
-            order_by1 = OrderBy(field_name=ExerciseStep.name)
-            results, total = await exercise_step_repo.list_and_count(limit_offset, order_by1)
-            type_adapter = TypeAdapter(list[ExerciseStepDTO])
+            results, total = await search_ranked(exercise_step_repo, terms, limit_offset)
             return OffsetPagination[ExerciseStepDTO](
-                items=type_adapter.validate_python(results),
+                items=list_adapter(ExerciseStepDTO).validate_python(results),
                 total=total,
                 limit=limit_offset.limit,
                 offset=limit_offset.offset,
@@ -60,32 +133,113 @@ class ExerciseStepController(Controller):
         except Exception as ex:
             raise HTTPException(detail=str(ex), status_code=status_codes.HTTP_404_NOT_FOUND)
 
-    @get('/details/{exercise_step_id: int}', tags=exercise_step_controller_tag)
+    @get('/changes', tags=exercise_step_controller_tag)
+    async def list_exercise_step_changes(
+            self,
+            exercise_step_repo: ExerciseStepRepository,
+            since: str | None = Parameter(query='since', default=None, required=False,
+                                          description='`next` of the previous call, leave out to start from the '
+                                                      'oldest row.'),
+            page_size: int = Parameter(query='pageSize', ge=1, le=1000, default=100, required=False),
+    ) -> Response[ChangesPage[ExerciseStepDTO]]:
+        """## Exercise Step Changes Since A Token
+        Items inserted, updated or deleted after `since`, oldest change first.
+        Deleted items come back as tombstones with `deleted` set and no `item`.
+        Send `next` as `since` on the following call, straight away while `more`
+        is true.
+        """
+        position = decode_since(since) if since else None
+        try:
+            page = await list_changes(exercise_step_repo.session, ExerciseStep,
+                                      dto_columns(ExerciseStep, ExerciseStepDTO), position, page_size,
+                                      settings.changes_settle_seconds)
+            return json_response(page)
+        except Exception as ex:
+            raise HTTPException(detail=str(ex), status_code=status_codes.HTTP_404_NOT_FOUND)
+
+    @get('/export', tags=exercise_step_controller_tag)
+    async def export_exercise_step(
+            self,
+            db_read_engine: AsyncEngine,
+            export_format: ExportFormat = Parameter(query='format', default='ndjson', required=False,
+                                                    description='`ndjson` (one JSON object per line) or `csv`.'),
+    ) -> Stream:
+        """## Export Every Exercise Step
+        Streams the whole table ordered by id, without paging.
+        """
+        statement = select(ExerciseStep).order_by(ExerciseStep.id)
+        return export_stream(db_read_engine, statement, ExerciseStepDTO, export_format, 'exercise_step',
+                             settings.export_chunk_size)
+
+    @get('/details/{exercise_step_id: int}', tags=exercise_step_controller_tag,
+         cache_control=cache_control(settings.cache_control_detail))
     async def get_exercise_step_details(self,
+                                        request: Request,
                                         exercise_step_repo: ExerciseStepRepository,
                                         exercise_step_id: int = Parameter(title='Exercise ID',
                                                                           description='Primary Key Of The Exercise To '
                                                                                       'Update.', ),
-                                        ) -> ExerciseStepDTO:
-        """## Get Details Of An Exercise Step Record"""
+                                        ) -> Response[ExerciseStepDTO]:
+        """## Get Details Of An Exercise Step Record
+        Answers `304 Not Modified` while the `ETag` sent in `If-None-Match` is current.
+        """
         try:
             obj = await exercise_step_repo.get_one(id=exercise_step_id)
-            return ExerciseStepDTO.model_validate(obj)
+            etag, last_modified = row_validators(obj)
+            if is_not_modified(request, etag, last_modified):
+                return not_modified(etag, last_modified)
+            return Response(ExerciseStepDTO.model_validate(obj), headers=validator_headers(etag, last_modified))
         except Exception as ex:
             raise HTTPException(detail=str(ex), status_code=status_codes.HTTP_404_NOT_FOUND)
 
     @post(tags=exercise_step_controller_tag)
     async def create_exercise_step(self, exercise_step_repo: ExerciseStepRepository,
                                    data: ExerciseStepCreate, ) -> ExerciseStepDTO:
-        """## Create A New Exercise Step"""
+        """## Create A New Exercise Step
+        Without a `sort_order` the step goes after the last step of its exercise.
+        """
         try:
+            await assign_sort_keys(exercise_step_repo.session, [data])
             _data = data.model_dump(exclude_unset=True, by_alias=False, exclude_none=True)
             obj = await exercise_step_repo.add(ExerciseStep(**_data))
             await exercise_step_repo.session.commit()
+            exercise_step_repo.detail_cache.invalidate(obj.id)
+            exercise_step_repo.version.bump()
+            exercise_step_repo.row_count.add(1)
             return ExerciseStepDTO.model_validate(obj)
         except Exception as ex:
             raise HTTPException(detail=str(ex), status_code=status_codes.HTTP_404_NOT_FOUND)
 
+    @post('/batch', tags=exercise_step_controller_tag)
+    async def create_exercise_step_batch(
+            self,
+            exercise_step_repo: ExerciseStepRepository,
+            data: list[dict[str, Any]] = Body(title='Exercise Steps',
+                                              description='List of `ExerciseStepCreate` objects, all are written '
+                                                          'or none.'),
+    ) -> list[ExerciseStepDTO]:
+        """## Create Many Exercise Steps In One Transaction
+        Every item is validated first, when any fails nothing is written and the
+        errors are reported with the index of the offending item.
+        """
+        items, errors = validate_items(ExerciseStepCreate, data)
+        exercise_ids = {index: item.exercise_id for index, item in items.items()}
+        errors += await missing_reference_errors(exercise_step_repo.session, Exercise.id, exercise_ids, 'exercise_id')
+        raise_for_errors(errors)
+        try:
+            await assign_sort_keys(exercise_step_repo.session, list(items.values()))
+            objs = await exercise_step_repo.add_many([
+                ExerciseStep(**item.model_dump(exclude_unset=True, by_alias=False, exclude_none=True))
+                for item in items.values()
+            ])
+            await exercise_step_repo.session.commit()
+            exercise_step_repo.detail_cache.invalidate(*(obj.id for obj in objs))
+            exercise_step_repo.version.bump()
+            exercise_step_repo.row_count.add(len(objs))
+            return list_adapter(ExerciseStepDTO).validate_python(objs)
+        except Exception as ex:
+            raise HTTPException(detail=str(ex), status_code=status_codes.HTTP_404_NOT_FOUND)
+
     @put('/{exercise_step_id:int}', tags=exercise_step_controller_tag)
     async def update_exercise_step_put(
             self,
@@ -100,6 +254,8 @@ class ExerciseStepController(Controller):
             _data.update({'id': exercise_step_id})
             obj = await exercise_step_repo.update(ExerciseStep(**_data))
             await exercise_step_repo.session.commit()
+            exercise_step_repo.detail_cache.invalidate(exercise_step_id)
+            exercise_step_repo.version.bump()
             return ExerciseStepCreate.model_validate(obj)
         except Exception as ex:
             print('error')
@@ -120,12 +276,49 @@ class ExerciseStepController(Controller):
             _data.update({'id': exercise_step_id})
             obj = await exercise_step_repo.update(ExerciseStep(**_data))
             await exercise_step_repo.session.commit()
+            exercise_step_repo.detail_cache.invalidate(exercise_step_id)
+            exercise_step_repo.version.bump()
             return ExerciseStepCreate.model_validate(obj)
         except Exception as ex:
             print('error')
             print(ex)
             raise HTTPException(detail=str(ex), status_code=status_codes.HTTP_404_NOT_FOUND)
 
+    @patch('/batch', tags=exercise_step_controller_tag)
+    async def update_exercise_step_batch(
+            self,
+            exercise_step_repo: ExerciseStepRepository,
+            data: list[dict[str, Any]] = Body(title='Exercise Steps',
+                                              description='List of `ExerciseStepUpdate` objects, all are written '
+                                                          'or none.'),
+    ) -> list[ExerciseStepDTO]:
+        """## Update Many Exercise Steps In One Transaction
+        Only the fields present on an item are changed. Every item is validated
+        first, when any fails nothing is written and the errors are reported with
+        the index of the offending item.
+        """
+        items, errors = validate_items(ExerciseStepUpdate, data)
+        ids = {index: item.id for index, item in items.items()}
+        errors += duplicate_id_errors(ids)
+        errors += await missing_reference_errors(exercise_step_repo.session, ExerciseStep.id, ids, 'id')
+        exercise_ids = {index: item.exercise_id for index, item in items.items()}
+        errors += await missing_reference_errors(exercise_step_repo.session, Exercise.id, exercise_ids, 'exercise_id')
+        raise_for_errors(errors)
+        try:
+            # bulk UPDATE by primary key skips the ORM flush, so the audit timestamp is set here
+            updated_at = datetime.now(timezone.utc)
+            await exercise_step_repo.update_many([
+                {**item.model_dump(exclude_unset=True, exclude_none=True), 'updated_at': updated_at}
+                for item in items.values()
+            ])
+            await exercise_step_repo.session.commit()
+            exercise_step_repo.detail_cache.invalidate(*ids.values())
+            exercise_step_repo.version.bump()
+            return list_adapter(ExerciseStepDTO).validate_python(
+                await list_by_ids(exercise_step_repo, list(ids.values())))
+        except Exception as ex:
+            raise HTTPException(detail=str(ex), status_code=status_codes.HTTP_404_NOT_FOUND)
+
     @delete('/delete/{exercise_step_ids:str}', tags=exercise_step_controller_tag)
     async def delete_exercise(
             self,
@@ -134,8 +327,13 @@ class ExerciseStepController(Controller):
                                                description='Comma Separated List Primary Key Of The Exercises to Delete.', ),
     ) -> None:
         """## Delete Exercise Step From The System"""
+        item_ids = parse_ids(exercise_step_ids)
         try:
-            _ = await exercise_step_repo.delete_many(exercise_step_ids.split(','))
+            deleted = await exercise_step_repo.delete_many(item_ids)
+            await record_deletions(exercise_step_repo.session, ExerciseStep.__tablename__, [obj.id for obj in deleted])
             await exercise_step_repo.session.commit()
+            exercise_step_repo.detail_cache.invalidate(*(obj.id for obj in deleted))
+            exercise_step_repo.version.bump()
+            exercise_step_repo.row_count.add(-len(deleted))
         except Exception as ex:
             raise HTTPException(detail=str(ex), status_code=status_codes.HTTP_404_NOT_FOUND)
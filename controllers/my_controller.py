@@ -1,11 +1,16 @@
+import os
 from typing import Annotated
 
-import anyio
-from litestar import Controller, post, get
+from litestar import Controller, Request, post, get
 from litestar.datastructures import UploadFile
 from litestar.enums import RequestEncodingType
+from litestar.exceptions import ClientException
 from litestar.params import Body, Parameter
 
+from controllers.exercise_controller import ExerciseRepository
+from controllers.exercise_step_controller import ExerciseStepRepository
+from uploads import save_multipart_stream, save_upload_files
+
 
 class MyAPIController(Controller):
     """
@@ -28,13 +33,40 @@ class MyAPIController(Controller):
 
         **list of uploaded files**
         """
-        file_names: list[str] = []
-        for file in data:
-            content = await file.read()
-            await anyio.Path(file.filename).write_bytes(content)
-            file_names.append(file.filename)
+        stored = await save_upload_files(data)
+        return [file.filename for file in stored]
+
+    @post(path="/upload-file-stream", tags=['My Tag'])
+    async def handle_file_upload_stream(self, request: Request) -> list[str]:
+        """
+        ### Streaming file upload
+        Same form and response as `/upload-file`, but the multipart body is parsed
+        as it arrives and every file is written to disk chunk by chunk, so memory
+        use stays flat no matter how large the files are.
+
+        return:
+
+        **list of uploaded files**
+        """
+        media_type, options = request.content_type
+        if media_type != RequestEncodingType.MULTI_PART or 'boundary' not in options:
+            raise ClientException(detail='Expected a multipart/form-data body')
+        stored = await save_multipart_stream(request.stream(), options['boundary'])
+        return [file.filename for file in stored]
 
-        return file_names
+    @get(path='/cache-stats')
+    async def cache_stats(self) -> dict[str, dict[str, int]]:
+        """
+        ### Detail cache counters
+        hits, misses, evictions and current size of each read-through cache, and
+        the kept row count of each table with how often it was counted, all of
+        them for the worker process (`worker.pid`) that answered
+        """
+        caches = (ExerciseRepository.detail_cache, ExerciseStepRepository.detail_cache)
+        counters = (ExerciseRepository.row_count, ExerciseStepRepository.row_count)
+        return {'worker': {'pid': os.getpid()},
+                **{cache.name: cache.stats() for cache in caches},
+                **{f'{counter.name}_row_count': counter.stats() for counter in counters}}
 
     @get(path='/sample/{variable:str}')
     async def display_variable(self, variable: str) -> str:
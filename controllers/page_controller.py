@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+from litestar import Request, Response, get, status_codes
+from litestar.controller import Controller
+from litestar.di import Provide
+from litestar.exceptions import HTTPException
+from litestar.repository.filters import LimitOffset
+
+from controllers.exercise_controller import ExerciseRepository, provide_exercise_repo, with_steps_statement
+from controllers.exercise_step_controller import ExerciseStepRepository
+from models.exercise import Exercise, ExerciseDTO
+from models.exercise_step import ExerciseWithStepsDTO
+from pagination import list_offset
+from rendering import is_htmx, page_response, render
+from serialization import dto_columns
+
+
+class PageController(Controller):
+    """
+    server-rendered HTML pages, a request sent by HTMX (`HX-Request`) gets only the changing fragment
+    """
+
+    path = '/pages'
+    include_in_schema = False
+    dependencies = {
+        'exercise_repo': Provide(provide_exercise_repo),
+    }
+
+    @get('/exercises')
+    async def exercise_list_page(self, request: Request, exercise_repo: ExerciseRepository,
+                                 limit_offset: LimitOffset) -> Response[bytes]:
+        """## Exercise List Page"""
+        fragment = is_htmx(request)
+        # read before querying, so a write during the query can only make the key older than the page
+        version = await exercise_repo.current_version()
+
+        async def renderer() -> bytes:
+            page = await list_offset(exercise_repo, dto_columns(Exercise, ExerciseDTO), limit_offset, 'estimated')
+            template = 'exercise_list.fragment.mako.html' if fragment else 'exercise_list.mako.html'
+            return render(request, template, page=page, current_page=limit_offset.offset // limit_offset.limit + 1)
+
+        return await page_response(('exercise_list', fragment, version.tag, limit_offset.limit, limit_offset.offset),
+                                   renderer)
+
+    @get('/exercises/{exercise_id:int}')
+    async def exercise_detail_page(self, request: Request, exercise_repo: ExerciseRepository,
+                                   exercise_id: int) -> Response[bytes]:
+        """## Exercise Detail Page"""
+        fragment = is_htmx(request)
+        versions = (await exercise_repo.current_version(),
+                    await ExerciseStepRepository(session=exercise_repo.session).current_version())
+
+        async def renderer() -> bytes:
+            try:
+                obj = await exercise_repo.get_one(id=exercise_id, statement=with_steps_statement('steps'))
+            except Exception as ex:
+                raise HTTPException(detail=str(ex), status_code=status_codes.HTTP_404_NOT_FOUND)
+            template = 'exercise_detail.fragment.mako.html' if fragment else 'exercise_detail.mako.html'
+            return render(request, template, exercise=ExerciseWithStepsDTO.model_validate(obj))
+
+        return await page_response(('exercise_detail', fragment, *(version.tag for version in versions), exercise_id),
+                                   renderer)
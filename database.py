@@ -0,0 +1,152 @@
+"""
+SQLAlchemy engine profiles, picked from the scheme of ``settings.database_url``
+
+Writes go through the engine of the plugin config. GET requests read through
+a separate pool from `create_read_engine`, so a long write transaction, or
+writers queueing behind it, can not hold every connection the reads need.
+"""
+from __future__ import annotations
+
+from dataclasses import replace
+from typing import Any, AsyncGenerator, Callable
+
+from litestar import Request
+from litestar.contrib.sqlalchemy.plugins import AsyncSessionConfig, EngineConfig, SQLAlchemyAsyncConfig
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from changes import track_revisions
+from settings import Settings
+
+READ_METHODS = frozenset({'GET', 'HEAD'})
+
+
+def is_sqlite(url: str) -> bool:
+    return make_url(url).get_backend_name() == 'sqlite'
+
+
+def _is_memory_sqlite(url: str) -> bool:
+    return make_url(url).database in (None, '', ':memory:')
+
+
+def engine_config_for(settings: Settings) -> EngineConfig:
+    """Pool and driver options of the profile ``settings.database_url`` selects."""
+    url = settings.database_url
+    if is_sqlite(url):
+        if _is_memory_sqlite(url):
+            # every connection to :memory: is a new empty database, keep the driver default
+            return EngineConfig()
+        # reuse connections instead of opening a file (and an aiosqlite thread) per request
+        return EngineConfig(poolclass=AsyncAdaptedQueuePool, pool_size=settings.db_pool_size,
+                            max_overflow=settings.db_max_overflow, pool_timeout=settings.db_pool_timeout)
+    connect_args: dict[str, Any] = {}
+    if make_url(url).get_driver_name() == 'asyncpg':
+        connect_args['prepared_statement_cache_size'] = settings.db_statement_cache_size
+    return EngineConfig(
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout,
+        pool_recycle=settings.db_pool_recycle,
+        pool_pre_ping=settings.db_pool_pre_ping,
+        connect_args=connect_args,
+    )
+
+
+def sqlite_pragmas(settings: Settings, read_only: bool = False) -> list[str]:
+    """Per-connection pragmas of the SQLite profile, ``read_only`` ones for the reader pool."""
+    if read_only:
+        # journal_mode is a property of the file, the primary sets it
+        return [
+            'PRAGMA query_only=ON',
+            f'PRAGMA busy_timeout={int(settings.sqlite_busy_timeout)}',
+            f'PRAGMA mmap_size={int(settings.sqlite_mmap_size)}',
+        ]
+    return [
+        f'PRAGMA journal_mode={settings.sqlite_journal_mode}',
+        f'PRAGMA synchronous={settings.sqlite_synchronous}',
+        f'PRAGMA busy_timeout={int(settings.sqlite_busy_timeout)}',
+        f'PRAGMA mmap_size={int(settings.sqlite_mmap_size)}',
+    ]
+
+
+def _set_pragmas_on_connect(engine: AsyncEngine, pragmas: list[str]) -> None:
+    @event.listens_for(engine.sync_engine, 'connect')
+    def _set_sqlite_pragmas(dbapi_connection: Any, _: Any) -> None:
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+
+def create_sqlalchemy_config(settings: Settings) -> SQLAlchemyAsyncConfig:
+    """Build the plugin config with its engine created once, so event hooks can be attached to it."""
+    config = SQLAlchemyAsyncConfig(
+        connection_string=settings.database_url,
+        session_config=AsyncSessionConfig(expire_on_commit=False),
+        engine_config=engine_config_for(settings),
+    )
+    # get_engine() builds a new engine on every call unless one is pinned
+    config.engine_instance = config.get_engine()
+    # the shared table versions read the revisions these writes increment
+    track_revisions()
+    if is_sqlite(settings.database_url):
+        _set_pragmas_on_connect(config.engine_instance, sqlite_pragmas(settings))
+    return config
+
+
+def create_read_engine(settings: Settings, primary: AsyncEngine) -> AsyncEngine:
+    """Engine of the read pool, or ``primary`` itself when there is nothing to split.
+
+    PostgreSQL reads from ``settings.database_read_url`` (a replica) in read
+    only transactions, and from the primary when it is unset. SQLite gets a
+    second pool of query-only connections to the same file, which WAL lets
+    read while a write is in progress. An in-memory SQLite database only
+    exists on the primary's connections.
+    """
+    url = settings.database_read_url or settings.database_url
+    if not settings.db_read_pool_enabled:
+        return primary
+    if is_sqlite(url):
+        if _is_memory_sqlite(url):
+            return primary
+    elif not settings.database_read_url:
+        return primary
+    read_settings = replace(settings, database_url=url, db_pool_size=settings.db_read_pool_size)
+    engine_config = engine_config_for(read_settings)
+    if not is_sqlite(url):
+        engine_config.execution_options = {'postgresql_readonly': True}
+    engine = SQLAlchemyAsyncConfig(connection_string=url, engine_config=engine_config).get_engine()
+    if is_sqlite(url):
+        _set_pragmas_on_connect(engine, sqlite_pragmas(read_settings, read_only=True))
+    return engine
+
+
+def session_for(request: Request[Any, Any, Any], db_session: AsyncSession,
+                db_read_session: AsyncSession) -> AsyncSession:
+    """``db_read_session`` for the requests that only read (GET and HEAD), the primary's ``db_session`` otherwise."""
+    return db_read_session if request.method in READ_METHODS else db_session
+
+
+def read_engine_provider(engine: AsyncEngine) -> Callable[[], AsyncEngine]:
+    """``db_read_engine`` dependency, for the reads that stream through a session of their own like the exports."""
+
+    def provide_read_engine() -> AsyncEngine:
+        return engine
+
+    return provide_read_engine
+
+
+def read_session_provider(engine: AsyncEngine) -> Callable[[], AsyncGenerator[AsyncSession, None]]:
+    """``db_read_session`` dependency: a session on ``engine``, closed with the request.
+
+    Nothing is committed, the transaction only reads.
+    """
+    session_maker = async_sessionmaker(engine, expire_on_commit=False)
+
+    async def provide_read_session() -> AsyncGenerator[AsyncSession, None]:
+        async with session_maker() as session:
+            yield session
+
+    return provide_read_session
@@ -0,0 +1,422 @@
+"""
+streaming CSV/NDJSON import of exercises and steps
+"""
+from __future__ import annotations
+
+import csv
+import json
+import re
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Literal, Optional
+
+import anyio
+from litestar.exceptions import ClientException, NotFoundException
+from pydantic import TypeAdapter, ValidationError
+from sqlalchemy import insert, select, tuple_
+
+from batch import in_chunks, missing_reference_errors
+from export import ExportFormat
+from models.exercise import Exercise, ExerciseCreate
+from models.exercise_step import ExerciseStep, ExerciseStepCreate
+from ordering import assign_sort_keys
+from settings import settings
+from uploads import MultipartStreamParser, PartEnd, PartStart
+
+ImportMode = Literal['insert', 'upsert']
+
+_EXTENSIONS: dict[str, ExportFormat] = {'.csv': 'csv', '.ndjson': 'ndjson', '.jsonl': 'ndjson'}
+_MEDIA_TYPES: dict[str, ExportFormat] = {'text/csv': 'csv', 'application/x-ndjson': 'ndjson',
+                                         'application/jsonl': 'ndjson'}
+_ERROR_FILE = re.compile(r'import-errors-[0-9a-f]{32}\.ndjson')
+
+# errors returned in the response, the error file has all of them
+MAX_REPORTED_ERRORS = 20
+
+
+@dataclass
+class ImportReport:
+    """Outcome of an import."""
+
+    rows: int = 0
+    """Exercise and step rows read from the file."""
+    inserted: int = 0
+    updated: int = 0
+    failed: int = 0
+    """Exercise and step records not written, each nested step counts on its own."""
+    seconds: float = 0.0
+    rows_per_second: float = 0.0
+    error_file: Optional[str] = None
+    """Name of the NDJSON file with one line per failed row, ``None`` when every row was imported."""
+    errors: list[dict[str, Any]] = field(default_factory=list)
+    """The first errors, each with the ``row`` number, the ``key`` at fault and a ``message``."""
+
+
+@dataclass
+class _Row:
+    row: int
+    kind: Literal['exercise', 'step']
+    item: Any
+    key: Any = None
+    """File-local key of an exercise, steps refer to it through ``parent``."""
+    parent: Any = None
+
+
+async def multipart_file(stream: AsyncIterator[bytes], boundary: str, part: dict[str, str]) -> AsyncIterator[bytes]:
+    """Bytes of the first file in a multipart body, its name is stored in ``part['filename']``."""
+    parser = MultipartStreamParser(boundary)
+    in_file = done = False
+    async for data in stream:
+        for event in parser.feed(data):
+            if isinstance(event, PartStart):
+                in_file = bool(event.filename) and not done
+                if in_file:
+                    part['filename'] = event.filename
+            elif isinstance(event, PartEnd):
+                done = done or in_file
+                in_file = False
+            elif in_file:
+                yield event
+    if not parser.complete:
+        raise ClientException(detail='Truncated multipart body')
+
+
+def guess_format(explicit: ExportFormat | None, media_type: str | None, filename: str | None) -> ExportFormat:
+    """The ``format`` parameter if given, else the upload's content type or file extension."""
+    if explicit:
+        return explicit
+    if media_type in _MEDIA_TYPES:
+        return _MEDIA_TYPES[media_type]
+    suffix = anyio.Path(filename or '').suffix.lower()
+    if suffix in _EXTENSIONS:
+        return _EXTENSIONS[suffix]
+    raise ClientException(detail='Can not tell the upload format, pass format=csv or format=ndjson')
+
+
+def error_file_path(name: str) -> anyio.Path:
+    """Location of an import's error file, only names `Importer` generates are accepted."""
+    if not _ERROR_FILE.fullmatch(name):
+        raise NotFoundException(detail=f'No import error file {name!r}')
+    return anyio.Path(settings.upload_dir) / name
+
+
+async def remove_error_file(name: str) -> None:
+    """Delete an error file once it was downloaded."""
+    await error_file_path(name).unlink(missing_ok=True)
+
+
+async def prune_error_files(ttl: float) -> None:
+    """Delete the error files older than ``ttl`` seconds that were never downloaded."""
+    cutoff = time.time() - ttl
+    async for path in anyio.Path(settings.upload_dir).glob('import-errors-*.ndjson'):
+        if _ERROR_FILE.fullmatch(path.name) and (await path.stat()).st_mtime < cutoff:
+            await path.unlink(missing_ok=True)
+
+
+async def _lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    pending = b''
+    async for chunk in chunks:
+        *lines, pending = (pending + chunk).split(b'\n')
+        for line in lines:
+            yield line
+    if pending:
+        yield pending
+
+
+async def read_records(chunks: AsyncIterator[bytes], export_format: ExportFormat,
+                       ) -> AsyncIterator[tuple[int, dict[str, Any] | None, str | None]]:
+    """Parse the upload as it arrives into (row number, fields, error) tuples.
+
+    CSV rows are numbered from the first line after the header, NDJSON rows by
+    line. Empty CSV cells are left out, so the model defaults apply.
+    """
+    header: list[str] | None = None
+    parts: list[str] = []
+    row = 0
+    async for raw in _lines(chunks):
+        try:
+            line = raw.decode('utf-8-sig' if header is None and not row else 'utf-8').rstrip('\r')
+        except UnicodeDecodeError:
+            row += 1
+            yield row, None, 'Row is not valid UTF-8'
+            continue
+        if export_format == 'ndjson':
+            row += 1
+            if not line.strip():
+                continue
+            try:
+                data = json.loads(line)
+            except ValueError as ex:
+                yield row, None, f'Invalid JSON: {ex}'
+                continue
+            yield (row, data, None) if isinstance(data, dict) else (row, None, 'Row is not a JSON object')
+            continue
+        # a quoted CSV field may span lines, wait until its closing quote has arrived
+        parts.append(line)
+        record = '\n'.join(parts)
+        if record.count('"') % 2:
+            continue
+        parts = []
+        fields = next(csv.reader([record]), [])
+        if header is None:
+            header = [name.strip() for name in fields]
+            continue
+        if not any(fields):
+            continue
+        row += 1
+        if len(fields) != len(header):
+            yield row, None, f'Expected {len(header)} fields, got {len(fields)}'
+            continue
+        yield row, {name: value for name, value in zip(header, fields) if value != ''}, None
+    if parts:
+        yield row + 1, None, 'Unterminated quoted field'
+
+
+# numeric local keys are compared as integers, so "05" and 5.0 match 5
+_EXERCISE_ID = TypeAdapter(int)
+
+
+def _local_key(value: Any) -> tuple[str, str]:
+    """File-local key of an exercise ``id`` or a step ``exercise_id``, any string that is not a number stays as is."""
+    try:
+        return 'id', str(_EXERCISE_ID.validate_python(value))
+    except ValidationError:
+        return 'id', str(value).strip()
+
+
+def _validation_errors(row: int, ex: ValidationError) -> list[dict[str, Any]]:
+    return [{'row': row, 'key': '.'.join(str(part) for part in error['loc']) or None, 'message': error['msg']}
+            for error in ex.errors()]
+
+
+class Importer:
+    """Validate rows and write them in batches, one transaction per batch.
+
+    An exercise row may carry an ``id``; it is only used inside the file, steps
+    whose ``exercise_id`` matches it are attached to the exercise it created or
+    updated. Any other ``exercise_id`` must exist in the database. Exercises
+    have to come before the steps that refer to them. A ``type`` field of
+    ``exercise`` or ``step`` says what a row is, without it rows with an
+    ``exercise_id`` are steps. NDJSON exercises may also nest their steps in a
+    ``steps`` list, the way ``/exercise/export?include=steps`` writes them.
+
+    In ``upsert`` mode an exercise whose name exists is updated instead of
+    inserted, and so is a step with the same exercise and name.
+    """
+
+    def __init__(self, exercise_repo: Any, step_repo: Any, mode: ImportMode, batch_size: int) -> None:
+        self.exercise_repo = exercise_repo
+        self.step_repo = step_repo
+        self.session = exercise_repo.session
+        self.mode = mode
+        self.batch_size = batch_size
+        self.report = ImportReport()
+        # file-local exercise key -> database id, and keys whose exercise was not imported
+        self._exercise_ids: dict[Any, int] = {}
+        self._failed_keys: set[Any] = set()
+        # keys of every exercise read so far, a step's exercise_id naming one of them is not a database id
+        self._local_keys: set[Any] = set()
+        self._pending: list[_Row] = []
+        self._error_file: Any = None
+
+    async def run(self, records: AsyncIterator[tuple[int, dict[str, Any] | None, str | None]]) -> ImportReport:
+        started = time.perf_counter()
+        try:
+            async for row, data, error in records:
+                if error is not None:
+                    self.report.rows += 1
+                    await self._fail([{'row': row, 'key': None, 'message': error}])
+                    continue
+                await self._add(row, data)
+                if len(self._pending) >= self.batch_size:
+                    await self._flush()
+            await self._flush()
+        finally:
+            if self._error_file is not None:
+                await self._error_file.aclose()
+        self.report.seconds = round(time.perf_counter() - started, 3)
+        self.report.rows_per_second = round(self.report.rows / self.report.seconds, 1) if self.report.seconds else 0.0
+        return self.report
+
+    async def _add(self, row: int, data: dict[str, Any]) -> None:
+        self.report.rows += 1
+        kind = data.pop('type', None) or ('step' if data.get('exercise_id') is not None else 'exercise')
+        if kind not in ('exercise', 'step'):
+            await self._fail([{'row': row, 'key': 'type', 'message': f'Unknown row type {kind!r}'}])
+            return
+        if kind == 'step':
+            parent = _local_key(data.get('exercise_id'))
+            local = parent in self._local_keys
+            try:
+                # a local key may be any string, the database id is filled in by _resolve_parents
+                item = ExerciseStepCreate.model_validate({**data, 'exercise_id': 0} if local else data)
+            except ValidationError as ex:
+                await self._fail(_validation_errors(row, ex))
+                return
+            self._pending.append(_Row(row, 'step', item, parent=parent if local else ('id', str(item.exercise_id))))
+            return
+
+        steps = data.pop('steps', None) or []
+        if isinstance(steps, str):
+            # CSV exports carry the nested steps as a JSON array
+            try:
+                steps = json.loads(steps)
+            except ValueError as ex:
+                await self._fail([{'row': row, 'key': 'steps', 'message': f'Invalid JSON: {ex}'}])
+                steps = []
+        if not isinstance(steps, list):
+            await self._fail([{'row': row, 'key': 'steps', 'message': 'steps is not a list'}])
+            steps = []
+        key = _local_key(data['id']) if data.get('id') not in (None, '') else ('row', row)
+        self._local_keys.add(key)
+        try:
+            item = ExerciseCreate.model_validate(data)
+        except ValidationError as ex:
+            self._failed_keys.add(key)
+            await self._fail(_validation_errors(row, ex))
+            item = None
+        if item is not None:
+            self._pending.append(_Row(row, 'exercise', item, key=key))
+        for index, step in enumerate(steps):
+            self.report.rows += 1
+            if not isinstance(step, dict):
+                await self._fail([{'row': row, 'key': f'steps.{index}', 'message': 'Step is not an object'}])
+                continue
+            try:
+                step_item = ExerciseStepCreate.model_validate({**step, 'exercise_id': 0})
+            except ValidationError as ex:
+                await self._fail([{**error, 'key': f'steps.{index}.{error["key"]}'}
+                                  for error in _validation_errors(row, ex)])
+                continue
+            self._pending.append(_Row(row, 'step', step_item, parent=key))
+
+    async def _flush(self) -> None:
+        if not self._pending:
+            return
+        rows, self._pending = self._pending, []
+        exercises = [row for row in rows if row.kind == 'exercise']
+        steps = [row for row in rows if row.kind == 'step']
+        try:
+            exercise_ids, inserted, updated = await self._write_exercises(exercises)
+            steps = await self._resolve_parents(steps, exercise_ids)
+            step_ids, step_inserted, step_updated = await self._write_steps(steps)
+            await self.session.commit()
+        except Exception as ex:
+            await self.session.rollback()
+            self._failed_keys.update(row.key for row in exercises)
+            await self._fail([{'row': row.row, 'key': None, 'message': f'Batch not written: {ex}'}
+                              for row in exercises + steps], records=len(exercises) + len(steps))
+            return
+        self._exercise_ids.update(exercise_ids)
+        self.report.inserted += inserted + step_inserted
+        self.report.updated += updated + step_updated
+        self.exercise_repo.detail_cache.invalidate(*exercise_ids.values())
+        self.exercise_repo.version.bump()
+        self.step_repo.detail_cache.invalidate(*step_ids)
+        self.step_repo.version.bump()
+        self.exercise_repo.row_count.add(inserted)
+        self.step_repo.row_count.add(step_inserted)
+
+    async def _write_exercises(self, rows: list[_Row]) -> tuple[dict[Any, int], int, int]:
+        existing: dict[str, int] = {}
+        if self.mode == 'upsert':
+            for chunk in in_chunks(sorted({row.item.name for row in rows})):
+                statement = select(Exercise.name, Exercise.id).where(Exercise.name.in_(chunk)).order_by(Exercise.id)
+                for name, exercise_id in (await self.session.execute(statement)).all():
+                    existing.setdefault(name, exercise_id)
+        groups, inserted, updated = await self._write(self.exercise_repo, Exercise, rows,
+                                                      lambda item: existing.get(item.name), lambda item: item.name)
+        return {row.key: row_id for row_id, group in groups for row in group}, inserted, updated
+
+    async def _resolve_parents(self, rows: list[_Row], batch_ids: dict[Any, int]) -> list[_Row]:
+        """Point each step at its exercise's database id, failing the steps whose exercise is missing."""
+        resolved: list[_Row] = []
+        database_refs: dict[int, int] = {}
+        errors: list[dict[str, Any]] = []
+        for row in rows:
+            exercise_id = batch_ids.get(row.parent) or self._exercise_ids.get(row.parent)
+            if exercise_id is not None:
+                row.item.exercise_id = exercise_id
+            elif row.parent in self._failed_keys or row.parent[0] == 'row':
+                errors.append({'row': row.row, 'key': 'exercise_id',
+                               'message': 'The exercise of this step was not imported'})
+                continue
+            else:
+                database_refs[len(resolved)] = row.item.exercise_id
+            resolved.append(row)
+        missing = await missing_reference_errors(self.session, Exercise.id, database_refs, 'exercise_id')
+        errors += [{'row': resolved[error['index']].row, 'key': error['key'], 'message': error['message']}
+                   for error in missing]
+        # one error per failed step
+        await self._fail(errors, records=len(errors))
+        missing_indexes = {error['index'] for error in missing}
+        return [row for index, row in enumerate(resolved) if index not in missing_indexes]
+
+    async def _write_steps(self, rows: list[_Row]) -> tuple[list[int], int, int]:
+        existing: dict[tuple[int, str], int] = {}
+        if self.mode == 'upsert':
+            key = tuple_(ExerciseStep.exercise_id, ExerciseStep.name)
+            for chunk in in_chunks(sorted({(row.item.exercise_id, row.item.name) for row in rows})):
+                statement = select(ExerciseStep.exercise_id, ExerciseStep.name, ExerciseStep.id) \
+                    .where(key.in_(chunk)).order_by(ExerciseStep.id)
+                for exercise_id, name, step_id in (await self.session.execute(statement)).all():
+                    existing.setdefault((exercise_id, name), step_id)
+        # updated steps keep their place, new ones go after the last step of their exercise
+        await assign_sort_keys(self.session, [row.item for row in rows
+                                              if existing.get((row.item.exercise_id, row.item.name)) is None])
+        # nothing refers to new steps, so they are inserted without fetching their ids back
+        groups, inserted, updated = await self._write(self.step_repo, ExerciseStep, rows,
+                                                      lambda item: existing.get((item.exercise_id, item.name)),
+                                                      lambda item: (item.exercise_id, item.name), returning=False)
+        return [row_id for row_id, _ in groups], inserted, updated
+
+    async def _write(self, repo: Any, model: Any, rows: list[_Row], existing_id: Any, natural_key: Any,
+                     returning: bool = True) -> tuple[list[tuple[int, list[_Row]]], int, int]:
+        """Insert new rows and, in upsert mode, update the matching ones.
+
+        Returns the database id of every written row with the file rows merged
+        into it, and the number of inserted and updated rows. Without
+        ``returning`` the inserted rows are left out of the ids.
+
+        SQLite can not return the ids of a multi-row INSERT in order, so
+        `add_many` sends one statement per row there; a plain bulk INSERT is a
+        single executemany.
+        """
+        inserts: dict[Any, tuple[list[_Row], dict[str, Any]]] = {}
+        updates: dict[int, tuple[list[_Row], dict[str, Any]]] = {}
+        # bulk UPDATE by primary key skips the ORM flush, so the audit timestamp is set here
+        updated_at = datetime.now(timezone.utc)
+        for index, row in enumerate(rows):
+            target_id = existing_id(row.item) if self.mode == 'upsert' else None
+            if target_id is not None:
+                group = updates.setdefault(target_id, ([], {'id': target_id, 'updated_at': updated_at}))
+            else:
+                # in upsert mode later rows with the same natural key are folded into the first one
+                group = inserts.setdefault(natural_key(row.item) if self.mode == 'upsert' else index, ([], {}))
+            group[0].append(row)
+            group[1].update(row.item.model_dump(exclude_unset=True, exclude_none=True))
+        written = [(target_id, group_rows) for target_id, (group_rows, _) in updates.items()]
+        if inserts and returning:
+            objs = await repo.add_many([model(**values) for _, values in inserts.values()])
+            written += [(obj.id, group_rows) for (group_rows, _), obj in zip(inserts.values(), objs)]
+        elif inserts:
+            await repo.session.execute(insert(model), [values for _, values in inserts.values()])
+        if updates:
+            await repo.update_many([values for _, values in updates.values()])
+        return written, len(inserts), len(updates)
+
+    async def _fail(self, errors: list[dict[str, Any]], records: int = 1) -> None:
+        """Report ``errors`` of ``records`` records, a nested step shares its exercise's row number."""
+        if not errors:
+            return
+        self.report.failed += records
+        room = MAX_REPORTED_ERRORS - len(self.report.errors)
+        self.report.errors.extend(errors[:max(room, 0)])
+        if self._error_file is None:
+            await prune_error_files(settings.import_errors_ttl)
+            self.report.error_file = f'import-errors-{uuid.uuid4().hex}.ndjson'
+            self._error_file = await anyio.open_file(error_file_path(self.report.error_file), 'w')
+        await self._error_file.write(''.join(json.dumps(error) + '\n' for error in errors))
+
@@ -1,16 +1,118 @@
+"""
+logging setup: records are queued by the caller and written by a listener thread
+
+Handlers that write to a terminal or pipe block while it is not being read,
+so the event loop only ever puts records on a queue and the
+`logging.handlers.QueueListener` thread does the writing.
+"""
+from __future__ import annotations
+
+import atexit
 import logging
+import logging.handlers
+import queue
+import random
+import time
+from typing import TYPE_CHECKING, Any
+
+from litestar.logging import LoggingConfig
+from sqlalchemy import event
+
+from settings import settings
+
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncEngine
+
+LOG_FORMAT = '%(asctime)s: %(name)s: %(levelname)s: %(message)s'
+# executemany parameter lists can hold thousands of rows
+MAX_PARAMETERS_LENGTH = 500
+
+_queue_handler: logging.handlers.QueueHandler | None = None
+
+
+def queue_handler() -> logging.handlers.QueueHandler:
+    """Return the handler that queues records for the listener thread, starting it on the first call.
+
+    ``logging_config`` builds its handler through this factory, so configuring
+    logging again, as every new `Litestar` app does, reuses the one queue and
+    listener thread instead of starting another.
+    """
+    global _queue_handler
+    if _queue_handler is None:
+        log_queue: queue.SimpleQueue[logging.LogRecord] = queue.SimpleQueue()
+        stream = logging.StreamHandler()
+        stream.setFormatter(logging.Formatter(LOG_FORMAT))
+        listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=True)
+        listener.start()
+        atexit.register(listener.stop)
+        _queue_handler = logging.handlers.QueueHandler(log_queue)
+    return _queue_handler
+
+
+logging_config = LoggingConfig(
+    handlers={'queue_listener': {'()': 'logger.queue_handler'}},
+    loggers={'litestar': {'level': settings.log_level.upper(), 'handlers': ['queue_listener'], 'propagate': False}},
+    root={'level': settings.log_level.upper(), 'handlers': ['queue_listener']},
+)
+
+
+def setup_logging() -> None:
+    """Route the root and ``litestar`` loggers through the queue, unless that is done already."""
+    if _queue_handler is None or _queue_handler not in logging.getLogger().handlers:
+        logging_config.configure()
 
 
 def get_logger(mod_name: str) -> logging.Logger:
     """Return logger object."""
-    format_obj = '%(asctime)s: %(name)s: %(levelname)s: %(message)s'
-    logger_obj = logging.getLogger(mod_name)
-    # Writes to stdout
-    ch = logging.StreamHandler()
-    ch.setLevel(logging.INFO)
-    ch.setFormatter(logging.Formatter(format_obj))
-    logger_obj.addHandler(ch)
-    return logger_obj
+    setup_logging()
+    return logging.getLogger(mod_name)
+
+
+def instrument_query_log(engine: AsyncEngine, slow_query_ms: float = settings.slow_query_ms,
+                         sample_rate: float = settings.sql_sample_rate) -> None:
+    """Log the statements of ``engine`` that take ``slow_query_ms`` or longer, and a sample of the others.
+
+    Slow statements are logged at WARNING, sampled ones at INFO, both with
+    their parameters and duration on the ``gymman.sql`` logger. This replaces
+    the engine's ``echo``, which writes every statement.
+
+    Parameters
+    ----------
+    engine : AsyncEngine
+        engine to watch.
+    slow_query_ms : float
+        threshold in milliseconds, 0 or less turns the slow query log off.
+    sample_rate : float
+        share of the other statements to log, between 0 and 1.
+    """
+    sql_logger = get_logger('gymman.sql')
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, 'before_cursor_execute')
+    def _before_cursor_execute(conn: Any, *_: Any) -> None:
+        conn.info.setdefault('gymman_query_log_start', []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, 'after_cursor_execute')
+    def _after_cursor_execute(conn: Any, cursor: Any, statement: str, parameters: Any, context: Any,
+                              executemany: bool) -> None:
+        elapsed_ms = (time.perf_counter() - conn.info['gymman_query_log_start'].pop()) * 1000
+        if 0 < slow_query_ms <= elapsed_ms:
+            level, kind = logging.WARNING, 'slow query'
+        elif sample_rate > 0 and random.random() < sample_rate:
+            level, kind = logging.INFO, 'sampled query'
+        else:
+            return
+        shown = repr(parameters)
+        if len(shown) > MAX_PARAMETERS_LENGTH:
+            shown = f'{shown[:MAX_PARAMETERS_LENGTH]}... ({len(shown)} chars)'
+        sql_logger.log(level, '%s %.1fms%s: %s parameters %s', kind, elapsed_ms,
+                       ' executemany' if executemany else '', statement, shown)
+
+    @event.listens_for(sync_engine, 'handle_error')
+    def _handle_error(context: Any) -> None:
+        starts = context.connection.info.get('gymman_query_log_start') if context.connection is not None else None
+        if starts:
+            starts.pop()
 
 
-logger = get_logger(__package__)
\ No newline at end of file
+logger = get_logger('gymman')
@@ -1,38 +1,48 @@
 """
 this is a module doc string
 """
-from typing import TYPE_CHECKING
+import os
+from typing import TYPE_CHECKING, Literal
 
+import anyio
 from litestar import Litestar
-from litestar.contrib.mako import MakoTemplateEngine
+from litestar.contrib.prometheus import PrometheusController
 from litestar.di import Provide
 from litestar.openapi import OpenAPIConfig, OpenAPIController
 from litestar.params import Parameter
 from litestar.repository.filters import LimitOffset
 from litestar.static_files import StaticFilesConfig
-from litestar.template import TemplateConfig
 
-from litestar.contrib.sqlalchemy.plugins import AsyncSessionConfig, SQLAlchemyAsyncConfig, SQLAlchemyInitPlugin
+from litestar.contrib.sqlalchemy.plugins import SQLAlchemyInitPlugin
 
+from assets import build_assets
+from controllers.asset_controller import AssetController
 from controllers.exercise_controller import ExerciseController
 from controllers.exercise_step_controller import ExerciseStepController
 from controllers.my_controller import MyAPIController
-from models.base_model import Base
+from controllers.page_controller import PageController
+from database import create_read_engine, create_sqlalchemy_config, read_engine_provider, read_session_provider
+from logger import instrument_query_log, logger, logging_config, setup_logging
+from metrics import instrument_engine, prometheus_config, record_shutdown, record_startup
 from models.exercise import Exercise
 from models.exercise_step import ExerciseStep
+from pagination import KeysetParams, TotalMode, decode_cursor
+from rendering import template_config
+from schema import init_schema
+from settings import settings
 
-import logging
-
-logging.basicConfig()
-logging.getLogger('sqlalchemy.engine').setLevel(logging.INFO)
+setup_logging()
 
 if TYPE_CHECKING:
     from sqlalchemy.ext.asyncio import AsyncSession
 
-session_config = AsyncSessionConfig(expire_on_commit=False)
-# engine_config = {'echo', True}
-sqlalchemy_config = SQLAlchemyAsyncConfig(
-    connection_string="sqlite+aiosqlite:///test.sqlite", session_config=session_config)
+# the engine profile (SQLite or PostgreSQL/asyncpg) follows GYMMAN_DATABASE_URL
+sqlalchemy_config = create_sqlalchemy_config(settings)
+# GET requests read through their own pool, see database.create_read_engine
+read_engine = create_read_engine(settings, sqlalchemy_config.engine_instance)
+for engine in {sqlalchemy_config.engine_instance, read_engine}:
+    instrument_engine(engine)
+    instrument_query_log(engine)
 # Create 'db_session' dependency.
 sqlalchemy_plugin = SQLAlchemyInitPlugin(config=sqlalchemy_config)
 
@@ -45,10 +55,20 @@ class OpenAPIControllerExtra(OpenAPIController):
 
 
 async def on_startup() -> None:
-    """Initializes the database."""
-    async with sqlalchemy_config.get_engine().begin() as conn:
-        sqlalchemy_config.get_engine().echo = True
-        await conn.run_sync(Base.metadata.create_all)
+    """Initializes the database, unless ``python -m serve`` did it for all workers, builds the static assets and
+    reports the startup time."""
+    schema_init_seconds = await init_schema(sqlalchemy_config.get_engine()) if settings.init_schema else 0.0
+    # only hashes the files when `serve` or an earlier start already wrote the copies
+    await anyio.to_thread.run_sync(build_assets)
+    logger.info('worker %d ready in %.2fs (schema %.2fs)', os.getpid(), record_startup(schema_init_seconds),
+                schema_init_seconds)
+
+
+async def on_shutdown() -> None:
+    """Closes the read pool and lets the metrics of a multi-process server forget this worker."""
+    if read_engine is not sqlalchemy_config.engine_instance:
+        await read_engine.dispose()
+    record_shutdown()
 
 
 def provide_limit_offset_pagination(
@@ -74,9 +94,47 @@ def provide_limit_offset_pagination(
     return LimitOffset(page_size, page_size * (current_page - 1))
 
 
+def provide_keyset_pagination(
+        paging: Literal['offset', 'cursor'] = Parameter(query="paging", default='offset', required=False),
+        cursor: str | None = Parameter(query="cursor", default=None, required=False),
+) -> KeysetParams:
+    """Opt-in keyset (cursor) pagination.
+
+    With ``paging=cursor`` the list handlers ignore ``currentPage`` and page over a
+    stable (name, id) ordering using the opaque ``next``/``prev`` cursors they return.
+
+    Parameters
+    ----------
+    paging : str
+        ``offset`` (default) or ``cursor``.
+    cursor : str | None
+        cursor returned by a previous page, omit for the first page.
+    """
+    if cursor:
+        decode_cursor(cursor)  # reject malformed cursors with a 400 before reaching the handler
+    return KeysetParams(mode=paging, cursor=cursor)
+
+
+def provide_total_mode(
+        total_mode: Literal['false', 'exact', 'estimated'] = Parameter(query="withTotal", default='exact',
+                                                                      required=False),
+) -> TotalMode:
+    """How the offset list handlers fill in ``total``, cursor pages never have one.
+
+    Parameters
+    ----------
+    total_mode : str
+        ``exact`` (default) counts with every page, ``estimated`` serves the
+        table's row count kept by the write handlers, ``false`` skips it.
+    """
+    return total_mode
+
+
 app = Litestar(
-    route_handlers=[MyAPIController, ExerciseController, ExerciseStepController],
+    route_handlers=[MyAPIController, ExerciseController, ExerciseStepController, AssetController, PageController,
+                    PrometheusController],
     on_startup=[on_startup],
+    on_shutdown=[on_shutdown],
     openapi_config=OpenAPIConfig(
         title='My API', version='1.0.0',
         root_schema_site='elements',
@@ -89,7 +147,13 @@ app = Litestar(
         path='static-files',  # path used in links
         directories=['static-files']  # path on the server
     )],
-    template_config=TemplateConfig(engine=MakoTemplateEngine, directory="templates"),
+    template_config=template_config,
     plugins=[SQLAlchemyInitPlugin(config=sqlalchemy_config)],
-    dependencies={"limit_offset": Provide(provide_limit_offset_pagination, sync_to_thread=False)},
+    middleware=[prometheus_config.middleware],
+    logging_config=logging_config,
+    dependencies={"db_read_engine": Provide(read_engine_provider(read_engine), sync_to_thread=False),
+                  "db_read_session": Provide(read_session_provider(read_engine)),
+                  "limit_offset": Provide(provide_limit_offset_pagination, sync_to_thread=False),
+                  "keyset": Provide(provide_keyset_pagination, sync_to_thread=False),
+                  "with_total": Provide(provide_total_mode, sync_to_thread=False)},
 )
@@ -0,0 +1,153 @@
+"""
+prometheus instrumentation for route handlers, SQL statements, the connection pool and uploads
+"""
+from __future__ import annotations
+
+import os
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any
+
+from litestar import Controller, Request
+from litestar.contrib.prometheus import PrometheusConfig, PrometheusMiddleware
+from prometheus_client import Counter, Gauge, Histogram, multiprocess
+from sqlalchemy import event
+
+if TYPE_CHECKING:
+    from litestar.types import Receive, Scope, Send
+    from sqlalchemy.ext.asyncio import AsyncEngine
+
+DB_QUERIES_PER_REQUEST = Histogram(
+    'gymman_db_queries_per_request', 'SQL statements executed while handling one request',
+    ['handler'], buckets=(0, 1, 2, 3, 5, 8, 13, 21, 50, 100),
+)
+DB_QUERY_SECONDS_PER_REQUEST = Histogram(
+    'gymman_db_query_seconds_per_request', 'Time spent executing SQL statements while handling one request',
+    ['handler'],
+)
+DB_POOL_CHECKOUT_WAIT = Histogram(
+    'gymman_db_pool_checkout_wait_seconds', 'Time spent waiting for a connection from the pool',
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+# livesum/liveall add up or list the live workers when PROMETHEUS_MULTIPROC_DIR is set, see `serve`
+DB_POOL_CHECKED_OUT = Gauge('gymman_db_pool_checked_out', 'Connections currently checked out of the pool',
+                            multiprocess_mode='livesum')
+STARTUP_SECONDS = Gauge('gymman_startup_seconds', 'Seconds from the server launch until this worker was ready',
+                        multiprocess_mode='liveall')
+SCHEMA_INIT_SECONDS = Gauge('gymman_schema_init_seconds', 'Seconds this worker spent creating the schema on startup',
+                            multiprocess_mode='liveall')
+UPLOAD_BYTES = Counter('gymman_upload_bytes', 'Bytes of uploaded files written to disk')
+
+# `serve` passes its own start time to the workers, a process started otherwise counts from this import
+LAUNCHED_AT = float(os.environ.get('GYMMAN_LAUNCHED_AT') or time.time())
+
+
+def record_startup(schema_init_seconds: float) -> float:
+    """Report this worker as ready, returns the seconds since the server was launched."""
+    startup_seconds = time.time() - LAUNCHED_AT
+    STARTUP_SECONDS.set(startup_seconds)
+    SCHEMA_INIT_SECONDS.set(schema_init_seconds)
+    return startup_seconds
+
+
+def record_shutdown() -> None:
+    """Drop the live gauges of this worker from a multi-process registry."""
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        multiprocess.mark_process_dead(os.getpid())
+
+
+@dataclass
+class _RequestStats:
+    handler: str
+    queries: int = 0
+    query_seconds: float = 0.0
+
+
+# carries the statement counters of the request being handled into the engine event hooks
+_request_stats: ContextVar[_RequestStats | None] = ContextVar('gymman_request_stats', default=None)
+
+
+def handler_label(scope: Scope) -> str:
+    """``Controller.handler`` name of the matched route, unlike the raw path it does not grow with ids."""
+    route_handler = scope.get('route_handler')
+    if route_handler is None:
+        return 'unmatched'
+    if isinstance(route_handler.owner, Controller):
+        return f'{type(route_handler.owner).__name__}.{route_handler.handler_name}'
+    return route_handler.handler_name
+
+
+class RouteMetricsMiddleware(PrometheusMiddleware):
+    """`PrometheusMiddleware` labelled by route handler, also reporting the SQL work of each request."""
+
+    def _get_default_labels(self, request: Request[Any, Any, Any]) -> dict[str, str | int | float]:
+        return {
+            'method': request.method,
+            'handler': handler_label(request.scope),
+            'status_code': 200,
+            'app_name': self._config.app_name,
+        }
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        stats = _RequestStats(handler=handler_label(scope))
+        token = _request_stats.set(stats)
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            _request_stats.reset(token)
+            DB_QUERIES_PER_REQUEST.labels(stats.handler).observe(stats.queries)
+            DB_QUERY_SECONDS_PER_REQUEST.labels(stats.handler).observe(stats.query_seconds)
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    """Hook statement timing and pool checkout waits into ``engine``."""
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, 'before_cursor_execute')
+    def _before_cursor_execute(conn: Any, *_: Any) -> None:
+        conn.info.setdefault('gymman_query_start', []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, 'after_cursor_execute')
+    def _after_cursor_execute(conn: Any, *_: Any) -> None:
+        elapsed = time.perf_counter() - conn.info['gymman_query_start'].pop()
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.query_seconds += elapsed
+
+    @event.listens_for(sync_engine, 'handle_error')
+    def _handle_error(context: Any) -> None:
+        starts = context.connection.info.get('gymman_query_start') if context.connection is not None else None
+        if starts:
+            starts.pop()
+
+    # the pool has no "checkout started" event, so time the engine's call that may block on it. dispose()
+    # replaces the pool but keeps the engine, and the pool events below are carried over to the new pool
+    raw_connection = sync_engine.raw_connection
+
+    def _timed_raw_connection() -> Any:
+        started = time.perf_counter()
+        try:
+            return raw_connection()
+        finally:
+            DB_POOL_CHECKOUT_WAIT.observe(time.perf_counter() - started)
+
+    sync_engine.raw_connection = _timed_raw_connection  # type: ignore[method-assign]
+
+    # counted from events rather than read from the pool, a multi-process registry only sees stored values
+    @event.listens_for(sync_engine, 'checkout')
+    def _checkout(*_: Any) -> None:
+        DB_POOL_CHECKED_OUT.inc()
+
+    @event.listens_for(sync_engine, 'checkin')
+    def _checkin(*_: Any) -> None:
+        DB_POOL_CHECKED_OUT.dec()
+
+
+prometheus_config = PrometheusConfig(
+    app_name='gymman',
+    prefix='gymman',
+    middleware_class=RouteMetricsMiddleware,
+    exclude=['^/metrics', '^/static-files', '^/docs'],
+)
@@ -2,7 +2,7 @@ from __future__ import annotations
 
 from typing import Optional
 
-from sqlalchemy import String
+from sqlalchemy import Index, String
 from sqlalchemy.orm import mapped_column, Mapped, relationship
 
 from models.base_model import BaseModel, Base
@@ -10,6 +10,12 @@ from models.base_model import BaseModel, Base
 
 class Exercise(Base):
     __tablename__ = 'exercise'
+    __table_args__ = (
+        # serves the (name, id) ordering used by keyset pagination
+        Index('ix_exercise_name_id', 'name', 'exercise_id'),
+        # serves the (updated_at, id) ordering of the change feed
+        Index('ix_exercise_updated_at_id', 'updated_at', 'exercise_id'),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True, name='exercise_id', sort_order=-10)
     name: Mapped[str] = mapped_column(String(length=30), nullable=False, sort_order=1)
@@ -18,7 +24,9 @@ class Exercise(Base):
     image: Mapped[str] = mapped_column(String(100), nullable=True, sort_order=4)
     description: Mapped[str] = mapped_column(String(), nullable=True, sort_order=5)
 
-    steps: Mapped[list['ExerciseStep']] = relationship(back_populates='exercise', lazy="selectin")
+    # never loaded implicitly, ask for it with selectinload(Exercise.steps) where the steps are needed
+    steps: Mapped[list['ExerciseStep']] = relationship(back_populates='exercise', lazy='raise',
+                                                       order_by='[ExerciseStep.sort_order, ExerciseStep.id]')
 
 
 class ExerciseDTO(BaseModel):
@@ -37,3 +45,12 @@ class ExerciseCreate(BaseModel):
     tool_tip: Optional[str] = None
     image: Optional[str] = None
     description: Optional[str] = None
+
+
+class ExerciseUpdate(BaseModel):
+    id: int
+    name: Optional[str] = None
+    place_holder: Optional[str] = None
+    tool_tip: Optional[str] = None
+    image: Optional[str] = None
+    description: Optional[str] = None
@@ -1,17 +1,26 @@
 from __future__ import annotations
 
-from typing import Optional
+from typing import Literal, Optional
 
-from sqlalchemy import String, ForeignKey
+from pydantic import model_validator
+from sqlalchemy import Index, String, ForeignKey
 from sqlalchemy.orm import mapped_column, Mapped, relationship
 
 from models.base_model import BaseModel, Base
-from models.exercise import Exercise
+from models.exercise import Exercise, ExerciseDTO
 
 
 class ExerciseStep(Base):
 
     __tablename__ = 'exercise_step'
+    __table_args__ = (
+        # serves the (name, id) ordering used by keyset pagination
+        Index('ix_exercise_step_name_id', 'name', 'step_id'),
+        # serves reading the steps of an exercise in display order
+        Index('ix_exercise_step_exercise_id_sort_order', 'exercise_id', 'sort_order', 'step_id'),
+        # serves the (updated_at, id) ordering of the change feed
+        Index('ix_exercise_step_updated_at_id', 'updated_at', 'step_id'),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True, name='step_id', sort_order=-10)
     exercise_id: Mapped[int] = mapped_column(ForeignKey(Exercise.id), sort_order=-5)
@@ -39,6 +48,11 @@ class ExerciseStepDTO(BaseModel):
     description: Optional[str] = None
 
 
+class ExerciseWithStepsDTO(ExerciseDTO):
+    # declared here rather than in models.exercise, which can not import this module
+    steps: list[ExerciseStepDTO] = []
+
+
 class ExerciseStepCreate(BaseModel):
     exercise_id: int
     name: str
@@ -47,3 +61,28 @@ class ExerciseStepCreate(BaseModel):
     tool_tip: Optional[str] = None
     image: Optional[str] = None
     description: Optional[str] = None
+
+
+class ExerciseStepUpdate(BaseModel):
+    id: int
+    exercise_id: Optional[int] = None
+    name: Optional[str] = None
+    sort_order: Optional[int] = None
+    place_holder: Optional[str] = None
+    tool_tip: Optional[str] = None
+    image: Optional[str] = None
+    description: Optional[str] = None
+
+
+class ExerciseStepMove(BaseModel):
+    """Move step ``id`` right after or before another step, or to the first or last position."""
+    id: int
+    after: Optional[int] = None
+    before: Optional[int] = None
+    position: Optional[Literal['first', 'last']] = None
+
+    @model_validator(mode='after')
+    def _one_target(self) -> 'ExerciseStepMove':
+        if sum(value is not None for value in (self.after, self.before, self.position)) != 1:
+            raise ValueError('Give exactly one of after, before or position')
+        return self
@@ -0,0 +1,21 @@
+from __future__ import annotations
+
+from sqlalchemy import String
+from sqlalchemy.orm import mapped_column, Mapped
+
+from models.base_model import Base
+
+
+class TableRevision(Base):
+    """Revision counter of one table, incremented inside every transaction that writes to the table.
+
+    The increment locks the row until the commit, so the revisions follow the
+    order the writes commit in, unlike the ``updated_at`` of the rows, which is
+    stamped when they are flushed. ``updated_at`` is the time of the newest
+    increment.
+    """
+
+    __tablename__ = 'table_revision'
+
+    table_name: Mapped[str] = mapped_column(String(length=30), primary_key=True, sort_order=-10)
+    revision: Mapped[int] = mapped_column(nullable=False, default=0, sort_order=1)
@@ -0,0 +1,24 @@
+from __future__ import annotations
+
+from sqlalchemy import Index, String
+from sqlalchemy.orm import mapped_column, Mapped
+
+from models.base_model import Base
+
+
+class Tombstone(Base):
+    """A deleted row, kept so the change feeds can report the deletion.
+
+    ``updated_at`` is the time of the deletion, which orders the tombstone
+    among the live rows of its table.
+    """
+
+    __tablename__ = 'tombstone'
+    __table_args__ = (
+        # serves the (updated_at, id) ordering of the change feed of each table
+        Index('ix_tombstone_table_name_updated_at', 'table_name', 'updated_at', 'row_id'),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True, name='tombstone_id', sort_order=-10)
+    table_name: Mapped[str] = mapped_column(String(length=30), nullable=False, sort_order=1)
+    row_id: Mapped[int] = mapped_column(nullable=False, sort_order=2)
@@ -0,0 +1,96 @@
+"""
+gap based sort keys for the steps of an exercise
+
+Keys are spaced `SORT_GAP` apart, so moving a step usually rewrites only that
+step's key to the midpoint of its new neighbours. When two neighbours have no
+integer left between them the whole exercise is renumbered. A new step without
+a ``sort_order`` of its own goes `SORT_GAP` after the last step of its exercise.
+"""
+from __future__ import annotations
+
+from typing import Any
+
+from sqlalchemy import func, select
+
+from batch import in_chunks
+from models.exercise_step import ExerciseStep
+
+SORT_GAP = 1024
+
+
+def _renumber(order: list[int], keys: dict[int, int]) -> None:
+    for position, step_id in enumerate(order, start=1):
+        keys[step_id] = position * SORT_GAP
+
+
+def apply_moves(steps: list[tuple[int, int]], moves: list[Any]) -> tuple[dict[int, int], list[dict[str, Any]]]:
+    """Work out the sort keys after applying ``moves`` in order.
+
+    Parameters
+    ----------
+    steps : list[tuple[int, int]]
+        (id, sort_order) of every step of the exercise, in display order.
+    moves : list[ExerciseStepMove]
+        each names a step ``id`` and one of ``after``, ``before`` or ``position``.
+
+    Returns
+    -------
+    tuple[dict[int, int], list[dict]]
+        the new key of every step whose key changed, and one error per invalid
+        move in the format of `batch.raise_for_errors`.
+    """
+    order = [step_id for step_id, _ in steps]
+    keys = dict(steps)
+    original = dict(steps)
+    errors: list[dict[str, Any]] = []
+    for index, move in enumerate(moves):
+        anchor = move.after if move.after is not None else move.before
+        for key, value in (('id', move.id), ('after', move.after), ('before', move.before)):
+            if value is not None and value not in keys:
+                errors.append({'index': index, 'key': key, 'message': f'Step {value} does not belong to this exercise'})
+        if anchor == move.id:
+            errors.append({'index': index, 'key': 'after' if move.after is not None else 'before',
+                           'message': 'A step can not be moved relative to itself'})
+        if errors and errors[-1]['index'] == index:
+            continue
+
+        order.remove(move.id)
+        if move.position == 'first':
+            at = 0
+        elif move.position == 'last':
+            at = len(order)
+        else:
+            at = order.index(anchor) + (move.after is not None)
+        order.insert(at, move.id)
+
+        previous_key = keys[order[at - 1]] if at > 0 else None
+        next_key = keys[order[at + 1]] if at + 1 < len(order) else None
+        if previous_key is None and next_key is None:
+            keys[move.id] = SORT_GAP
+        elif previous_key is None:
+            keys[move.id] = next_key - SORT_GAP
+        elif next_key is None:
+            keys[move.id] = previous_key + SORT_GAP
+        elif next_key - previous_key >= 2:
+            keys[move.id] = (previous_key + next_key) // 2
+        else:
+            # out of room between the neighbours, spread every step out again
+            _renumber(order, keys)
+    return {step_id: key for step_id, key in keys.items() if original[step_id] != key}, errors
+
+
+async def assign_sort_keys(session: Any, items: list[Any]) -> None:
+    """Set the ``sort_order`` of the new steps ``items`` that do not give one, after the last step of their exercise.
+
+    Several items of the same exercise are put after each other in their order in ``items``.
+    """
+    pending = [item for item in items if 'sort_order' not in item.model_fields_set]
+    last: dict[int, int] = {}
+    for chunk in in_chunks(sorted({item.exercise_id for item in pending})):
+        statement = select(ExerciseStep.exercise_id, func.max(ExerciseStep.sort_order)) \
+            .where(ExerciseStep.exercise_id.in_(chunk)) \
+            .group_by(ExerciseStep.exercise_id)
+        last.update((await session.execute(statement)).all())
+    for item in pending:
+        last[item.exercise_id] = (last.get(item.exercise_id) or 0) + SORT_GAP
+        item.sort_order = last[item.exercise_id]
@@ -0,0 +1,176 @@
+"""
+offset and keyset (cursor) pagination helpers shared by the list handlers
+"""
+from __future__ import annotations
+
+import base64
+import json
+from dataclasses import dataclass
+from typing import Any, Generic, List, Literal, Optional, TypeVar
+
+from litestar.exceptions import ValidationException
+from litestar.repository.filters import LimitOffset, OrderBy
+from sqlalchemy import func, select, tuple_
+
+T = TypeVar('T')
+
+TotalMode = Literal['false', 'exact', 'estimated']
+
+
+@dataclass
+class CountedOffsetPagination(Generic[T]):
+    """Container for data returned using limit/offset pagination, with the way ``total`` was obtained."""
+
+    __slots__ = ('items', 'total', 'total_mode', 'limit', 'offset')
+
+    items: List[T]
+    """List of data being sent as part of the response."""
+    total: Optional[int]
+    """Total number of rows, ``None`` when ``total_mode`` is ``false``."""
+    total_mode: TotalMode
+    """``exact`` counted with the page, ``estimated`` from the table's kept row count, ``false`` not counted."""
+    limit: int
+    """Maximal number of items to send."""
+    offset: int
+    """Offset from the beginning of the query."""
+
+
+@dataclass
+class KeysetPagination(Generic[T]):
+    """Container for data returned using keyset (cursor) pagination."""
+
+    __slots__ = ('items', 'limit', 'next', 'prev')
+
+    items: List[T]
+    """List of data being sent as part of the response."""
+    limit: int
+    """Maximal number of items to send."""
+    next: Optional[str]
+    """Opaque cursor for the following page, ``None`` on the last page."""
+    prev: Optional[str]
+    """Opaque cursor for the preceding page, ``None`` on the first page."""
+
+
+@dataclass
+class KeysetParams:
+    """Parsed ``paging``/``cursor`` query parameters."""
+
+    mode: Literal['offset', 'cursor'] = 'offset'
+    cursor: Optional[str] = None
+
+
+def encode_cursor(name: str, row_id: int, direction: Literal['next', 'prev']) -> str:
+    """Encode a (name, id) position into an opaque url safe cursor."""
+    raw = json.dumps([name, row_id, direction], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> tuple[str, int, str]:
+    """Decode a cursor produced by `encode_cursor`."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        name, row_id, direction = json.loads(base64.urlsafe_b64decode(padded))
+        if not isinstance(name, str) or not isinstance(row_id, int) or direction not in ('next', 'prev'):
+            raise ValueError(cursor)
+        return name, row_id, direction
+    except ValueError as ex:
+        raise ValidationException(detail=f'Invalid cursor: {cursor}') from ex
+
+
+async def list_offset(repo: Any, columns: list[Any], limit_offset: LimitOffset,
+                      with_total: TotalMode = 'exact') -> CountedOffsetPagination[dict[str, Any]]:
+    """Fetch one page of ``columns`` ordered by (name, id), as dicts keyed by column label.
+
+    With ``exact`` the total comes from a window function in the same query,
+    like the repository's ``list_and_count``. ``estimated`` takes it from the
+    repository's ``row_count`` and only counts when that has expired, ``false``
+    leaves it out.
+
+    Parameters
+    ----------
+    repo : SQLAlchemyAsyncRepository
+        repository of a model with ``name`` and ``id`` attributes and a `cache.RowCounter` ``row_count``.
+    columns : list[ColumnElement]
+        labelled columns to select, see `serialization.dto_columns`.
+    limit_offset : LimitOffset
+        page to fetch.
+    with_total : str
+        ``exact``, ``estimated`` or ``false``.
+    """
+    model = repo.model_type
+    exact = with_total == 'exact'
+    statement = (select(*columns, *([func.count().over()] if exact else []))
+                 .order_by(model.name, model.id)
+                 .limit(limit_offset.limit)
+                 .offset(limit_offset.offset))
+    result = await repo.session.execute(statement)
+    keys = list(result.keys())
+    total: int | None = None
+    if exact:
+        keys.pop()
+        total = 0
+        items = []
+        for *values, total in result:
+            items.append(dict(zip(keys, values)))
+    else:
+        items = [dict(zip(keys, values)) for values in result]
+        if with_total == 'estimated':
+            total = await repo.row_count.get_or_count(repo.count)
+    return CountedOffsetPagination(items=items, total=total, total_mode=with_total,
+                                   limit=limit_offset.limit, offset=limit_offset.offset)
+
+
+async def list_keyset(repo: Any, cursor: str | None, limit: int, statement: Any = None,
+                      columns: list[Any] | None = None) -> KeysetPagination[Any]:
+    """Fetch one page ordered by (name, id) starting after/before ``cursor``.
+
+    The position predicate is a row value comparison, so with a composite
+    (name, id) index the database seeks straight to the page instead of
+    scanning and discarding every earlier row the way OFFSET does.
+
+    Parameters
+    ----------
+    repo : SQLAlchemyAsyncRepository
+        repository of a model with ``name`` and ``id`` attributes.
+    cursor : str | None
+        cursor from a previous page, ``None`` for the first page.
+    limit : int
+        page size.
+    statement : Select | None
+        base select, e.g. with loader options, defaults to the repository's.
+    columns : list[ColumnElement] | None
+        labelled columns to select instead of whole instances, the items are
+        then dicts keyed by label. ``statement`` is ignored.
+    """
+    model = repo.model_type
+    key = tuple_(model.name, model.id)
+    direction = 'next'
+    filters: list[Any] = []
+    if cursor:
+        name, row_id, direction = decode_cursor(cursor)
+        filters.append(key > tuple_(name, row_id) if direction == 'next' else key < tuple_(name, row_id))
+    sort_order = 'asc' if direction == 'next' else 'desc'
+    # fetch one extra row to find out whether there is another page
+    if columns is not None:
+        order = (model.name, model.id) if sort_order == 'asc' else (model.name.desc(), model.id.desc())
+        results = list(await repo.session.execute(select(*columns).where(*filters).order_by(*order).limit(limit + 1)))
+    else:
+        results = await repo.list(*filters,
+                                  OrderBy(field_name=model.name, sort_order=sort_order),
+                                  OrderBy(field_name=model.id, sort_order=sort_order),
+                                  LimitOffset(limit + 1, 0),
+                                  statement=statement)
+    has_more = len(results) > limit
+    results = results[:limit]
+    if direction == 'prev':
+        results.reverse()
+
+    next_cursor = prev_cursor = None
+    if results:
+        first, last = results[0], results[-1]
+        if has_more or direction == 'prev':
+            next_cursor = encode_cursor(last.name, last.id, 'next')
+        if cursor and (has_more or direction == 'next'):
+            prev_cursor = encode_cursor(first.name, first.id, 'prev')
+    items = [row._asdict() for row in results] if columns is not None else results
+    return KeysetPagination(items=items, limit=limit, next=next_cursor, prev=prev_cursor)
@@ -0,0 +1,59 @@
+"""
+server-rendered pages: the Mako engine with its compiled module cache, and a cache of rendered pages
+
+Mako compiles each template to a Python module. With ``module_directory`` set
+the modules are written to disk and later processes import them instead of
+compiling again. Rendered pages are cached under the `cache.TableVersion` tags
+of the tables they show, so a write makes them miss instead of serving stale
+HTML. Pages read from a replica are not cached, the replica may apply commits
+between reading their tags and their rows.
+"""
+from __future__ import annotations
+
+from typing import Any, Awaitable, Callable, Hashable
+
+from litestar import Request, Response
+from litestar.contrib.mako import MakoTemplateEngine
+from litestar.enums import MediaType
+from litestar.template import TemplateConfig
+from mako.lookup import TemplateLookup
+
+from assets import register_template_helpers
+from cache import ReadThroughCache
+from settings import settings
+
+render_cache = ReadThroughCache('rendered_pages', max_size=settings.cache_max_size, ttl=settings.cache_ttl,
+                                enabled=settings.render_cache_enabled and not settings.reads_from_replica)
+
+
+def create_template_engine(directory: str = 'templates',
+                           module_directory: str = settings.template_module_dir) -> MakoTemplateEngine:
+    """Mako engine over ``directory`` that keeps the compiled templates in ``module_directory``, unless it is empty."""
+    lookup = TemplateLookup(directories=[directory], module_directory=module_directory or None,
+                            default_filters=['h'])
+    engine = MakoTemplateEngine.from_template_lookup(lookup)
+    register_template_helpers(engine)
+    return engine
+
+
+template_config = TemplateConfig(engine=create_template_engine())
+
+
+def is_htmx(request: Request[Any, Any, Any]) -> bool:
+    """Whether HTMX sent the request, which then only needs the fragment of the page it swaps in."""
+    return request.headers.get('hx-request') == 'true'
+
+
+def render(request: Request[Any, Any, Any], template_name: str, **context: Any) -> bytes:
+    """Render ``template_name`` with the app's engine and ``context``."""
+    return request.app.template_engine.get_template(template_name).render(**context).encode()
+
+
+async def page_response(key: Hashable, renderer: Callable[[], Awaitable[bytes]]) -> Response[bytes]:
+    """HTML response from `render_cache`, or from ``renderer`` on a miss.
+
+    ``key`` must hold everything the page depends on, the `cache.TableVersion`
+    tags of its tables, its parameters and whether it is an HTMX fragment.
+    """
+    return Response(content=await render_cache.get_or_load(key, renderer), media_type=MediaType.HTML,
+                    headers={'Vary': 'HX-Request'})
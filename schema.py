@@ -0,0 +1,126 @@
+"""
+one-time schema initialization that is safe to start from several processes at once
+
+Every worker of a multi-process server runs its startup hooks, so creating the
+tables takes a database lock first: an advisory lock on PostgreSQL and the
+write lock (``BEGIN IMMEDIATE``) on SQLite. The first process creates what is
+missing, the others wait for it and then find nothing left to do.
+
+``create_all`` skips the tables that already exist, so an index added to a
+model later is listed in `UPGRADE_INDEXES` and created on its own when an
+older database lacks it. Steps created before the gap based sort keys all
+have ``sort_order`` 0, `spread_sort_keys` spaces them out once. Every table
+gets its `TableRevision` row here, the writes only increment it.
+"""
+from __future__ import annotations
+
+import time
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Any
+
+from sqlalchemy import bindparam, func, insert, select, text, update
+
+from batch import in_chunks
+from changes import increment_revisions
+# create_all only sees the tables of imported models
+from models import exercise, exercise_step, table_revision, tombstone  # noqa: F401
+from models.base_model import Base
+from models.exercise_step import ExerciseStep
+from models.table_revision import TableRevision
+from ordering import SORT_GAP
+from search import create_search_indexes
+
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncEngine
+
+# pg_advisory_xact_lock key, any constant no other code locks on
+SCHEMA_LOCK_KEY = 0x67796D6D616E
+
+# indexes added to tables that databases created before them already have
+UPGRADE_INDEXES = (
+    # keyset pagination
+    'ix_exercise_name_id',
+    'ix_exercise_step_name_id',
+    # steps of an exercise in display order
+    'ix_exercise_step_exercise_id_sort_order',
+    # (updated_at, id) ordering of the change feeds
+    'ix_exercise_updated_at_id',
+    'ix_exercise_step_updated_at_id',
+    'ix_tombstone_table_name_updated_at',
+)
+
+
+def spread_sort_keys(conn: Any) -> None:
+    """Renumber the steps of every exercise where two steps share a ``sort_order``, `SORT_GAP` apart.
+
+    The steps keep their order, ties are broken by id as the list handlers do.
+    Takes a sync connection, call it through ``AsyncConnection.run_sync``.
+    """
+    collided = select(ExerciseStep.exercise_id) \
+        .group_by(ExerciseStep.exercise_id, ExerciseStep.sort_order) \
+        .having(func.count() > 1) \
+        .distinct()
+    exercise_ids = conn.execute(collided).scalars().all()
+    table = ExerciseStep.__table__
+    renumber = update(table).where(table.c.step_id == bindparam('b_id')) \
+        .values(sort_order=bindparam('b_sort_order'), updated_at=bindparam('b_updated_at'))
+    # the new order shows up in the change feeds like a reorder
+    updated_at = datetime.now(timezone.utc)
+    for chunk in in_chunks(exercise_ids):
+        ordered = select(ExerciseStep.exercise_id, ExerciseStep.id) \
+            .where(ExerciseStep.exercise_id.in_(chunk)) \
+            .order_by(ExerciseStep.exercise_id, ExerciseStep.sort_order, ExerciseStep.id)
+        positions: dict[int, int] = {}
+        values = []
+        for exercise_id, step_id in conn.execute(ordered):
+            positions[exercise_id] = positions.get(exercise_id, 0) + 1
+            values.append({'b_id': step_id, 'b_sort_order': positions[exercise_id] * SORT_GAP,
+                           'b_updated_at': updated_at})
+        if values:
+            conn.execute(renumber, values)
+    if exercise_ids:
+        increment_revisions(conn, [ExerciseStep.__tablename__])
+
+
+def create_revisions(conn: Any) -> None:
+    """Add the missing `TableRevision` rows, one per table of the models.
+
+    Takes a sync connection, call it through ``AsyncConnection.run_sync``.
+    """
+    existing = set(conn.execute(select(TableRevision.table_name)).scalars())
+    missing = [table.name for table in Base.metadata.sorted_tables
+               if table.name not in existing and table.name != TableRevision.__tablename__]
+    if missing:
+        now = datetime.now(timezone.utc)
+        conn.execute(insert(TableRevision), [{'table_name': name, 'revision': 0, 'created_at': now, 'updated_at': now}
+                                             for name in missing])
+
+
+def upgrade_schema(conn: Any) -> None:
+    """Add the `UPGRADE_INDEXES` an existing database is missing and run `spread_sort_keys`, after ``create_all``.
+
+    Takes a sync connection, call it through ``AsyncConnection.run_sync``.
+    """
+    create_revisions(conn)
+    spread_sort_keys(conn)
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            if index.name in UPGRADE_INDEXES:
+                index.create(conn, checkfirst=True)
+
+
+async def init_schema(engine: AsyncEngine) -> float:
+    """Create the missing tables, indexes and search indexes under the schema lock, returns the seconds it took."""
+    started = time.perf_counter()
+    async with engine.connect() as conn:
+        if conn.dialect.name == 'postgresql':
+            # released by the commit, together with the DDL
+            await conn.execute(text('SELECT pg_advisory_xact_lock(:key)'), {'key': SCHEMA_LOCK_KEY})
+        elif conn.dialect.name == 'sqlite':
+            # waits up to PRAGMA busy_timeout for another process holding it
+            await conn.exec_driver_sql('BEGIN IMMEDIATE')
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(upgrade_schema)
+        await conn.run_sync(create_search_indexes)
+        await conn.commit()
+    return time.perf_counter() - started
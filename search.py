@@ -0,0 +1,146 @@
+"""
+full-text search over the name, tool_tip and description of exercises and steps
+
+SQLite keeps an external content FTS5 table per model, filled by triggers so
+every write path (ORM, bulk and raw SQL) keeps it in sync. PostgreSQL uses a
+GIN index over a ``to_tsvector`` expression of the same columns, which the
+database maintains by itself.
+"""
+from __future__ import annotations
+
+import re
+from typing import Any
+
+from litestar.exceptions import ValidationException
+from litestar.repository.filters import LimitOffset
+from sqlalchemy import Index, column, func, literal_column, select, table, text
+from sqlalchemy.schema import CreateIndex
+
+from models.exercise import Exercise
+from models.exercise_step import ExerciseStep
+
+SEARCH_COLUMNS = ('name', 'tool_tip', 'description')
+# no stemming on either side, so both databases match the same words
+TS_CONFIG = 'simple'
+MAX_TERMS = 16
+
+_TERM = re.compile(r'\w+', re.UNICODE)
+
+
+def _document(model: Any) -> Any:
+    """``to_tsvector`` of the searchable columns, the index and the queries must use this exact expression."""
+    # literals rather than bound parameters, a parameter would keep the planner from matching the index
+    values = [func.coalesce(model.__table__.c[name], text("''")) for name in SEARCH_COLUMNS]
+    document = values[0]
+    for value in values[1:]:
+        document = document.concat(text("' '")).concat(value)
+    return func.to_tsvector(text(f"'{TS_CONFIG}'"), document)
+
+
+SEARCH_INDEXES = {
+    model: Index(f'ix_{model.__tablename__}_search', _document(model), postgresql_using='gin')
+    .ddl_if(dialect='postgresql')
+    for model in (Exercise, ExerciseStep)
+}
+
+
+def _fts_table(model: Any) -> str:
+    return f'{model.__tablename__}_fts'
+
+
+def _sqlite_ddl(model: Any) -> list[str]:
+    source = model.__tablename__
+    fts = _fts_table(model)
+    key = model.id.property.columns[0].name
+    columns = ', '.join(SEARCH_COLUMNS)
+    new_values = ', '.join(f'new.{name}' for name in SEARCH_COLUMNS)
+    old_values = ', '.join(f'old.{name}' for name in SEARCH_COLUMNS)
+    delete = f"INSERT INTO {fts}({fts}, rowid, {columns}) VALUES ('delete', old.{key}, {old_values});"
+    insert = f'INSERT INTO {fts}(rowid, {columns}) VALUES (new.{key}, {new_values});'
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({columns}, content='{source}', content_rowid='{key}', "
+        f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {source} BEGIN {insert} END',
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {source} BEGIN {delete} END',
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {columns} ON {source} BEGIN {delete} {insert} END',
+    ]
+
+
+def create_search_indexes(conn: Any) -> None:
+    """Create the search index of every model if it is missing, run after ``create_all``.
+
+    Takes a sync connection, call it through ``AsyncConnection.run_sync``. A
+    freshly created FTS5 table is rebuilt from the rows already in the table.
+    """
+    dialect = conn.dialect.name
+    for model, index in SEARCH_INDEXES.items():
+        if dialect == 'sqlite':
+            fts = _fts_table(model)
+            exists = conn.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                                  {'name': fts}).first()
+            for statement in _sqlite_ddl(model):
+                conn.execute(text(statement))
+            if not exists:
+                conn.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"))
+        elif dialect == 'postgresql':
+            conn.execute(CreateIndex(index, if_not_exists=True))
+
+
+def search_terms(query: str) -> list[str]:
+    """Split a user query into words, raises `ValidationException` when there are none.
+
+    Only word characters are kept, so nothing the user types is interpreted as
+    FTS5 or tsquery syntax.
+    """
+    terms = _TERM.findall(query.lower())[:MAX_TERMS]
+    if not terms:
+        raise ValidationException(detail=f'Search query has no words: {query!r}')
+    return terms
+
+
+async def search_ranked(repo: Any, terms: list[str], limit_offset: LimitOffset) -> tuple[list[Any], int]:
+    """One page of the rows matching every term (as a prefix), best match first.
+
+    Parameters
+    ----------
+    repo : SQLAlchemyAsyncRepository
+        repository of a model registered in `SEARCH_INDEXES`.
+    terms : list[str]
+        words from `search_terms`.
+    limit_offset : LimitOffset
+        page to return.
+
+    Returns
+    -------
+    tuple[list, int]
+        the page of rows and the total number of matches.
+    """
+    model = repo.model_type
+    if repo.session.bind.dialect.name == 'postgresql':
+        query = func.to_tsquery(text(f"'{TS_CONFIG}'"), ' & '.join(f'{term}:*' for term in terms))
+        document = _document(model)
+        matches = select(model.id).where(document.op('@@')(query))
+        page = (
+            select(model)
+            .where(document.op('@@')(query))
+            .order_by(func.ts_rank(document, query).desc(), model.id)
+            .limit(limit_offset.limit)
+            .offset(limit_offset.offset)
+        )
+    else:
+        fts = table(_fts_table(model), column('rowid'), column('rank'))
+        match = literal_column(fts.name).op('MATCH')(' '.join(f'"{term}"*' for term in terms))
+        matches = select(fts.c.rowid).where(match)
+        # rank and page inside the FTS table, so only the rows of the page are joined to the model's table
+        hits = (
+            select(fts.c.rowid, fts.c.rank)
+            .where(match)
+            .order_by(fts.c.rank, fts.c.rowid)
+            .limit(limit_offset.limit)
+            .offset(limit_offset.offset)
+            .subquery()
+        )
+        page = select(model).join(hits, hits.c.rowid == model.id).order_by(hits.c.rank, model.id)
+    results = list((await repo.session.scalars(page)).all())
+    total = await repo.session.scalar(select(func.count()).select_from(matches.subquery()))
+    return results, total or 0
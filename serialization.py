@@ -0,0 +1,39 @@
+"""
+fast JSON encoding of list pages
+
+The list handlers select only the columns behind their response model, as
+row tuples, and encode the whole page to JSON bytes with one msgspec call.
+That skips building ORM instances, validating each of them into pydantic and
+having Litestar dump the models again while encoding the response.
+"""
+from __future__ import annotations
+
+from functools import lru_cache
+from typing import Any
+
+import msgspec
+from litestar import MediaType, Response
+from pydantic import BaseModel, TypeAdapter
+from sqlalchemy import inspect
+
+_encoder = msgspec.json.Encoder()
+
+
+@lru_cache(maxsize=None)
+def list_adapter(dto: type[BaseModel]) -> TypeAdapter[list[Any]]:
+    """``TypeAdapter(list[dto])``, compiled once per model rather than on every request."""
+    return TypeAdapter(list[dto])
+
+
+def dto_columns(model: Any, dto: type[BaseModel]) -> list[Any]:
+    """Columns of ``model`` behind the fields of ``dto``, labelled with the field names.
+
+    Fields that are not plain columns, such as relationships, are left out.
+    """
+    column_names = inspect(model).column_attrs.keys()
+    return [getattr(model, name).label(name) for name in dto.model_fields if name in column_names]
+
+
+def json_response(content: Any, headers: dict[str, str] | None = None) -> Response[Any]:
+    """Encode ``content`` (dicts, lists and dataclasses such as the pagination containers) to a JSON response."""
+    return Response(content=_encoder.encode(content), media_type=MediaType.JSON, headers=headers)
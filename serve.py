@@ -0,0 +1,84 @@
+"""
+run the app under uvicorn with one or more worker processes
+
+``python -m serve`` creates the schema once, then starts ``GYMMAN_WORKERS``
+workers that skip it. ``python -m serve init`` only creates the schema, for
+deployments that run it as a separate step before starting the servers.
+``uvicorn main:app --workers N`` also works, every worker then creates the
+schema under its lock, but each keeps its own metrics unless
+``PROMETHEUS_MULTIPROC_DIR`` is set.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+
+import uvicorn
+
+from assets import build_assets
+from database import create_sqlalchemy_config
+from logger import get_logger
+from schema import init_schema
+from settings import settings
+
+logger = get_logger('gymman.serve')
+
+
+async def _init() -> float:
+    engine = create_sqlalchemy_config(settings).engine_instance
+    try:
+        return await init_schema(engine)
+    finally:
+        await engine.dispose()
+
+
+def _prepare_multiprocess_metrics() -> str | None:
+    """Point prometheus_client of every worker at one empty directory, returns it when it was created here."""
+    directory = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if directory is None:
+        directory = tempfile.mkdtemp(prefix='gymman-metrics-')
+        os.environ['PROMETHEUS_MULTIPROC_DIR'] = directory
+        return directory
+    # values left by a previous run would be added to the new ones
+    for name in os.listdir(directory):
+        if name.endswith('.db'):
+            os.remove(os.path.join(directory, name))
+    return None
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog='python -m serve', description=__doc__.strip().splitlines()[0])
+    parser.add_argument('command', nargs='?', choices=('run', 'init'), default='run')
+    parser.add_argument('--workers', type=int, default=settings.workers)
+    parser.add_argument('--host', default=settings.host)
+    parser.add_argument('--port', type=int, default=settings.port)
+    args = parser.parse_args(argv)
+
+    launched_at = time.time()
+    # a single worker runs in this process and creates the schema on startup as usual
+    if args.command == 'init' or args.workers > 1:
+        logger.info('schema ready in %.2fs', asyncio.run(_init()))
+        started = time.perf_counter()
+        build_assets()
+        logger.info('static assets ready in %.2fs', time.perf_counter() - started)
+        if args.command == 'init':
+            return
+        os.environ['GYMMAN_INIT_SCHEMA'] = 'false'
+
+    # the workers are new processes that read these while importing main, a launcher may pass its own start time
+    os.environ['GYMMAN_WORKERS'] = str(args.workers)
+    os.environ.setdefault('GYMMAN_LAUNCHED_AT', repr(launched_at))
+    metrics_dir = _prepare_multiprocess_metrics() if args.workers > 1 else None
+    try:
+        uvicorn.run('main:app', host=args.host, port=args.port, workers=args.workers)
+    finally:
+        if metrics_dir is not None:
+            shutil.rmtree(metrics_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""
+runtime settings read from the environment
+"""
+import multiprocessing
+import os
+from dataclasses import dataclass, field
+
+
+def _env_int(name: str, default: int) -> int:
+    """Return an integer environment variable or ``default`` when it is unset."""
+    return int(os.getenv(name, default))
+
+
+def _env_float(name: str, default: float) -> float:
+    """Return a float environment variable or ``default`` when it is unset."""
+    return float(os.getenv(name, default))
+
+
+def _env_str(name: str, default: str) -> str:
+    """Return a string environment variable or ``default`` when it is unset."""
+    return os.getenv(name, default)
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    """Return a boolean environment variable, ``1``/``true``/``yes``/``on`` count as true."""
+    value = os.getenv(name)
+    return default if value is None else value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+@dataclass(frozen=True)
+class Settings:
+    """Application settings, every field can be overridden with a ``GYMMAN_*`` variable."""
+
+    upload_dir: str = field(default_factory=lambda: _env_str('GYMMAN_UPLOAD_DIR', '.'))
+    """Directory uploaded files are written to."""
+    upload_chunk_size: int = field(default_factory=lambda: _env_int('GYMMAN_UPLOAD_CHUNK_SIZE', 64 * 1024))
+    """Bytes read and written per step while saving an upload."""
+    upload_max_concurrency: int = field(default_factory=lambda: _env_int('GYMMAN_UPLOAD_MAX_CONCURRENCY', 4))
+    """Maximum number of files of one request written at the same time."""
+    cache_enabled: bool = field(default_factory=lambda: _env_bool('GYMMAN_CACHE_ENABLED', True))
+    """Serve detail lookups from the in-process cache, turn off for tests."""
+    cache_max_size: int = field(default_factory=lambda: _env_int('GYMMAN_CACHE_MAX_SIZE', 1024))
+    """Maximum number of rows kept per cached table."""
+    cache_ttl: float = field(default_factory=lambda: _env_float('GYMMAN_CACHE_TTL', 60.0))
+    """Seconds a cached row is served before it is read again."""
+    count_ttl: float = field(default_factory=lambda: _env_float('GYMMAN_COUNT_TTL', 30.0))
+    """Seconds a table's row count serves ``withTotal=estimated`` before it is counted again."""
+    changes_settle_seconds: float = field(default_factory=lambda: _env_float('GYMMAN_CHANGES_SETTLE_SECONDS', 2.0))
+    """Seconds a changed row waits before the change feeds serve it, keep it above the longest write transaction."""
+    cache_control_list: str = field(default_factory=lambda: _env_str('GYMMAN_CACHE_CONTROL_LIST', 'no-cache'))
+    """``Cache-Control`` of the list handlers, ``no-cache`` makes clients revalidate with their ETag every time."""
+    cache_control_detail: str = field(default_factory=lambda: _env_str('GYMMAN_CACHE_CONTROL_DETAIL', 'no-cache'))
+    """``Cache-Control`` of the detail handlers."""
+    cache_control_assets: str = field(
+        default_factory=lambda: _env_str('GYMMAN_CACHE_CONTROL_ASSETS', 'public, max-age=31536000, immutable'))
+    """``Cache-Control`` of the fingerprinted static files, their name changes with their content."""
+    assets_dir: str = field(default_factory=lambda: _env_str('GYMMAN_ASSETS_DIR', 'static-build'))
+    """Directory the fingerprinted and precompressed copies of ``static-files`` are written to."""
+    template_module_dir: str = field(default_factory=lambda: _env_str('GYMMAN_TEMPLATE_MODULE_DIR', '.mako_modules'))
+    """Directory Mako keeps compiled templates in across restarts, empty compiles them in memory on every start."""
+    render_cache_enabled: bool = field(default_factory=lambda: _env_bool('GYMMAN_RENDER_CACHE_ENABLED', True))
+    """Keep rendered HTML pages until a write changes the tables they show."""
+    export_chunk_size: int = field(default_factory=lambda: _env_int('GYMMAN_EXPORT_CHUNK_SIZE', 1000))
+    """Rows fetched from the database and encoded per step of an export."""
+    import_batch_size: int = field(default_factory=lambda: _env_int('GYMMAN_IMPORT_BATCH_SIZE', 500))
+    """Rows written per transaction by an import, unless the request asks for another size."""
+    import_errors_ttl: int = field(default_factory=lambda: _env_int('GYMMAN_IMPORT_ERRORS_TTL', 24 * 60 * 60))
+    """Seconds an import's error file is kept when nobody downloads it, a download removes it right away."""
+    log_level: str = field(default_factory=lambda: _env_str('GYMMAN_LOG_LEVEL', 'INFO'))
+    """Level of the root logger, e.g. ``DEBUG``, ``INFO`` or ``WARNING``."""
+    slow_query_ms: float = field(default_factory=lambda: _env_float('GYMMAN_SLOW_QUERY_MS', 200.0))
+    """SQL statements taking this many milliseconds or more are logged, 0 turns the slow query log off."""
+    sql_sample_rate: float = field(default_factory=lambda: _env_float('GYMMAN_SQL_SAMPLE_RATE', 0.0))
+    """Share of the other SQL statements to log, between 0 and 1."""
+    host: str = field(default_factory=lambda: _env_str('GYMMAN_HOST', '127.0.0.1'))
+    """Interface ``python -m serve`` binds to."""
+    port: int = field(default_factory=lambda: _env_int('GYMMAN_PORT', 8000))
+    """Port ``python -m serve`` listens on."""
+    workers: int = field(default_factory=lambda: _env_int('GYMMAN_WORKERS', 1))
+    """Server processes ``python -m serve`` starts, see `multi_process` for the other ways to run several."""
+    init_schema: bool = field(default_factory=lambda: _env_bool('GYMMAN_INIT_SCHEMA', True))
+    """Create missing tables and search indexes on startup, ``python -m serve`` does it once for all its workers."""
+    database_url: str = field(
+        default_factory=lambda: _env_str('GYMMAN_DATABASE_URL', 'sqlite+aiosqlite:///test.sqlite'))
+    """SQLAlchemy URL, ``sqlite+aiosqlite://`` or ``postgresql+asyncpg://`` selects the engine profile."""
+    database_read_url: str = field(default_factory=lambda: _env_str('GYMMAN_DATABASE_READ_URL', ''))
+    """PostgreSQL replica the GET requests read from, empty reads from the primary."""
+    db_read_pool_enabled: bool = field(default_factory=lambda: _env_bool('GYMMAN_DB_READ_POOL_ENABLED', True))
+    """Give the GET requests their own connection pool, off sends them through the pool of the writes."""
+    db_read_pool_size: int = field(default_factory=lambda: _env_int('GYMMAN_DB_READ_POOL_SIZE', 10))
+    """Connections kept open in the read pool, ``db_max_overflow`` and the timeouts apply as for the primary."""
+    db_pool_size: int = field(default_factory=lambda: _env_int('GYMMAN_DB_POOL_SIZE', 10))
+    """Connections kept open in the pool."""
+    db_max_overflow: int = field(default_factory=lambda: _env_int('GYMMAN_DB_MAX_OVERFLOW', 20))
+    """Extra connections opened above ``db_pool_size`` under load."""
+    db_pool_timeout: int = field(default_factory=lambda: _env_int('GYMMAN_DB_POOL_TIMEOUT', 30))
+    """Seconds to wait for a free connection before giving up."""
+    db_pool_recycle: int = field(default_factory=lambda: _env_int('GYMMAN_DB_POOL_RECYCLE', 1800))
+    """Seconds after which a pooled connection is replaced, -1 keeps them forever."""
+    db_pool_pre_ping: bool = field(default_factory=lambda: _env_bool('GYMMAN_DB_POOL_PRE_PING', True))
+    """Test each connection on checkout so dropped server connections are never handed out."""
+    db_statement_cache_size: int = field(default_factory=lambda: _env_int('GYMMAN_DB_STATEMENT_CACHE_SIZE', 256))
+    """asyncpg prepared statements kept per connection, 0 when running behind pgbouncer."""
+    sqlite_journal_mode: str = field(default_factory=lambda: _env_str('GYMMAN_SQLITE_JOURNAL_MODE', 'WAL'))
+    """``PRAGMA journal_mode``, WAL lets readers run while a write is in progress."""
+    sqlite_synchronous: str = field(default_factory=lambda: _env_str('GYMMAN_SQLITE_SYNCHRONOUS', 'NORMAL'))
+    """``PRAGMA synchronous``, NORMAL is durable in WAL mode except on power loss."""
+    sqlite_busy_timeout: int = field(default_factory=lambda: _env_int('GYMMAN_SQLITE_BUSY_TIMEOUT', 5000))
+    """``PRAGMA busy_timeout`` in milliseconds a connection waits for a lock."""
+    sqlite_mmap_size: int = field(default_factory=lambda: _env_int('GYMMAN_SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+    """``PRAGMA mmap_size`` in bytes, 0 turns memory mapped reads off."""
+
+    @property
+    def multi_process(self) -> bool:
+        """Whether other processes may serve the app next to this one.
+
+        True with ``workers`` above 1, with ``PROMETHEUS_MULTIPROC_DIR`` set as
+        for multi-process metrics, and in the workers ``uvicorn --workers N``
+        spawns through `multiprocessing`. The table versions then follow the
+        database instead of this process.
+        """
+        return (self.workers > 1 or 'PROMETHEUS_MULTIPROC_DIR' in os.environ
+                or multiprocessing.parent_process() is not None)
+
+    @property
+    def reads_from_replica(self) -> bool:
+        """Whether the GET requests read from ``database_read_url``, which may lag behind the commits on the primary."""
+        return bool(self.database_read_url) and self.db_read_pool_enabled
+
+    @property
+    def shared_versions(self) -> bool:
+        """Whether the table versions follow the database instead of this process's writes.
+
+        True when `multi_process`, and when `reads_from_replica`: a version bumped
+        on the primary's commit would tag pages read before the replica caught up.
+        """
+        return self.multi_process or self.reads_from_replica
+
+
+settings = Settings()
@@ -0,0 +1,234 @@
+"""
+bounded memory helpers for saving uploaded files
+"""
+from __future__ import annotations
+
+import hashlib
+import uuid
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, AsyncIterator
+
+import anyio
+from litestar.exceptions import ClientException
+
+from logger import logger
+from metrics import UPLOAD_BYTES
+from settings import settings
+
+if TYPE_CHECKING:
+    from anyio.abc import AsyncFile
+    from litestar.datastructures import UploadFile
+
+_MAX_HEADER_SIZE = 16 * 1024
+
+
+@dataclass
+class StoredFile:
+    """An upload that has been written to its final location."""
+
+    filename: str
+    size: int
+    sha256: str
+
+
+def safe_filename(filename: str | None) -> str:
+    """Strip any directory part a client sent along with the file name."""
+    name = anyio.Path(filename or '').name
+    if name in ('', '.', '..'):
+        raise ClientException(detail=f'Invalid file name: {filename!r}')
+    return name
+
+
+class _AtomicWriter:
+    """Write chunks to a temporary sibling file, hashing as they go, then rename it into place."""
+
+    def __init__(self, filename: str, directory: str) -> None:
+        self.filename = safe_filename(filename)
+        self.target = anyio.Path(directory) / self.filename
+        self.temp = anyio.Path(directory) / f'.{self.filename}.{uuid.uuid4().hex}.part'
+        self.size = 0
+        self._hash = hashlib.sha256()
+        self._file: AsyncFile[bytes] | None = None
+
+    async def open(self) -> None:
+        self._file = await anyio.open_file(self.temp, 'wb')
+
+    async def write(self, chunk: bytes) -> None:
+        self._hash.update(chunk)
+        self.size += len(chunk)
+        await self._file.write(chunk)
+
+    async def commit(self) -> StoredFile:
+        await self._file.aclose()
+        await self.temp.replace(self.target)
+        UPLOAD_BYTES.inc(self.size)
+        logger.debug('stored upload %s (%d bytes, sha256 %s)', self.filename, self.size, self._hash.hexdigest())
+        return StoredFile(filename=self.filename, size=self.size, sha256=self._hash.hexdigest())
+
+    async def abort(self) -> None:
+        if self._file is not None:
+            await self._file.aclose()
+        await self.temp.unlink(missing_ok=True)
+
+
+async def save_upload_file(file: UploadFile, directory: str | None = None,
+                           chunk_size: int | None = None) -> StoredFile:
+    """Copy an `UploadFile` to ``directory`` one chunk at a time."""
+    writer = _AtomicWriter(file.filename, directory or settings.upload_dir)
+    chunk_size = chunk_size or settings.upload_chunk_size
+    try:
+        await writer.open()
+        while chunk := await file.read(chunk_size):
+            await writer.write(chunk)
+        return await writer.commit()
+    except BaseException:
+        with anyio.CancelScope(shield=True):
+            await writer.abort()
+        raise
+
+
+async def save_upload_files(files: list[UploadFile], directory: str | None = None,
+                            max_concurrency: int | None = None) -> list[StoredFile]:
+    """Save the files of one request concurrently, at most ``max_concurrency`` at a time.
+
+    The result keeps the order of ``files``.
+    """
+    limiter = anyio.CapacityLimiter(max_concurrency or settings.upload_max_concurrency)
+    stored: list[StoredFile | None] = [None] * len(files)
+
+    async def _save(index: int, file: UploadFile) -> None:
+        async with limiter:
+            stored[index] = await save_upload_file(file, directory)
+
+    async with anyio.create_task_group() as tg:
+        for index, file in enumerate(files):
+            tg.start_soon(_save, index, file)
+    return stored  # type: ignore[return-value]
+
+
+@dataclass
+class PartStart:
+    """Emitted by `MultipartStreamParser` when the headers of a part have been read."""
+
+    name: str | None
+    filename: str | None
+
+
+class PartEnd:
+    """Emitted by `MultipartStreamParser` when the body of a part is complete."""
+
+
+class MultipartStreamParser:
+    """Incremental ``multipart/form-data`` parser.
+
+    `feed` accepts the request body in arbitrary pieces and returns `PartStart`,
+    ``bytes`` and `PartEnd` events. At most one delimiter length of data is held
+    back between calls, so memory use does not depend on the size of the parts.
+    """
+
+    def __init__(self, boundary: str) -> None:
+        self._first = b'--' + boundary.encode('latin-1')
+        self._delimiter = b'\r\n' + self._first
+        self._buffer = b''
+        self._state = 'preamble'
+
+    @property
+    def complete(self) -> bool:
+        return self._state == 'done'
+
+    def feed(self, data: bytes) -> list[PartStart | PartEnd | bytes]:
+        self._buffer += data
+        events: list[PartStart | PartEnd | bytes] = []
+        while True:
+            if self._state == 'preamble':
+                index = self._buffer.find(self._first)
+                if index < 0:
+                    self._buffer = self._buffer[-len(self._first):]
+                    return events
+                self._buffer = self._buffer[index + len(self._first):]
+                self._state = 'boundary'
+            elif self._state == 'boundary':
+                if len(self._buffer) < 2:
+                    return events
+                if self._buffer.startswith(b'--'):
+                    self._state = 'done'
+                    self._buffer = b''
+                    return events
+                if not self._buffer.startswith(b'\r\n'):
+                    raise ClientException(detail='Malformed multipart body')
+                self._buffer = self._buffer[2:]
+                self._state = 'headers'
+            elif self._state == 'headers':
+                index = self._buffer.find(b'\r\n\r\n')
+                if index < 0:
+                    if len(self._buffer) > _MAX_HEADER_SIZE:
+                        raise ClientException(detail='Multipart part headers too large')
+                    return events
+                events.append(self._parse_headers(self._buffer[:index]))
+                self._buffer = self._buffer[index + 4:]
+                self._state = 'body'
+            elif self._state == 'body':
+                index = self._buffer.find(self._delimiter)
+                if index < 0:
+                    # keep enough of the tail to recognise a delimiter split across two chunks
+                    keep = len(self._delimiter) - 1
+                    if len(self._buffer) > keep:
+                        events.append(self._buffer[:-keep])
+                        self._buffer = self._buffer[-keep:]
+                    return events
+                if index:
+                    events.append(self._buffer[:index])
+                events.append(PartEnd())
+                self._buffer = self._buffer[index + len(self._delimiter):]
+                self._state = 'boundary'
+            else:
+                return events
+
+    @staticmethod
+    def _parse_headers(raw: bytes) -> PartStart:
+        name = filename = None
+        for line in raw.decode('utf-8', errors='replace').split('\r\n'):
+            key, _, value = line.partition(':')
+            if key.strip().lower() != 'content-disposition':
+                continue
+            for option in value.split(';')[1:]:
+                option_key, _, option_value = option.strip().partition('=')
+                option_value = option_value.strip().strip('"')
+                if option_key.lower() == 'name':
+                    name = option_value
+                elif option_key.lower() == 'filename':
+                    filename = option_value
+        return PartStart(name=name, filename=filename)
+
+
+async def save_multipart_stream(stream: AsyncIterator[bytes], boundary: str,
+                                directory: str | None = None) -> list[StoredFile]:
+    """Parse a multipart request body as it arrives and save every file part.
+
+    Fields without a file name are skipped.
+    """
+    parser = MultipartStreamParser(boundary)
+    directory = directory or settings.upload_dir
+    stored: list[StoredFile] = []
+    writer: _AtomicWriter | None = None
+    try:
+        async for data in stream:
+            for event in parser.feed(data):
+                if isinstance(event, PartStart):
+                    if event.filename:
+                        writer = _AtomicWriter(event.filename, directory)
+                        await writer.open()
+                elif isinstance(event, PartEnd):
+                    if writer is not None:
+                        stored.append(await writer.commit())
+                        writer = None
+                elif writer is not None:
+                    await writer.write(event)
+        if not parser.complete:
+            raise ClientException(detail='Truncated multipart body')
+        return stored
+    except BaseException:
+        if writer is not None:
+            with anyio.CancelScope(shield=True):
+                await writer.abort()
+        raise